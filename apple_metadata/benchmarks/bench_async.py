@@ -0,0 +1,107 @@
+""" Benchmark: sequential processing vs the asyncio engine on a simulated high-latency mount
+
+Usage:
+    poetry run python benchmarks/bench_async.py [--files 500] [--latency-ms 5] [--concurrency 64]
+
+A local temporary tree is wrapped in a shim that sleeps for --latency-ms on every
+filesystem round-trip the code makes (scandir, open, fstat, pread), standing in for a
+WAN-mounted SMB share.  The same per-file work is then run sequentially and through
+aio.iter_results(), with a fixed concurrency and with the AIMD controller from
+adaptive.py (between 2 and --concurrency), and the throughput of each is reported.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from samba_labels.adaptive import AimdController
+from samba_labels.aio import iter_results
+from samba_labels.batch import process_file
+from samba_labels.corpus import write_appledouble_pair
+from samba_labels.scanner import scan_tree
+
+
+class DelayedFilesystem:
+    """ Adds a fixed delay to each os-level filesystem call, like a remote mount would """
+
+    CALLS = ("scandir", "open", "fstat", "pread", "stat")
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.originals = {}
+        self.calls = 0
+
+    def _wrap(self, fn):
+        def delayed(*args, **kwargs):
+            self.calls += 1
+            time.sleep(self.latency)  # releases the GIL, like waiting on the network
+            return fn(*args, **kwargs)
+        return delayed
+
+    def __enter__(self) -> "DelayedFilesystem":
+        for name in self.CALLS:
+            self.originals[name] = getattr(os, name)
+            setattr(os, name, self._wrap(self.originals[name]))
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for name, fn in self.originals.items():
+            setattr(os, name, fn)
+
+
+def run_sequential(root: str) -> int:
+    n = 0
+    for item in scan_tree(root):
+        process_file(item, "color")
+        n += 1
+    return n
+
+
+def run_concurrent(root: str, concurrency: int, controller=None) -> int:
+    async def drive():
+        return sum([1 async for _ in iter_results(root, "color", concurrency, controller=controller)])
+    return asyncio.run(drive())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--dirs", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        for d in range(opts.dirs):
+            os.mkdir(os.path.join(root, f"dir{d:03d}"))
+        for i in range(opts.files):
+            write_appledouble_pair(os.path.join(root, f"dir{i % opts.dirs:03d}"), f"img{i:05d}.jpg",
+                                   color=i % 8, fork_size=1024)
+
+        print(f"{opts.files} files in {opts.dirs} directories, {opts.latency_ms} ms per filesystem call")
+        print(f"{'engine':<28}{'seconds':>10}{'files/s':>10}{'fs calls':>10}")
+        baseline = None
+        controller = AimdController(minimum=2, maximum=opts.concurrency)
+        for name, fn in (("sequential", lambda: run_sequential(root)),
+                         (f"asyncio (concurrency {opts.concurrency})",
+                          lambda: run_concurrent(root, opts.concurrency)),
+                         (f"asyncio (adaptive 2..{opts.concurrency})",
+                          lambda: run_concurrent(root, opts.concurrency, controller))):
+            with DelayedFilesystem(opts.latency_ms / 1000) as fs:
+                start = time.perf_counter()
+                n = fn()
+                elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{name:<28}{elapsed:>10.2f}{n / elapsed:>10.0f}{fs.calls:>10}"
+                  f"   ({baseline / elapsed:.1f}x)")
+        print(f"adaptive levels: {' '.join(str(level.limit) for level in controller.history)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+""" Benchmark: Finder color via AppleDoubleMetadata (whole file) vs read_finder_color (header only)
+
+Usage:
+    poetry run python benchmarks/bench_finder_color.py [--files N] [--fork-sizes 0,1M,8M]
+
+For each resource fork size, writes N "._" files to a temporary directory and reports the
+mean bytes read and latency per file for both code paths.
+"""
+
+import argparse
+import builtins
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from samba_labels import processor
+from samba_labels.corpus import write_appledouble_pair
+from samba_labels.processor import AppleDoubleMetadata, read_finder_color
+
+
+class ByteCounter:
+    """ Counts bytes returned by os.pread and by reads on files opened with open() """
+
+    def __init__(self) -> None:
+        self.total = 0
+        self._pread = os.pread
+        self._open = builtins.open
+
+    def __enter__(self) -> "ByteCounter":
+        counter = self
+
+        def pread(fd, n, offset):
+            data = counter._pread(fd, n, offset)
+            counter.total += len(data)
+            return data
+
+        class CountingReader(io.BufferedReader):
+            def read(self, *args):
+                data = super().read(*args)
+                counter.total += len(data)
+                return data
+
+        def counting_open(file, mode="r", *args, **kwargs):
+            if mode == "rb":
+                return CountingReader(io.FileIO(file, "rb"))
+            return counter._open(file, mode, *args, **kwargs)
+
+        processor.os.pread = pread
+        processor.open = counting_open  # shadows the builtin inside processor only
+        return self
+
+    def __exit__(self, *exc) -> None:
+        processor.os.pread = self._pread
+        del processor.open
+
+
+def parse_size(text: str) -> int:
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if text and text[-1].upper() in units:
+        return int(text[:-1]) * units[text[-1].upper()]
+    return int(text)
+
+
+def measure(fn, paths):
+    with ByteCounter() as counter:
+        start = time.perf_counter()
+        for p in paths:
+            fn(p)
+        elapsed = time.perf_counter() - start
+    return counter.total / len(paths), elapsed / len(paths)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--fork-sizes", default="0,64K,1M,8M")
+    opts = parser.parse_args()
+
+    full = lambda p: AppleDoubleMetadata(p).color
+    fast = read_finder_color
+
+    print(f"{'fork size':>10}  {'path':<20}{'bytes/file':>12}{'us/file':>10}")
+    for size in [parse_size(s) for s in opts.fork_sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [write_appledouble_pair(tmp, f"img{i:05d}.jpg", color=i % 8, fork_size=size)
+                     for i in range(opts.files)]
+            for name, fn in (("AppleDoubleMetadata", full), ("read_finder_color", fast)):
+                fn(paths[0])  # warm up
+                nbytes, latency = measure(fn, paths)
+                print(f"{size:>10}  {name:<20}{nbytes:>12.0f}{latency * 1e6:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
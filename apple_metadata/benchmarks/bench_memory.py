@@ -0,0 +1,72 @@
+""" Benchmark: memory and GC cost of holding parsed metadata for a whole share
+
+Usage:
+    poetry run python benchmarks/bench_memory.py [--records 1000000] [--metadata 100000]
+
+Measures, with tracemalloc, the memory held by --records AppleDoubleRecord tuples and by
+--metadata full AppleDoubleMetadata objects (parsed from in-memory "._" files), along
+with the time a full gc.collect() takes while they are alive.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from samba_labels.parser import ENTRY
+from samba_labels.corpus import FINDER_INFO, RESOURCE_FORK, appledouble_bytes
+from samba_labels.processor import AppleDoubleMetadata, appledouble_path
+
+
+def measure(label: str, count: int, build) -> None:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    items = [build(i) for i in range(count)]
+    build_time = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    gc.collect()
+    gc_time = time.perf_counter() - start
+
+    print(f"{label:<22}{count:>10}{current / 2**20:>12.1f}{current / count:>12.0f}"
+          f"{build_time:>10.2f}{gc_time * 1000:>10.1f}")
+    del items
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--metadata", type=int, default=100_000)
+    opts = parser.parse_args()
+
+    template = AppleDoubleMetadata.from_bytes(appledouble_bytes(1, resource_fork=bytes(286)))
+    paths = [f"/mnt/share/photos/{i // 1000:04d}/IMG_{i:07d}.JPG" for i in range(max(opts.records, opts.metadata))]
+
+    def record(i):
+        # what read_record() returns for a typical file: its own sidecar path and entry
+        # table (resource forks differ in size), not objects shared with other records
+        table = ENTRY.pack(FINDER_INFO, 50, 32) + ENTRY.pack(RESOURCE_FORK, 82, 286 + i % 4096)
+        return template.record()._replace(filepath=paths[i], appledoublepath=appledouble_path(paths[i]),
+                                          table=table, flags=(i % 8) << 1)
+
+    def metadata(i):
+        md = AppleDoubleMetadata.from_bytes(appledouble_bytes(i % 8, resource_fork=bytes(286)), filepath=paths[i])
+        md.color  # decode finder_info, as a color-only scan would
+        return md
+
+    print(f"{'type':<22}{'count':>10}{'MiB':>12}{'B/item':>12}{'build s':>10}{'gc ms':>10}")
+    measure("AppleDoubleRecord", opts.records, record)
+    if opts.metadata:
+        measure("AppleDoubleMetadata", opts.metadata, metadata)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+""" Benchmark: struct/memoryview parser vs the kaitai parser and full AppleDoubleMetadata objects
+
+Usage:
+    poetry run python benchmarks/bench_parsers.py [--files N] [--corpus DIR] [--repeat 3]
+
+Loads every "._" file of a synthetic corpus (or of --corpus DIR) into memory, checks that
+samba_labels.parser gives byte-identical header, entry table, entry bodies and finder_info
+fields to the generated kaitai parser, then times parsing all of them with each:
+
+  * kaitai:    AppleSingleDouble, reading every entry body and the FinderInfo
+  * metadata:  AppleDoubleMetadata.from_bytes() and its color (decodes finder_info only)
+  * parser:    parser.parse() plus the finder_info and file_dates_info entries
+
+Files the kaitai parser rejects (truncated etc.) must be rejected by parser.py too.
+"""
+
+import argparse
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from kaitaistruct import KaitaiStream
+
+from samba_labels import parser
+from samba_labels.apple_single_double import AppleSingleDouble
+from samba_labels.corpus import generate_corpus
+from samba_labels.processor import AppleDoubleMetadata
+
+
+def kaitai_parse(data: bytes) -> AppleSingleDouble:
+    ad = AppleSingleDouble(KaitaiStream(io.BytesIO(data)))
+    ad._read()
+    for e in ad.entries:
+        e.body
+    return ad
+
+
+def kaitai_view(data: bytes):
+    """ What the kaitai parser sees, in plain types comparable with parser.py's results """
+    ad = kaitai_parse(data)
+    entries, bodies, finfo = [], [], None
+    for e in ad.entries:
+        entries.append((int(e.type), e.ofs_body, e.len_body))
+        if e.type == AppleSingleDouble.Entry.Types.finder_info:
+            bodies.append(e._raw__m_body)
+            b = e.body
+            finfo = (b.file_type, b.file_creator, b.flags, b.location.x, b.location.y, b.folder_id)
+        else:
+            bodies.append(e.body)
+    return int(ad.magic), ad.version, ad.reserved, entries, bodies, finfo
+
+
+def parser_view(data: bytes):
+    f = parser.parse(data)
+    entries = [tuple(e) for e in f.entries]
+    bodies = [bytes(f.body(e)) for e in f.entries]
+    fi = f.finder_info
+    finfo = None
+    if fi is not None:
+        # kaitai reads the location as two unsigned 16-bit values
+        finfo = (fi.file_type, fi.creator, fi.flags, fi.location[0] & 0xFFFF,
+                 fi.location[1] & 0xFFFF, fi.folder_id)
+    return int.from_bytes(f.header.magic, "big"), f.header.version, f.header.filler, entries, bodies, finfo
+
+
+def outcome(fn, data):
+    try:
+        return fn(data)
+    except Exception as e:
+        return type(e).__name__
+
+
+def verify(blobs) -> int:
+    """ Number of files where the two parsers disagree (or only one of them fails) """
+    mismatches = 0
+    for path, data in blobs:
+        k, p = outcome(kaitai_view, data), outcome(parser_view, data)
+        if isinstance(k, str) or isinstance(p, str):
+            if isinstance(k, str) != isinstance(p, str):
+                print(f"MISMATCH {path}: kaitai={k if isinstance(k, str) else 'ok'} "
+                      f"parser={p if isinstance(p, str) else 'ok'}")
+                mismatches += 1
+        elif k != p:
+            print(f"MISMATCH {path}")
+            mismatches += 1
+    return mismatches
+
+
+def run_kaitai(blobs):
+    for _, data in blobs:
+        kaitai_parse(data)
+
+
+def run_metadata(blobs):
+    for path, data in blobs:
+        AppleDoubleMetadata.from_bytes(data, appledoublepath=path).color
+
+
+def run_parser(blobs):
+    for path, data in blobs:
+        f = parser.parse(data, path)
+        f.finder_info
+        f.file_dates
+
+
+def main() -> int:
+    argp = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument("--files", type=int, default=5000)
+    argp.add_argument("--corpus", help="existing tree to use instead of generating one")
+    argp.add_argument("--repeat", type=int, default=3)
+    opts = argp.parse_args()
+    # The corpus has files with bad magic numbers on purpose
+    logging.getLogger("samba_labels.processor").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = opts.corpus
+        if root is None:
+            root = tmp
+            # No multi-megabyte forks: this measures parsing, not reading files
+            print(generate_corpus(root, files=opts.files, dirs=20, large_fork_fraction=0,
+                                  malformed_fraction=0.02, all_types_fraction=0.1))
+        blobs = []
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                if name.startswith("._"):
+                    with open(os.path.join(dirpath, name), "rb") as f:
+                        blobs.append((os.path.join(dirpath, name), f.read()))
+
+    bad = verify(blobs)
+    print(f"Compared {len(blobs)} files with the kaitai parser: {bad} mismatches")
+
+    # Time only files all three can parse
+    good = [(p, d) for p, d in blobs if not isinstance(outcome(parser_view, d), str)]
+    print(f"{'parser':<10}{'files':>8}{'files/s':>12}{'us/file':>10}")
+    for name, fn in (("kaitai", run_kaitai), ("metadata", run_metadata), ("parser", run_parser)):
+        best = min(_timed(fn, good) for _ in range(opts.repeat))
+        print(f"{name:<10}{len(good):>8}{len(good) / best:>12.0f}{best / len(good) * 1e6:>10.1f}")
+    return 1 if bad else 0
+
+
+def _timed(fn, blobs) -> float:
+    start = time.perf_counter()
+    fn(blobs)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+""" Benchmark: interpreter startup and import cost of the command-line entry points
+
+Usage:
+    poetry run python benchmarks/bench_startup.py [--runs 20] [--top 10]
+
+Runs `python -X importtime` for
+  * eager:  the old console-script start, importing cli with everything it used to
+            import at load time (xattr, kaitaistruct, tribool, processor, exiftooling)
+  * lazy:   `samba-labels print_finder_color FILE` through samba_labels.__main__
+  * batch:  `samba-labels print_finder_color` over the same files in one process
+and reports the median wall time per invocation and per file, the total self import time,
+and the most expensive imports of the first run of each.
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+from samba_labels.corpus import write_appledouble_pair
+
+FILES = 20
+
+EAGER = ("import xattr, kaitaistruct, tribool; "
+         "import samba_labels.cli, samba_labels.processor, samba_labels.exiftooling; "
+         "from samba_labels.__main__ import main; sys.exit(main(sys.argv))")
+
+IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """ module -> (self µs, cumulative µs) from -X importtime output """
+    times = {}
+    for m in IMPORTTIME.finditer(stderr):
+        times[m.group(4)] = (int(m.group(1)), int(m.group(2)))
+    return times
+
+
+def run(label: str, argv: List[str], runs: int, nfiles: int, top: int) -> None:
+    env = dict(os.environ, PYTHONPATH=SRC)
+    walls = []
+    first = {}
+    for i in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime"] + argv, env=env,
+                              capture_output=True, text=True)
+        walls.append(time.perf_counter() - start)
+        if proc.returncode:
+            sys.exit(f"{label} failed:\n{proc.stderr[-2000:]}")
+        if i == 0:
+            first = parse_importtime(proc.stderr)
+
+    wall = statistics.median(walls)
+    self_total = sum(s for s, _ in first.values())
+    print(f"{label:<8}{wall * 1000:>10.1f} ms/run{wall * 1000 / nfiles:>10.2f} ms/file"
+          f"{self_total / 1000:>10.1f} ms imports ({len(first)} modules)")
+    for name, (self_us, cum_us) in sorted(first.items(), key=lambda kv: -kv[1][0])[:top]:
+        print(f"        {name:<40}{self_us:>8} µs self{cum_us:>10} µs cumulative")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=20)
+    ap.add_argument("--top", type=int, default=10, help="imports to list per variant")
+    opts = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [write_appledouble_pair(tmp, f"f{i}.jpg", color=i % 7 + 1) for i in range(FILES)]
+        run("eager", ["-c", "import sys; " + EAGER, "print_finder_color", paths[0]],
+            opts.runs, 1, opts.top)
+        run("lazy", ["-m", "samba_labels", "print_finder_color", paths[0]], opts.runs, 1, opts.top)
+        run("batch", ["-m", "samba_labels", "print_finder_color"] + paths, opts.runs, FILES, opts.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
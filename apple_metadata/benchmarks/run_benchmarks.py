@@ -0,0 +1,169 @@
+""" Benchmark suite: parsing, color extraction, xattr and sidecar writes, entry extraction
+
+Usage:
+    poetry run python benchmarks/run_benchmarks.py [--files 5000] [--corpus DIR] [--json out.json]
+
+Generates a synthetic corpus (see samba_labels.corpus) unless --corpus points at an
+existing tree, then runs each benchmark in a fresh process and reports files/sec and
+that process's peak RSS.  Benchmarks that can't run here (e.g. no user xattr support
+on the temporary filesystem) are reported as skipped.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from samba_labels.corpus import generate_corpus
+from samba_labels.scanner import scan_tree
+
+
+def bench_parse_metadata(items):
+    from samba_labels.processor import AppleDoubleMetadata
+    for item in items:
+        md = AppleDoubleMetadata(item.filepath, appledoublepath=item.appledoublepath)
+        for e in md.entries.values():
+            e["obj"].decode()
+
+
+def bench_parse_kaitai(items):
+    from samba_labels.apple_single_double import AppleSingleDouble
+    for item in items:
+        with open(item.appledoublepath, "rb") as f:
+            ad = AppleSingleDouble.from_bytes(f.read())
+        ad._read()
+        for e in ad.entries:
+            e.body
+
+
+def bench_parse_struct(items):
+    from samba_labels import parser
+    for item in items:
+        with open(item.appledoublepath, "rb") as f:
+            parsed = parser.parse(f.read(), item.appledoublepath)
+        parsed.finder_info
+        parsed.file_dates
+
+
+def bench_color_metadata(items):
+    from samba_labels.processor import AppleDoubleMetadata
+    for item in items:
+        AppleDoubleMetadata(item.filepath, appledoublepath=item.appledoublepath).color
+
+
+def bench_color_fast(items):
+    from samba_labels.processor import read_finder_color
+    for item in items:
+        read_finder_color(item.filepath, item.appledoublepath)
+
+
+def bench_user_tags(items):
+    from samba_labels.processor import read_user_tags
+    for item in items:
+        read_user_tags(item.appledoublepath)
+
+
+def bench_xattr_write(items):
+    import xattr
+    for item in items:
+        xattr.setxattr(item.filepath, "user.color", b"Red")
+
+
+def bench_sidecar_native(items):
+    from samba_labels.xmp_sidecar import write_color_label
+    for i, item in enumerate(items):
+        write_color_label(item.filepath + ".xmp", 1 + i % 9)
+
+
+def bench_extract(items):
+    import logging
+    from samba_labels.extract import DEFAULT_TYPES, extract_file
+    logging.getLogger("samba_labels.processor").setLevel(logging.ERROR)  # malformed corpus files
+    with tempfile.TemporaryDirectory(dir=os.environ.get("BENCH_TMPDIR")) as out:
+        for item in items:
+            extract_file(item, os.path.dirname(item.filepath), out, DEFAULT_TYPES + ("data_fork",))
+
+
+BENCHMARKS = {
+    "parse AppleDoubleMetadata": bench_parse_metadata,
+    "parse kaitai AppleSingleDouble": bench_parse_kaitai,
+    "parse parser.parse": bench_parse_struct,
+    "color AppleDoubleMetadata": bench_color_metadata,
+    "color read_finder_color": bench_color_fast,
+    "tags read_user_tags": bench_user_tags,
+    "xattr write": bench_xattr_write,
+    "sidecar write (native XMP)": bench_sidecar_native,
+    "extract entries (copy_file_range)": bench_extract,
+}
+
+
+def run_one(name: str, root: str):
+    """ Runs in a fresh process so ru_maxrss belongs to this benchmark alone """
+    items = [i for i in scan_tree(root) if i.appledoublepath]
+    fn = BENCHMARKS[name]
+    # Malformed files raise; time only the files each benchmark can handle
+    good = []
+    errors = 0
+    for item in items:
+        try:
+            fn([item])
+            good.append(item)
+        except OSError as e:
+            return {"name": name, "skipped": f"{type(e).__name__}: {e}"}
+        except Exception:
+            errors += 1
+    start = time.perf_counter()
+    fn(good)
+    elapsed = time.perf_counter() - start
+    maxrss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+    return {"name": name, "files": len(good), "errors": errors, "seconds": elapsed,
+            "files_per_sec": len(good) / elapsed if elapsed else 0.0, "peak_rss_mib": maxrss_kb / 1024}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--dirs", type=int, default=50)
+    parser.add_argument("--corpus", help="existing tree to use instead of generating one")
+    parser.add_argument("--only", help="comma-separated substrings selecting benchmarks")
+    parser.add_argument("--json", metavar="PATH", help="also write results as JSON")
+    opts = parser.parse_args()
+
+    names = list(BENCHMARKS)
+    if opts.only:
+        names = [n for n in names if any(s in n for s in opts.only.split(","))]
+
+    with tempfile.TemporaryDirectory(dir=os.environ.get("BENCH_TMPDIR")) as tmp:
+        root = opts.corpus
+        if root is None:
+            root = tmp
+            print(generate_corpus(root, files=opts.files, dirs=opts.dirs))
+
+        results = []
+        print(f"{'benchmark':<34}{'files':>8}{'errors':>8}{'files/s':>12}{'peak RSS MiB':>14}")
+        ctx = multiprocessing.get_context("spawn")
+        for name in names:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as ex:
+                r = ex.submit(run_one, name, root).result()
+            results.append(r)
+            if "skipped" in r:
+                print(f"{name:<34}  skipped ({r['skipped']})")
+            else:
+                print(f"{name:<34}{r['files']:>8}{r['errors']:>8}{r['files_per_sec']:>12.0f}"
+                      f"{r['peak_rss_mib']:>14.1f}")
+
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+""" The `samba-labels <command> [args...]` entry point, also run by `python -m samba_labels`
+
+Commands are looked up by name and their modules imported only when chosen, so
+`samba-labels print_finder_color` doesn't import exiftool support, numpy or the
+batch engine.  The per-file commands take any number of paths, or read them from
+stdin (one per line, or NUL-separated with -0, as from `find -print0`), so a whole
+list of files is handled by one process instead of one process per file:
+
+    find /mnt/share -name '*.jpg' -print0 | samba-labels set_color_xattr -0
+"""
+
+import importlib
+import sys
+from typing import Callable, Iterator, List, TextIO
+
+
+# Command name -> "module:function"; each function takes an argv list like a console script
+COMMANDS = {
+    "dump_file": "samba_labels.cli:dump_file",
+    "print_finder_color": "samba_labels.cli:print_finder_color",
+    "print_xattrs": "samba_labels.cli:print_xattrs",
+    "set_color_xattr": "samba_labels.cli:set_color_xattr",
+    "set_color_sidecar": "samba_labels.cli:set_color_sidecar",
+    "batch": "samba_labels.cli:batch",
+    "sync_xattrs": "samba_labels.cli:sync_xattrs",
+    "flag_summary": "samba_labels.cli:flag_summary",
+    "inventory": "samba_labels.cli:inventory",
+    "writeback": "samba_labels.cli:writeback",
+    "watch": "samba_labels.cli:watch",
+    "extract": "samba_labels.cli:extract",
+    "plan": "samba_labels.cli:plan",
+    "merge": "samba_labels.cli:merge",
+}
+
+# Commands that take exactly one file; main() runs them once per path
+PER_FILE = ("dump_file", "print_finder_color", "print_xattrs", "set_color_xattr", "set_color_sidecar")
+
+
+def load_command(name: str) -> Callable[[List[str]], int]:
+    """ Import and return the function behind a command name """
+    module, func = COMMANDS[name].split(":")
+    command: Callable[[List[str]], int] = getattr(importlib.import_module(module), func)
+    return command
+
+
+def iter_stdin_paths(stream: TextIO, null: bool = False) -> Iterator[str]:
+    """ Paths from stream, one per line, or NUL-separated if null is set.  Read in
+        blocks, so a long list is processed while it is still being produced. """
+    sep = "\0" if null else "\n"
+    pending = ""
+    while True:
+        block = stream.read(65536)
+        if not block:
+            break
+        pending += block
+        *paths, pending = pending.split(sep)
+        yield from (p for p in paths if p)
+    if pending.strip(sep):
+        yield pending.rstrip("\n")
+
+
+def run_per_file(name: str, args: List[str], stdin: TextIO = sys.stdin) -> int:
+    """ Run a single-file command for each path in args; "-" (or no paths at all) reads
+        paths from stdin, "-0" makes that NUL-separated.  A failing path is reported on
+        stderr and the rest still run; returns 1 if any failed. """
+    null = "-0" in args
+    paths = [a for a in args if a != "-0"]
+    if null or not paths or paths == ["-"]:
+        if stdin.isatty():
+            print(f"Usage: samba-labels {name} PATH [PATH...]  (or paths on stdin, -0 for NUL-separated)",
+                  file=sys.stderr)
+            return 2
+        sources: Iterator[str] = iter_stdin_paths(stdin, null)
+    else:
+        sources = iter(paths)
+
+    func = load_command(name)
+    status = 0
+    for path in sources:
+        try:
+            if func([name, path]):
+                status = 1
+        except Exception as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            status = 1
+    return status
+
+
+def main(argv: List[str] = sys.argv) -> int:
+    if len(argv) < 2 or argv[1] not in COMMANDS:
+        print(f"Usage: samba-labels {{{','.join(COMMANDS)}}} [args...]", file=sys.stderr)
+        return 2
+    name = argv[1]
+    if name in PER_FILE:
+        return run_per_file(name, argv[2:])
+    # Each command expects its own name in argv[0], like a console script
+    return load_command(name)(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+""" Adaptive concurrency: AIMD on observed per-operation latency and error rate """
+
+# A fixed number of operations in flight is either too few on a fast LAN or enough to
+# swamp a small NAS over a slow link.  AimdController picks the level as it goes, the
+# way TCP picks its congestion window:
+#
+#   - completions are collected in windows of about `limit` operations (one "round trip"
+#     of the whole pipeline);
+#   - at the end of each window the median latency is compared with the best seen so far
+#     (the baseline, i.e. the latency of an unloaded server);
+#   - if latency stayed within `tolerance` times the baseline and few operations failed,
+#     the limit goes up by one (additive increase);
+#   - otherwise the server is queueing (or falling over), and the limit is cut by
+#     `decrease` (multiplicative decrease).
+#
+# The baseline creeps up slowly, so that a link which gets permanently slower (or a
+# cache which stops being warm) doesn't pin the limit at the minimum forever.
+#
+# Every change of level is kept in `history` (and logged), for the --json summary.
+
+import logging
+import statistics
+import time
+from typing import List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN = 2
+DEFAULT_MAX = 128
+DEFAULT_INITIAL = 8
+
+MIN_WINDOW = 8              # completions, however low the limit
+BASELINE_DRIFT = 0.01       # per window, fraction the baseline latency may rise by
+
+
+class Level(NamedTuple):
+    """ A concurrency level chosen by the controller, and what it was based on """
+    at: float               # seconds since the controller started
+    limit: int
+    latency_ms: float       # median of the window that led to it (0 for the initial level)
+    error_rate: float
+
+
+class AimdController:
+    """ Additive-increase/multiplicative-decrease limit on operations in flight """
+
+    def __init__(self, initial: int = DEFAULT_INITIAL, minimum: int = DEFAULT_MIN,
+                 maximum: int = DEFAULT_MAX, tolerance: float = 2.0, decrease: float = 0.75,
+                 max_error_rate: float = 0.05) -> None:
+        if not 1 <= minimum <= maximum:
+            raise ValueError(f"Concurrency bounds must satisfy 1 <= min <= max, not {minimum}..{maximum}")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(initial, minimum), maximum)
+        self.tolerance = tolerance
+        self.decrease = decrease
+        self.max_error_rate = max_error_rate
+        self.baseline: Optional[float] = None      # seconds
+        self._latencies: List[float] = []
+        self._errors = 0
+        self._start = time.monotonic()
+        self.history: List[Level] = [Level(0.0, self.limit, 0.0, 0.0)]
+
+    def record(self, latency: float, error: bool = False) -> None:
+        """ Note one completed operation, which took `latency` seconds """
+        self._latencies.append(latency)
+        self._errors += error
+        if len(self._latencies) >= max(self.limit, MIN_WINDOW):
+            self._adjust()
+
+    def _adjust(self) -> None:
+        latency = statistics.median(self._latencies)
+        error_rate = self._errors / len(self._latencies)
+        self._latencies = []
+        self._errors = 0
+
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline *= 1 + BASELINE_DRIFT
+
+        if error_rate > self.max_error_rate or latency > self.baseline * self.tolerance:
+            limit = max(self.minimum, int(self.limit * self.decrease))
+        else:
+            limit = min(self.maximum, self.limit + 1)
+        if limit != self.limit:
+            logger.info(f"Concurrency {self.limit} -> {limit} (median latency {latency * 1e3:.1f} ms, "
+                        f"baseline {self.baseline * 1e3:.1f} ms, errors {error_rate:.0%})")
+            self.limit = limit
+            self.history.append(Level(round(time.monotonic() - self._start, 3), limit,
+                                      round(latency * 1e3, 3), round(error_rate, 4)))
@@ -0,0 +1,162 @@
+""" asyncio engine for scanning and processing over high-latency (e.g. WAN-mounted SMB) shares """
+
+# On a slow mount almost all of the time per file is spent waiting on round-trips
+# (open, fstat, pread), not on the CPU.  Instead of worker processes, this engine keeps
+# many blocking calls in flight at once on a thread pool, driven from an event loop:
+# directories are listed in the executor as they are reached, per-file work is
+# submitted as soon as an item is known, and results are yielded in completion order.
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, List, Optional, Sequence, Tuple
+
+from samba_labels import metrics
+from samba_labels.adaptive import AimdController
+from samba_labels.batch import (ACTIONS, BatchSummary, FileResult, close_worker, init_worker, make_collector,
+                                process_file)
+from samba_labels.journal import Journal, RetryPolicy
+from samba_labels.manifest import ManifestEntry, ScanManifest
+from samba_labels.metrics import Metrics
+from samba_labels.scanner import DirectoryIndex, ScanItem, index_directory
+from samba_labels.sharding import Shard
+
+
+DEFAULT_CONCURRENCY = 64
+
+logger = logging.getLogger(__name__)
+
+
+def _index_directory(dirpath: str) -> Tuple[DirectoryIndex, List[str], Metrics]:
+    """ index_directory() on an executor thread, handing its metrics back to the loop """
+    with metrics.collecting() as m:
+        index, subdirs = index_directory(dirpath)
+    return index, subdirs, m
+
+
+async def scan_tree_async(root: str, extensions: Optional[Sequence[str]] = None,
+                          loop_executor: Optional[Executor] = None, applesingle: bool = False) -> AsyncIterator[ScanItem]:
+    """ scan_tree() with each directory listing run in an executor, so the loop keeps going """
+    loop = asyncio.get_running_loop()
+    stack: List[str] = [root]
+    while stack:
+        index, subdirs, m = await loop.run_in_executor(loop_executor, _index_directory, stack.pop())
+        metrics.current().merge(m)
+        for item in index.items(extensions, applesingle):
+            yield item
+        stack.extend(reversed(subdirs))
+
+
+async def iter_results(root: str, action: str = "color", concurrency: int = DEFAULT_CONCURRENCY,
+                       extensions: Optional[Sequence[str]] = None,
+                       manifest: Optional[ScanManifest] = None,
+                       worker: Callable[..., FileResult] = process_file,
+                       applesingle: bool = False,
+                       shard: Optional[Shard] = None,
+                       journal: Optional[Journal] = None,
+                       retry: Optional[RetryPolicy] = None,
+                       on_resumed: Optional[Callable[[ScanItem], None]] = None,
+                       controller: Optional[AimdController] = None) -> AsyncIterator[FileResult]:
+    """ Process every data file under root with up to `concurrency` blocking calls in flight,
+        yielding each FileResult as soon as it is ready (completion order, not tree order).
+        With a shard, only the files it owns are processed (see sharding.py).
+        With a journal, files it has as done are passed to on_resumed instead of being
+        processed; recording results in it is up to the caller (see make_collector).
+        With a controller, the number in flight is its current limit, adjusted from the
+        latency and outcome of each operation (see adaptive.py), instead of `concurrency`. """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action {action!r}, expected one of {ACTIONS}")
+    if retry is not None:
+        worker = functools.partial(worker, retry=retry)
+    loop = asyncio.get_running_loop()
+
+    def timed(item: ScanItem, action: str, known: Optional[ManifestEntry]) -> Tuple[FileResult, float]:
+        # timed on the executor thread, so that the latency the controller sees doesn't
+        # include however long the result then waited for the loop to pick it up
+        start = time.perf_counter()
+        result = worker(item, action, known)
+        return result, time.perf_counter() - start
+
+    def finished(fut: "asyncio.Future[Tuple[FileResult, float]]") -> FileResult:
+        result, latency = fut.result()
+        if controller is not None:
+            controller.record(latency, result.status == "error")
+        return result
+
+    with ThreadPoolExecutor(max_workers=controller.maximum if controller else concurrency) as executor:
+        pending = set()
+        async for item in scan_tree_async(root, extensions, executor, applesingle):
+            if shard is not None and not shard.owns(os.path.relpath(item.filepath, root)):
+                continue
+            if journal is not None and journal.is_done(item.filepath):
+                if on_resumed is not None:
+                    on_resumed(item)
+                continue
+            if item.appledoublepath is None:
+                yield worker(item, action)  # answered from the listing alone
+                continue
+            known = manifest.known(item.filepath, action) if manifest else None
+            pending.add(loop.run_in_executor(executor, timed, item, action, known))
+            # after a decrease, wait until enough have finished to be under the new limit
+            while len(pending) >= (controller.limit if controller else concurrency):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    yield finished(fut)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                yield finished(fut)
+
+
+def run_async(root: str, action: str = "color", concurrency: int = DEFAULT_CONCURRENCY,
+              extensions: Optional[Sequence[str]] = None,
+              manifest: Optional[ScanManifest] = None, log_level: int = logging.WARNING,
+              native_xmp: bool = False, applesingle: bool = False,
+              shard: Optional[Shard] = None, journal: Optional[Journal] = None,
+              retry: Optional[RetryPolicy] = None,
+              controller: Optional[AimdController] = None) -> BatchSummary:
+    """ Blocking wrapper around iter_results() returning the same summary as run_batch().
+        With a controller, the levels it chose end up in summary.concurrency. """
+    if not os.path.isdir(root):
+        raise NotADirectoryError(f"Not a directory: {root}")
+    # this process does the work, on its threads; exiftool is CPU-bound, so no more
+    # processes than there are CPUs however many operations are in flight
+    in_flight = controller.maximum if controller is not None else concurrency
+    init_worker(log_level, native_xmp, exiftool_processes=min(in_flight, os.cpu_count() or 1))
+    summary = BatchSummary()
+    summary.shard = str(shard) if shard else None
+    collect = make_collector(summary, manifest, action, journal)
+
+    def resumed(item: ScanItem) -> None:
+        summary.resumed += 1
+
+    async def drive() -> None:
+        async for result in iter_results(root, action, concurrency, extensions, manifest,
+                                         applesingle=applesingle, shard=shard, journal=journal,
+                                         retry=retry, on_resumed=resumed, controller=controller):
+            collect(result)
+
+    if controller is not None:
+        logger.info(f"Processing {root} with {controller.minimum} to {controller.maximum} concurrent "
+                    f"operations, starting at {controller.limit} (action={action})")
+    else:
+        logger.info(f"Processing {root} with {concurrency} concurrent operations (action={action})")
+    start = time.perf_counter()
+    with metrics.collecting() as loop_metrics:
+        try:
+            asyncio.run(drive())
+        finally:
+            close_worker()  # exiftool processes started for sidecar writes
+        if manifest is not None:
+            with metrics.stage("manifest"):
+                manifest.flush()
+        if journal is not None:
+            journal.checkpoint()
+    summary.metrics.merge(loop_metrics)
+    if controller is not None:
+        summary.concurrency = list(controller.history)
+    summary.elapsed = time.perf_counter() - start
+    return summary
@@ -0,0 +1,355 @@
+""" Batch processing of whole directory trees using a bounded pool of worker processes """
+
+# Rather than starting a fresh interpreter for every file (as the per-file entry points
+# in cli.py do when driven from a shell loop), the tree is walked once in the parent
+# process and each data file is handed to one of N long-lived worker processes.
+
+import os
+import time
+import functools
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import xattr  # see https://github.com/iustin/pyxattr
+
+from samba_labels import metrics
+from samba_labels.adaptive import Level
+from samba_labels.journal import Journal, RetryPolicy
+from samba_labels.metrics import Metrics
+from samba_labels.pooling import bounded_map
+from samba_labels.processor import (finder_color_from_flags, read_finder_flags_fd, AppleDoubleMetadata,
+                                    NotAppleSingle)
+from samba_labels.scanner import ScanItem, scan_tree
+from samba_labels.sharding import Shard, shard_items
+from samba_labels.manifest import FileState, ManifestEntry, ScanManifest
+from samba_labels.exiftooling import ExifToolPool, ExifToolTarget
+from samba_labels.utility import digikam_color_for_finder
+
+
+ACTIONS = ("color", "xattr", "sidecar")
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker waits for the others when the pool shuts down, see _close_worker()
+CLOSE_TIMEOUT = 30
+
+# Set in each worker process by init_worker()
+_worker_log_level: int = logging.WARNING
+_worker_native_xmp: bool = False
+_worker_exiftool_size: int = 1
+_worker_exiftool: Optional[ExifToolPool] = None
+_worker_exiftool_lock = threading.Lock()
+_worker_closing: Optional[threading.Barrier] = None
+
+
+def init_worker(log_level: int, native_xmp: bool = False,
+                closing: Optional[threading.Barrier] = None, exiftool_processes: int = 1) -> None:
+    """ Set up a process to run process_file(): in each worker process of run_batch(), or
+        once in a process that runs it on its own threads (see aio.py, watch.py), where
+        exiftool_processes should match the number of threads that may write sidecars """
+    global _worker_log_level, _worker_native_xmp, _worker_closing, _worker_exiftool_size
+    _worker_log_level = log_level
+    _worker_native_xmp = native_xmp
+    _worker_closing = closing
+    _worker_exiftool_size = max(1, exiftool_processes)
+
+
+def _exiftool_pool() -> ExifToolPool:
+    """ This process's persistent exiftool processes, started on first use """
+    global _worker_exiftool
+    with _worker_exiftool_lock:
+        if _worker_exiftool is None:
+            _worker_exiftool = ExifToolPool(_worker_exiftool_size, log_level=_worker_log_level)
+        return _worker_exiftool
+
+
+def close_worker() -> None:
+    """ Stop this process's exiftool processes, if it started any """
+    global _worker_exiftool
+    with _worker_exiftool_lock:
+        pool, _worker_exiftool = _worker_exiftool, None
+    if pool is not None:
+        pool.close()
+
+
+def _close_worker() -> None:
+    """ Shutdown task, one per worker process: worker processes exit without running
+        atexit handlers, so their exiftool processes are stopped explicitly.  Waiting on
+        the barrier keeps a worker from taking a second one of these tasks. """
+    close_worker()
+    if _worker_closing is not None:
+        try:
+            _worker_closing.wait(CLOSE_TIMEOUT)
+        except threading.BrokenBarrierError:
+            pass
+
+
+class FileResult(NamedTuple):
+    """ Outcome of processing one file, sent back from the worker """
+    path: str
+    status: str                     # one of BatchSummary.STATUSES
+    detail: str = ""                # color name, or error message
+    state: Optional[FileState] = None   # of the AppleDouble file, for the manifest
+    color: int = 0                  # Finder color value, 0 if unset
+    skipped: bool = False           # unchanged since the run recorded in the manifest
+    metrics: Optional[Metrics] = None   # stage timings etc. for this file
+    error_code: Optional[int] = None    # errno of the OSError behind an "error" status
+    attempts: int = 1               # more than 1 if transient errors were retried
+
+
+def process_file(item: ScanItem, action: str, known: Optional[ManifestEntry] = None,
+                 retry: Optional[RetryPolicy] = None) -> FileResult:
+    """ Worker function: read the Finder color for a scanned file and apply the requested action.
+        If known (from the manifest) still matches the AppleDouble file, nothing is read or written.
+        With a retry policy, transient OSErrors are retried after a pause (see journal.py).
+        The result carries the metrics recorded while processing it. """
+    start = time.perf_counter()
+    attempt = 1
+    with metrics.collecting() as m:
+        while True:
+            result = _process_file(item, action, known)
+            if retry is None or not retry.should_retry(result.error_code, attempt):
+                break
+            logger.info(f"{item.filepath}: {result.detail}, retrying (attempt {attempt + 1} of {retry.attempts})")
+            metrics.count("retries")
+            with metrics.stage("retry_wait"):
+                time.sleep(retry.wait(attempt))
+            attempt += 1
+        m.observe("file_latency_us", int((time.perf_counter() - start) * 1e6))
+        m.observe("file_bytes_read", m.counters.get("bytes_read", 0))
+    return result._replace(metrics=m, attempts=attempt)
+
+
+def _process_known(work: Tuple[ScanItem, Optional[ManifestEntry]], action: str,
+                   retry: Optional[RetryPolicy] = None) -> FileResult:
+    """ process_file() for a (scanned item, its manifest entry) pair, see run_batch() """
+    item, known = work
+    return process_file(item, action, known, retry)
+
+
+def _error(inpath: str, e: Exception, state: Optional[FileState] = None) -> FileResult:
+    return FileResult(inpath, "error", f"{type(e).__name__}: {e}", state, error_code=getattr(e, "errno", None))
+
+
+def _process_file(item: ScanItem, action: str, known: Optional[ManifestEntry]) -> FileResult:
+    inpath = item.filepath
+    if item.appledoublepath is None:
+        return FileResult(inpath, "no_appledouble")
+    try:
+        with metrics.stage("open"):
+            fd = os.open(item.appledoublepath, os.O_RDONLY)
+    except FileNotFoundError:
+        return FileResult(inpath, "no_appledouble")
+    except OSError as e:
+        return _error(inpath, e)
+    try:
+        with metrics.stage("stat"):
+            state = FileState.from_stat(os.fstat(fd))
+        if known is not None and known.state == state:
+            colorval = known.color
+            name = AppleDoubleMetadata.Entry.Colors(colorval).name if colorval else ""
+            return FileResult(inpath, "labeled" if colorval else "unlabeled", name, state, colorval, True)
+        # header-only read of the AppleDouble file, at the path found by the scanner
+        with metrics.stage("read"):
+            flags = read_finder_flags_fd(fd, item.appledoublepath, item.is_container)
+        finder_color = finder_color_from_flags(flags)
+    except NotAppleSingle:
+        return FileResult(inpath, "no_appledouble")
+    except Exception as e:
+        return _error(inpath, e)
+    finally:
+        os.close(fd)
+
+    if not finder_color:
+        return FileResult(inpath, "unlabeled", "", state)
+    color: str = finder_color.name
+
+    try:
+        if action == "xattr":
+            with metrics.stage("xattr"):
+                xattr.setxattr(inpath, "user.color", color.encode("utf-8"))
+        elif action == "sidecar":
+            with metrics.stage("sidecar"):
+                dk_colorval = digikam_color_for_finder(color)
+                exmd = ExifToolTarget(inpath, log_level=_worker_log_level, get_pool=_exiftool_pool,
+                                      native_xmp=_worker_native_xmp,
+                                      hassidecar=item.xmppath is not None, mdpath=item.xmppath)
+                exmd.write_field_value('XMP-digiKam:ColorLabel', dk_colorval)
+    except Exception as e:
+        return _error(inpath, e, state)
+    return FileResult(inpath, "labeled", color, state, int(finder_color))
+
+
+class BatchSummary:
+    """ Running totals for a batch run """
+
+    STATUSES = ("labeled", "unlabeled", "no_appledouble", "error")
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, int] = {s: 0 for s in self.STATUSES}
+        self.colors: Dict[str, int] = {}
+        self.errors: List[Tuple[str, str]] = []
+        self.skipped: int = 0
+        self.resumed: int = 0           # already done according to the journal, not processed
+        self.metrics: Metrics = Metrics()
+        self.elapsed: float = 0.0       # wall-clock seconds, set when the run finishes
+        self.shard: Optional[str] = None    # "i/n" for a run with --shard, see sharding.py
+        self.merged_shards: List[str] = []  # "i/n" of each shard combined by cli.merge
+        self.concurrency: List[Level] = []  # levels chosen with --adaptive, see adaptive.py
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, result: FileResult) -> None:
+        self.counts[result.status] += 1
+        self.skipped += result.skipped
+        self.metrics.merge(result.metrics)
+        if result.status == "labeled":
+            self.colors[result.detail] = self.colors.get(result.detail, 0) + 1
+        elif result.status == "error":
+            self.errors.append((result.path, result.detail))
+            logger.warning(f"{result.path}: {result.detail}")
+
+    def report(self) -> str:
+        lines = [f"Processed {self.total} files"]
+        for status in self.STATUSES:
+            lines.append(f"  {status:<16}{self.counts[status]:>10}")
+        if self.skipped:
+            lines.append(f"  {'(unchanged)':<16}{self.skipped:>10}")
+        if self.resumed:
+            lines.append(f"  {'(already done)':<16}{self.resumed:>10}")
+        if self.colors:
+            lines.append("Finder colors:")
+            for color, n in sorted(self.colors.items()):
+                lines.append(f"  {color:<16}{n:>10}")
+        if self.concurrency:
+            limits = [level.limit for level in self.concurrency]
+            lines.append(f"Concurrency {limits[0]} -> {limits[-1]} (range {min(limits)}..{max(limits)}, "
+                         f"{len(limits) - 1} changes)")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        """ Machine-readable summary, see cli.batch --json """
+        return {
+            "shard": self.shard,
+            "merged_shards": list(self.merged_shards),
+            "total": self.total,
+            "counts": dict(self.counts),
+            "skipped": self.skipped,
+            "resumed": self.resumed,
+            "colors": dict(sorted(self.colors.items())),
+            "errors": [{"path": p, "error": e} for p, e in self.errors],
+            "elapsed_seconds": round(self.elapsed, 6),
+            "files_per_second": round(self.total / self.elapsed, 1) if self.elapsed else None,
+            "metrics": self.metrics.to_dict(),
+            "concurrency": [level._asdict() for level in self.concurrency],
+        }
+
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "BatchSummary":
+        """ Inverse of to_dict() """
+        summary = cls()
+        summary.counts.update(d["counts"])
+        summary.skipped = d["skipped"]
+        summary.resumed = d.get("resumed", 0)
+        summary.colors = dict(d["colors"])
+        summary.errors = [(e["path"], e["error"]) for e in d["errors"]]
+        summary.elapsed = d["elapsed_seconds"]
+        summary.metrics = Metrics.from_dict(d["metrics"])
+        summary.shard = d.get("shard")
+        summary.merged_shards = list(d.get("merged_shards", []))
+        summary.concurrency = [Level(**level) for level in d.get("concurrency", [])]
+        return summary
+
+    def merge(self, other: "BatchSummary") -> None:
+        """ Add the totals of another run over a different part of the tree (e.g. another
+            shard).  Runs are assumed to have been in parallel: elapsed is the longest. """
+        for status, n in other.counts.items():
+            self.counts[status] += n
+        self.skipped += other.skipped
+        self.resumed += other.resumed
+        for color, n in other.colors.items():
+            self.colors[color] = self.colors.get(color, 0) + n
+        self.errors.extend(other.errors)
+        self.metrics.merge(other.metrics)
+        self.elapsed = max(self.elapsed, other.elapsed)
+
+
+def make_collector(summary: BatchSummary, manifest: Optional[ScanManifest], action: str,
+                   journal: Optional[Journal] = None) -> Callable[[FileResult], None]:
+    """ Callback that adds a FileResult to summary and, if there are any, to the manifest
+        and the journal """
+    def collect(result: FileResult) -> None:
+        summary.add(result)
+        if manifest is not None and not result.skipped and result.state is not None \
+                and result.status != "error":
+            manifest.record(result.path, result.state, result.color, action)
+        if journal is not None:
+            journal.record(result.path, result.status, result.detail if result.status == "error" else "")
+    return collect
+
+
+def run_batch(root: str, action: str = "color", jobs: Optional[int] = None,
+              extensions: Optional[Sequence[str]] = None,
+              log_level: int = logging.WARNING, native_xmp: bool = False,
+              manifest: Optional[ScanManifest] = None, applesingle: bool = False,
+              shard: Optional[Shard] = None, journal: Optional[Journal] = None,
+              retry: Optional[RetryPolicy] = None) -> BatchSummary:
+    """ Process every data file under root with at most `jobs` worker processes.
+        With native_xmp, sidecars are written in-process (see xmp_sidecar.py) where possible.
+        With applesingle, data files without a sidecar are checked for being AppleSingle files.
+        With a shard, only the files it owns are processed (see sharding.py).
+        With a manifest, files whose AppleDouble file is unchanged since the last run are
+        skipped, and the outcome for every other file is recorded in it.
+        With a journal, files it has as done are not processed again and every result is
+        appended to it; with a retry policy, transient errors are retried (see journal.py). """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action {action!r}, expected one of {ACTIONS}")
+    if not os.path.isdir(root):
+        raise NotADirectoryError(f"Not a directory: {root}")
+    jobs = jobs or os.cpu_count() or 1
+    summary = BatchSummary()
+    summary.shard = str(shard) if shard else None
+
+    collect = make_collector(summary, manifest, action, journal)
+
+    # Only sidecar writes start exiftool processes in the workers
+    ctx = multiprocessing.get_context()
+    closing = ctx.Barrier(jobs) if action == "sidecar" else None
+
+    logger.info(f"Processing {root} with {jobs} workers (action={action})")
+    start = time.perf_counter()
+    with metrics.collecting() as parent_metrics, \
+            ProcessPoolExecutor(max_workers=jobs, mp_context=ctx, initializer=init_worker,
+                                initargs=(log_level, native_xmp, closing)) as pool:
+        items = scan_tree(root, extensions, applesingle=applesingle)
+        if shard is not None:
+            items = shard_items(items, root, shard)
+
+        def work() -> Iterator[Tuple[ScanItem, Optional[ManifestEntry]]]:
+            for item in items:
+                if journal is not None and journal.is_done(item.filepath):
+                    summary.resumed += 1
+                    continue
+                known = manifest.known(item.filepath, action) if manifest and item.appledoublepath else None
+                yield item, known
+
+        # files without an AppleDouble file leave nothing for a worker to do
+        for result in bounded_map(pool, functools.partial(_process_known, action=action, retry=retry), work(),
+                                  jobs, inline=lambda w: w[0].appledoublepath is None):
+            collect(result)
+        if closing is not None:
+            wait([pool.submit(_close_worker) for _ in range(jobs)])
+        if manifest is not None:
+            with metrics.stage("manifest"):
+                manifest.flush()
+        if journal is not None:
+            journal.checkpoint()
+    summary.metrics.merge(parent_metrics)
+    summary.elapsed = time.perf_counter() - start
+    return summary
@@ -1,28 +1,33 @@
 """Main application entry point."""
 
+# Only the standard library is imported at load time.  xattr, kaitaistruct, tribool and
+# the processor/exiftool modules are imported inside the commands that use them, so
+# starting a command (often once per file, from a shell loop) doesn't pay for all of them.
+
 import sys
 import os
+import argparse
 import logging
-import xattr  # see https://github.com/iustin/pyxattr
+from typing import TYPE_CHECKING, List, Optional, TextIO
 
-from samba_labels import __version__
-from samba_labels.processor import AppleDoubleMetadata
-from samba_labels.exiftooling import ExifToolTarget
-from samba_labels.utility import finder_to_digikam_color, DigikamColors
+if TYPE_CHECKING:
+    from samba_labels.batch import BatchSummary, FileResult
+    from samba_labels.sharding import Shard
 
 
-def dump_file(args=sys.argv, loglev=logging.DEBUG) -> int:
+def dump_file(args: List[str] = sys.argv, loglev: int = logging.DEBUG) -> int:
     """ Dump contents of AppleDouble file """
     if len(args) != 2: 
         raise ValueError(f"Wrong number of arguments: {args}")
     inpath = args[1]
-    
+    from samba_labels.processor import AppleDoubleMetadata
+
     md = AppleDoubleMetadata(inpath, loglev)
-    print(md.dump())
+    md.dump()
     return 0
 
 
-def print_finder_color(args=sys.argv, loglev=logging.WARNING) -> int:
+def print_finder_color(args: List[str] = sys.argv, loglev: int = logging.WARNING) -> int:
     """ Print the decimal representation of the 3-bit Label flags """
     if len(args) != 2:
         raise ValueError(f"Wrong number of arguments: {args}")
@@ -32,19 +37,21 @@ def print_finder_color(args=sys.argv, loglev=logging.WARNING) -> int:
     return 0
 
 
-def get_finder_color(inpath, loglev=logging.WARNING) -> str:
+def get_finder_color(inpath: str, loglev: int = logging.WARNING) -> str:
     """ Get the Finder 'Label' color and return it as a string """
+    from samba_labels.processor import AppleDoubleMetadata
     md: AppleDoubleMetadata = AppleDoubleMetadata(inpath, loglev)
-    try:
-        return md.color.name
-    except:
+    color = md.color
+    if not isinstance(color, AppleDoubleMetadata.Entry.Colors):
         raise ValueError(f"Couldn't read Finder color flags in {inpath}")
+    return color.name
 
 
-def print_xattrs(args=sys.argv, loglev=logging.DEBUG) -> int:
+def print_xattrs(args: List[str] = sys.argv, loglev: int = logging.DEBUG) -> int:
     if len(args) != 2:
         raise ValueError(f"Wrong number of arguments: {args}")
     inpath: str = args[1]
+    import xattr  # see https://github.com/iustin/pyxattr
 
     xlist: list = xattr.listxattr(inpath)
     for xa in xlist:
@@ -52,25 +59,40 @@ def print_xattrs(args=sys.argv, loglev=logging.DEBUG) -> int:
     return 0
 
 
-def set_color_xattr(args=sys.argv, loglev=logging.DEBUG) -> int:
+def set_color_xattr(args: List[str] = sys.argv, loglev: int = logging.DEBUG) -> int:
     """ Sets the extended attribute user.color to the Finder label color from the AppleDouble metadata.
         Note that this depends on the underlying filesystem supporting extended attributes. """
     if len(args) != 2:
         raise ValueError(f"Wrong number of arguments: {args}")
     inpath: str = args[1]
+    import xattr
+    from samba_labels.processor import AppleDoubleMetadata
 
     aamd = AppleDoubleMetadata(inpath, loglev)
-    if aamd.color:
-        xattr.setxattr(inpath, "user.color", aamd.color.name)
+    color = aamd.color
+    if isinstance(color, AppleDoubleMetadata.Entry.Colors):
+        xattr.setxattr(inpath, "user.color", color.name)
     return 0
 
 
-def set_color_sidecar(args=sys.argv, loglev=logging.DEBUG) -> int:
+def _sidecar_has_label(mdpath: str, value: int) -> bool:
+    """ Whether the XMP sidecar at mdpath exists and already has ColorLabel = value """
+    from samba_labels import xmp_sidecar
+    try:
+        return xmp_sidecar.read_color_label(mdpath) == value
+    except (OSError, xmp_sidecar.XmpUnsupported):
+        return False
+
+
+def set_color_sidecar(args: List[str] = sys.argv, loglev: int = logging.DEBUG) -> int:
     """ Sets the 'XMP-digiKam' metadata attribute to the Finder label color from the AppleDouble metadata.
         This will create an XMP metadata sidecar file, populated from the file internal metadata using exiftool. """
     if len(args) != 2:
         raise ValueError(f"Wrong number of arguments: {args}")
     inpath: str = args[1]
+    from samba_labels.exiftooling import ExifToolTarget
+    from samba_labels.processor import AppleDoubleMetadata
+    from samba_labels.utility import digikam_color_for_finder
 
     try:
         aamd = AppleDoubleMetadata(inpath, loglev)
@@ -78,9 +100,454 @@ def set_color_sidecar(args=sys.argv, loglev=logging.DEBUG) -> int:
         print(e)
         return 1
     
-    if aamd.color:
-        dk_color = finder_to_digikam_color[aamd.color.name]  # get corresponding Digikam color for Finder color
-        dk_colorval = DigikamColors[dk_color]  # convert to appropriate integer (see utility.py)
+    color = aamd.color
+    if isinstance(color, AppleDoubleMetadata.Entry.Colors):
+        dk_colorval = digikam_color_for_finder(color.name)  # corresponding digiKam color (see utility.py)
+        if _sidecar_has_label(inpath + ".xmp", dk_colorval):
+            return 0  # already set; don't run exiftool or touch the sidecar's mtime
         exmd = ExifToolTarget(inpath, log_level=loglev)
         exmd.write_field_value('XMP-digiKam:ColorLabel', dk_colorval)
     return 0
+
+
+def _write_json(path: str, data: dict) -> None:
+    """ Write data as JSON to path, or to stdout if path is "-" """
+    import json
+    if path == "-":
+        print(json.dumps(data, indent=2))
+    else:
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+
+
+def _report_file(json_path: Optional[str]) -> TextIO:
+    """ Where to print the text report: stderr when the JSON goes to stdout, so that
+        `--json -` output can be piped straight into a JSON parser """
+    return sys.stderr if json_path == "-" else sys.stdout
+
+
+def _shard_arg(spec: str) -> "Shard":
+    from samba_labels.sharding import parse_shard
+    try:
+        return parse_shard(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def batch(args: List[str] = sys.argv, loglev: int = logging.WARNING) -> int:
+    """ Walk a whole directory tree once and process every file with a bounded pool of
+        worker processes, instead of starting one interpreter per file. """
+    from samba_labels.batch import ACTIONS, run_batch
+
+    parser = argparse.ArgumentParser(prog="batch", description=batch.__doc__)
+    parser.add_argument("root", help="top of the directory tree to process")
+    parser.add_argument("--action", choices=ACTIONS, default="color",
+                        help="color: only read labels; xattr: set user.color; sidecar: set XMP-digiKam:ColorLabel")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--ext", default="",
+                        help="comma-separated list of file extensions to include, e.g. jpg,mov")
+    parser.add_argument("--native-xmp", action="store_true",
+                        help="write XMP sidecars in-process, using exiftool only as a fallback")
+    parser.add_argument("--manifest", metavar="PATH",
+                        help="SQLite manifest of previous runs; files whose AppleDouble is unchanged are skipped")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the manifest's stored state and process every file again")
+    parser.add_argument("--applesingle", action="store_true",
+                        help="check data files without a sidecar for being AppleSingle files")
+    parser.add_argument("--shard", metavar="I/N", type=_shard_arg,
+                        help="only process shard I of N (by a hash of the path relative to root), "
+                             "to split one tree between N machines; combine the --json results with merge")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="append finished files to PATH; rerunning with the same journal resumes "
+                             "the job, skipping files already done and retrying the ones that failed")
+    parser.add_argument("--retries", type=int, default=0, metavar="N",
+                        help="retry a file up to N times after a transient I/O error (EIO, ETIMEDOUT, "
+                             "ESTALE, ...), with exponential backoff (default: 0)")
+    parser.add_argument("--retry-delay", type=float, default=0.5, metavar="SECONDS",
+                        help="pause before the first retry, doubled for each further one (default: 0.5)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="use the asyncio engine (threads, not processes) for high-latency mounts")
+    parser.add_argument("--concurrency", type=int, default=64,
+                        help="operations in flight with --async (default: 64)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="with --async, adjust the operations in flight to the latency and error "
+                             "rate the server shows, between --min-concurrency and --max-concurrency")
+    parser.add_argument("--min-concurrency", type=int, default=2, metavar="N",
+                        help="lower bound for --adaptive (default: 2)")
+    parser.add_argument("--max-concurrency", type=int, default=128, metavar="N",
+                        help="upper bound for --adaptive (default: 128)")
+    parser.add_argument("--json", metavar="PATH",
+                        help="write a JSON summary (counts, stage timings, histograms) to PATH, or - for stdout")
+    parser.add_argument("--stats", action="store_true",
+                        help="print per-stage timings, counters and histograms after the summary")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="run under cProfile and write the stats to PATH (covers worker processes "
+                             "only with --async, where all the work happens in this process)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    opts = parser.parse_args(args[1:])
+
+    if opts.verbose:
+        loglev = logging.DEBUG
+    logging.getLogger("samba_labels.batch").setLevel(loglev)
+    extensions = [e for e in opts.ext.split(",") if e] or None
+
+    controller = None
+    if opts.adaptive:
+        if not opts.use_async:
+            parser.error("--adaptive needs --async")
+        from samba_labels.adaptive import AimdController
+        try:
+            controller = AimdController(minimum=opts.min_concurrency, maximum=opts.max_concurrency)
+        except ValueError as e:
+            parser.error(str(e))
+        logging.getLogger("samba_labels.adaptive").setLevel(loglev)
+
+    retry = None
+    if opts.retries > 0:
+        from samba_labels.journal import RetryPolicy
+        retry = RetryPolicy(attempts=opts.retries + 1, delay=opts.retry_delay)
+
+    journal = None
+    if opts.journal:
+        from samba_labels.journal import Journal, JournalMismatch
+        try:
+            journal = Journal(opts.journal, opts.root, opts.action)
+        except JournalMismatch as e:
+            print(e, file=sys.stderr)
+            return 2
+        if journal.resumed:
+            print(f"Resuming from {opts.journal}: {len(journal.done)} files done, "
+                  f"{len(journal.failed)} to retry", file=_report_file(opts.json))
+
+    manifest = None
+    if opts.manifest:
+        from samba_labels.manifest import ScanManifest
+        manifest = ScanManifest(opts.manifest, full=opts.full)
+
+    def run() -> "BatchSummary":
+        if opts.use_async:
+            from samba_labels.aio import run_async
+            return run_async(opts.root, action=opts.action, concurrency=opts.concurrency,
+                             extensions=extensions, manifest=manifest, log_level=loglev,
+                             native_xmp=opts.native_xmp, applesingle=opts.applesingle,
+                             shard=opts.shard, journal=journal, retry=retry, controller=controller)
+        return run_batch(opts.root, action=opts.action, jobs=opts.jobs,
+                         extensions=extensions, log_level=loglev, native_xmp=opts.native_xmp,
+                         manifest=manifest, applesingle=opts.applesingle, shard=opts.shard,
+                         journal=journal, retry=retry)
+
+    try:
+        if opts.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            try:
+                summary = profiler.runcall(run)
+            finally:
+                profiler.dump_stats(opts.profile)
+        else:
+            summary = run()
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if journal is not None:
+            journal.close()
+
+    out = _report_file(opts.json)
+    print(summary.report(), file=out)
+    if opts.stats:
+        print(summary.metrics.report(), file=out)
+    if opts.json:
+        _write_json(opts.json, summary.to_dict())
+    return 1 if summary.counts["error"] else 0
+
+
+def sync_xattrs(args: List[str] = sys.argv, loglev: int = logging.WARNING) -> int:
+    """ Bring user.color of every file under a directory in line with its Finder label,
+        writing only where the value differs and removing it where the label was cleared. """
+    from samba_labels.xattr_sync import DEFAULT_JOBS, sync_tree
+
+    parser = argparse.ArgumentParser(prog="sync_xattrs", description=sync_xattrs.__doc__)
+    parser.add_argument("root", help="top of the directory tree to process")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"number of threads (default: {DEFAULT_JOBS})")
+    parser.add_argument("--ext", default="",
+                        help="comma-separated list of file extensions to include, e.g. jpg,mov")
+    parser.add_argument("--json", metavar="PATH", help="write the counts as JSON to PATH, or - for stdout")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    opts = parser.parse_args(args[1:])
+
+    if opts.verbose:
+        loglev = logging.DEBUG
+    logging.getLogger("samba_labels.xattr_sync").setLevel(loglev)
+    extensions = [e for e in opts.ext.split(",") if e] or None
+
+    summary = sync_tree(opts.root, jobs=opts.jobs, extensions=extensions)
+    print(summary.report(), file=_report_file(opts.json))
+    if opts.json:
+        _write_json(opts.json, summary.to_dict())
+    return 1 if summary.counts["error"] else 0
+
+
+def flag_summary(args: List[str] = sys.argv, loglev: int = logging.WARNING) -> int:
+    """ Count Finder colors and flag bits (invisible, alias, locked, ...) across a directory
+        tree, decoding all the flag words at once with numpy; optionally export them as CSV. """
+    parser = argparse.ArgumentParser(prog="flag_summary", description=flag_summary.__doc__)
+    parser.add_argument("root", help="top of the directory tree to process")
+    parser.add_argument("-j", "--jobs", type=int, default=16, help="number of reader threads (default: 16)")
+    parser.add_argument("--ext", default="",
+                        help="comma-separated list of file extensions to include, e.g. jpg,mov")
+    parser.add_argument("--csv", metavar="PATH", help="write one row per file to PATH, or - for stdout")
+    opts = parser.parse_args(args[1:])
+
+    try:
+        from samba_labels.flag_table import scan_flag_table
+    except ImportError as e:
+        print(e, file=sys.stderr)
+        return 1
+    extensions = [e for e in opts.ext.split(",") if e] or None
+    table = scan_flag_table(opts.root, extensions, opts.jobs)
+
+    if opts.csv == "-":
+        table.to_csv(sys.stdout)
+        return 0
+    if opts.csv:
+        with open(opts.csv, "w", newline="") as f:
+            table.to_csv(f)
+    print(f"{len(table)} files with AppleDouble metadata, {len(table.errors)} unreadable")
+    print("Finder colors:")
+    for color, n in table.color_counts().items():
+        print(f"  {color or '(none)':<16}{n:>10}")
+    print("Finder flags:")
+    for flag, n in table.flag_counts().items():
+        print(f"  {flag:<16}{n:>10}")
+    return 1 if table.errors else 0
+
+
+def inventory(args: List[str] = sys.argv, loglev: int = logging.ERROR) -> int:
+    """ Stream one record per file under a directory tree (entries, Finder type/creator,
+        color, dates) as JSON lines or CSV, in constant memory. """
+    from samba_labels.inventory import DEFAULT_JOBS, FORMATS, export_inventory
+
+    parser = argparse.ArgumentParser(prog="inventory", description=inventory.__doc__)
+    parser.add_argument("root", help="top of the directory tree to process")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("-o", "--output", metavar="PATH", default="-",
+                        help="file to write to (default: stdout)")
+    parser.add_argument("--ext", default="",
+                        help="comma-separated list of file extensions to include, e.g. jpg,mov")
+    parser.add_argument("--all", action="store_true",
+                        help="also list files that have no AppleDouble file")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"number of reader threads (default: {DEFAULT_JOBS})")
+    opts = parser.parse_args(args[1:])
+
+    # Unusual magic numbers etc. would otherwise log a warning per file into the output
+    logging.getLogger("samba_labels.processor").setLevel(loglev)
+    extensions = [e for e in opts.ext.split(",") if e] or None
+    if opts.output == "-":
+        export_inventory(opts.root, sys.stdout, opts.format, extensions, opts.jobs, opts.all)
+    else:
+        with open(opts.output, "w", newline="" if opts.format == "csv" else None,
+                  encoding="utf-8") as f:
+            n = export_inventory(opts.root, f, opts.format, extensions, opts.jobs, opts.all)
+        print(f"Wrote {n} records to {opts.output}", file=sys.stderr)
+    return 0
+
+
+def writeback(args: List[str] = sys.argv, loglev: int = logging.WARNING) -> int:
+    """ Write labels set on Linux (digiKam XMP ColorLabel, or user.color) back into the
+        AppleDouble files, so that Mac users see them in the Finder.  Only the 2 bytes of
+        Finder flags are rewritten; files without a "._" file get a minimal one. """
+    from samba_labels.writeback import DEFAULT_JOBS, SOURCES, writeback_tree
+
+    parser = argparse.ArgumentParser(prog="writeback", description=writeback.__doc__)
+    parser.add_argument("root", help="top of the directory tree to process")
+    parser.add_argument("--from", dest="source", choices=SOURCES, default="xmp",
+                        help="where the labels come from (default: xmp)")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"number of threads (default: {DEFAULT_JOBS})")
+    parser.add_argument("--ext", default="",
+                        help="comma-separated list of file extensions to include, e.g. jpg,mov")
+    parser.add_argument("--json", metavar="PATH", help="write the counts as JSON to PATH, or - for stdout")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    opts = parser.parse_args(args[1:])
+
+    if opts.verbose:
+        loglev = logging.DEBUG
+    logging.getLogger("samba_labels.writeback").setLevel(loglev)
+    extensions = [e for e in opts.ext.split(",") if e] or None
+
+    summary = writeback_tree(opts.root, opts.source, jobs=opts.jobs, extensions=extensions)
+    print(summary.report(), file=_report_file(opts.json))
+    if opts.json:
+        _write_json(opts.json, summary.to_dict())
+    return 1 if summary.counts["error"] else 0
+
+
+def watch(args: List[str] = sys.argv, loglev: int = logging.WARNING) -> int:
+    """ Keep running, and process each file again as soon as its AppleDouble file changes
+        (e.g. relabeled in the Finder), instead of rescanning the whole tree. """
+    from samba_labels.batch import ACTIONS
+    from samba_labels.watch import DEFAULT_DEBOUNCE, DEFAULT_INTERVAL, DEFAULT_JOBS, watch as run_watch
+
+    parser = argparse.ArgumentParser(prog="watch", description=watch.__doc__)
+    parser.add_argument("root", help="top of the directory tree to watch")
+    parser.add_argument("--action", choices=ACTIONS, default="xattr",
+                        help="color: only report labels; xattr: set user.color (default); "
+                             "sidecar: set XMP-digiKam:ColorLabel")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"number of worker threads (default: {DEFAULT_JOBS})")
+    parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE,
+                        help=f"seconds a sidecar must be unchanged before it is processed, and without lost "
+                             f"events before the whole tree is rescanned (default: {DEFAULT_DEBOUNCE})")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--poll", action="store_true", dest="polling", default=None,
+                      help="poll the tree instead of using inotify (default on SMB/NFS mounts)")
+    mode.add_argument("--inotify", action="store_false", dest="polling",
+                      help="use inotify even on a network filesystem")
+    parser.add_argument("--interval", type=float,
+                        help=f"seconds between passes when polling, not used with inotify "
+                             f"(default: {DEFAULT_INTERVAL:g})")
+    parser.add_argument("--native-xmp", action="store_true",
+                        help="write XMP sidecars in-process, using exiftool only as a fallback")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    opts = parser.parse_args(args[1:])
+    if opts.interval is not None and opts.polling is False:
+        parser.error("--interval only applies when polling, not with --inotify")
+
+    if opts.verbose:
+        loglev = logging.DEBUG
+    from samba_labels.utility import setup_logger
+    setup_logger("samba_labels.watch", min(loglev, logging.INFO))  # say which watcher is used
+    logging.getLogger("samba_labels.batch").setLevel(loglev)
+
+    def show(result: "FileResult") -> None:
+        print(f"{result.path}: {result.status} {result.detail}".rstrip(), flush=True)
+
+    interval = DEFAULT_INTERVAL if opts.interval is None else opts.interval
+    summary = run_watch(opts.root, opts.action, jobs=opts.jobs, debounce=opts.debounce,
+                        polling=opts.polling, interval=interval, log_level=loglev,
+                        native_xmp=opts.native_xmp, on_result=show)
+    print(summary.report())
+    return 1 if summary.counts["error"] else 0
+
+
+def extract(args: List[str] = sys.argv, loglev: int = logging.WARNING) -> int:
+    """ Copy resource forks, icons, comments and other entries out of AppleDouble files
+        into standalone files, for a single data file or a whole tree. """
+    from samba_labels.extract import DEFAULT_JOBS, DEFAULT_TYPES, extract_tree, is_type_name
+
+    parser = argparse.ArgumentParser(prog="extract", description=extract.__doc__)
+    parser.add_argument("root", help="data file, or top of the directory tree to process")
+    parser.add_argument("-o", "--outdir", required=True,
+                        help="where to write the entries, as OUTDIR/<relative path>.<entry type>")
+    parser.add_argument("--types", default=",".join(DEFAULT_TYPES),
+                        help=f"comma-separated entry types to extract (default: {','.join(DEFAULT_TYPES)})")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"number of threads (default: {DEFAULT_JOBS})")
+    parser.add_argument("--ext", default="",
+                        help="comma-separated list of file extensions to include, e.g. jpg,mov")
+    parser.add_argument("--json", metavar="PATH", help="write the counts as JSON to PATH, or - for stdout")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    opts = parser.parse_args(args[1:])
+
+    if opts.verbose:
+        loglev = logging.DEBUG
+    logging.getLogger("samba_labels.extract").setLevel(loglev)
+    extensions = [e for e in opts.ext.split(",") if e] or None
+    types = [t for t in opts.types.split(",") if t]
+    unknown = [t for t in types if not is_type_name(t)]
+    if unknown:
+        parser.error(f"unknown entry types: {', '.join(unknown)} "
+                     f"(expected AppleDouble entry names such as {DEFAULT_TYPES[0]}, or entry_N)")
+
+    summary = extract_tree(opts.root, opts.outdir, types, jobs=opts.jobs, extensions=extensions)
+    print(summary.report(), file=_report_file(opts.json))
+    if opts.json:
+        _write_json(opts.json, summary.to_dict())
+    return 1 if summary.counts["error"] else 0
+
+
+def plan(args: List[str] = sys.argv, loglev: int = logging.WARNING) -> int:
+    """ Compare the Finder labels under a directory with the current user.color xattrs and
+        XMP ColorLabels, list the writes needed, and make only those (none with --dry-run). """
+    from samba_labels.planner import DEFAULT_JOBS, TARGETS, apply_plan, plan_tree
+
+    parser = argparse.ArgumentParser(prog="plan", description=plan.__doc__)
+    parser.add_argument("root", help="top of the directory tree to process")
+    parser.add_argument("--targets", default=",".join(TARGETS),
+                        help=f"comma-separated list of {','.join(TARGETS)} (default: both)")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only print the planned changes")
+    parser.add_argument("--clear", action="store_true",
+                        help="remove user.color / reset ColorLabel to 0 where the Finder label was cleared")
+    parser.add_argument("--native-xmp", action="store_true",
+                        help="write XMP sidecars in-process, using exiftool only as a fallback")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"number of threads (default: {DEFAULT_JOBS})")
+    parser.add_argument("--ext", default="",
+                        help="comma-separated list of file extensions to include, e.g. jpg,mov")
+    parser.add_argument("--json", metavar="PATH", help="write the plan as JSON to PATH, or - for stdout")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    opts = parser.parse_args(args[1:])
+
+    if opts.verbose:
+        loglev = logging.DEBUG
+    logging.getLogger("samba_labels.planner").setLevel(loglev)
+    extensions = [e for e in opts.ext.split(",") if e] or None
+    targets = [t for t in opts.targets.split(",") if t]
+
+    the_plan = plan_tree(opts.root, targets, clear=opts.clear, jobs=opts.jobs, extensions=extensions)
+    out = _report_file(opts.json)
+    for change in the_plan.changes:
+        print(change, file=out)
+    print(the_plan.report(), file=out)
+    if opts.json:
+        _write_json(opts.json, the_plan.to_dict())
+    if opts.dry_run:
+        return 1 if the_plan.errors else 0
+
+    failed = apply_plan(the_plan, jobs=opts.jobs, native_xmp=opts.native_xmp, log_level=loglev)
+    print(f"Applied {len(the_plan.changes) - len(failed)} of {len(the_plan.changes)} changes", file=out)
+    return 1 if failed or the_plan.errors else 0
+
+
+def merge(args: List[str] = sys.argv, loglev: int = logging.WARNING) -> int:
+    """ Combine the JSON results of a batch run split with --shard into one report """
+    from samba_labels.batch import BatchSummary
+    from samba_labels.sharding import load_results, missing_shards, result_shards
+
+    parser = argparse.ArgumentParser(prog="merge", description=merge.__doc__)
+    parser.add_argument("results", nargs="+",
+                        help="JSON files written by batch --shard I/N --json PATH, or by an earlier merge")
+    parser.add_argument("--json", metavar="PATH", help="write the merged summary as JSON to PATH, or - for stdout")
+    parser.add_argument("--stats", action="store_true",
+                        help="print the merged per-stage timings, counters and histograms")
+    parser.add_argument("--allow-missing", action="store_true",
+                        help="don't fail if some shards of the run are missing")
+    opts = parser.parse_args(args[1:])
+
+    try:
+        results = load_results(opts.results)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Can't merge: {e}", file=sys.stderr)
+        return 2
+    summary = BatchSummary()
+    for result in results:
+        summary.merge(BatchSummary.from_dict(result))
+    shards = sorted(s for result in results for s in result_shards(result))
+    missing = missing_shards(results)
+    summary.merged_shards = [str(s) for s in shards]
+
+    out = _report_file(opts.json)
+    print(f"Merged {len(shards)} of {len(shards) + len(missing)} shards", file=out)
+    print(summary.report(), file=out)
+    if opts.stats:
+        print(summary.metrics.report(), file=out)
+    if opts.json:
+        _write_json(opts.json, summary.to_dict())
+    if missing:
+        print(f"Missing shards: {', '.join(str(s) for s in missing)}", file=sys.stderr)
+        if not opts.allow_missing:
+            return 1
+    return 1 if summary.counts["error"] else 0
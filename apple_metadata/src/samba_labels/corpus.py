@@ -0,0 +1,255 @@
+""" Synthetic AppleDouble files, for tests and benchmarks
+
+Can also be run to write a corpus to disk:
+
+    python -m samba_labels.corpus /tmp/corpus --files 10000 --dirs 100
+"""
+
+import argparse
+import os
+import plistlib
+import random
+import struct
+import sys
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+APPLEDOUBLE_MAGIC = b'\x00\x05\x16\x07'
+APPLESINGLE_MAGIC = b'\x00\x05\x16\x00'
+APPLEDOUBLE_VERSION = 0x00020000
+
+# Entry type IDs, as in AppleDoubleMetadata.Entry.Types
+DATA_FORK, RESOURCE_FORK, REAL_NAME, COMMENT, ICON_BW, ICON_COLOR, FILE_INFO, \
+    FILE_DATES_INFO, FINDER_INFO, MACINTOSH_FILE_INFO, PRODOS_FILE_INFO, MSDOS_FILE_INFO, \
+    AFP_SHORT_NAME, AFP_FILE_INFO, AFP_DIRECTORY_ID = range(1, 16)
+
+# Finder flag bits other than the 3 color bits, see utility.FinderFlags
+OTHER_FLAG_BITS = (0x0001, 0x0040, 0x0080, 0x0100, 0x0400, 0x0800, 0x1000, 0x2000, 0x4000, 0x8000)
+
+# Kinds of broken file the generator can write, see malformed_appledouble()
+MALFORMED_KINDS = ("truncated_header", "truncated_table", "entry_past_eof", "short_finder_info",
+                   "bad_magic", "no_entries")
+
+
+def build_appledouble(entries: Sequence[Tuple[int, bytes]], magic: bytes = APPLEDOUBLE_MAGIC,
+                      version: int = APPLEDOUBLE_VERSION, filler: bytes = b"Mac OS X        ") -> bytes:
+    """ Assemble an AppleDouble (or AppleSingle) file from (entry ID, body) pairs,
+        with bodies laid out in order straight after the entry table """
+    header = magic + struct.pack(">I", version) + filler[:16].ljust(16, b"\0") + struct.pack(">H", len(entries))
+    offset = len(header) + 12 * len(entries)
+    table = b""
+    for eid, body in entries:
+        table += struct.pack(">III", eid, offset, len(body))
+        offset += len(body)
+    return header + table + b"".join(body for _, body in entries)
+
+
+def finder_info(color: int = 0, other_flags: int = 0, file_type: bytes = b"JPEG",
+                creator: bytes = b"8BIM", location: Tuple[int, int] = (0, 0), folder: int = 0,
+                extended: bytes = bytes(16)) -> bytes:
+    """ 32-byte finder_info body: FInfo (type, creator, flags, location, folder) + FXInfo """
+    flags = (other_flags & ~0b1110) | ((color & 0b111) << 1)
+    return file_type + creator + struct.pack(">HhhH", flags, location[0], location[1], folder) + extended
+
+
+def attr_block(attrs: Sequence[Tuple[str, bytes]], entry_offset: int) -> bytes:
+    """ What Mac OS X appends to the 32 bytes of Finder info to store extended attributes:
+        2 bytes padding, the ATTR header, the attribute table (rows aligned to 4 bytes) and
+        the values.  Value offsets count from the start of the file, in which the finder_info
+        entry is at entry_offset. """
+    names = [name.encode("utf-8") + b"\0" for name, _ in attrs]
+    table_length = sum((11 + len(n) + 3) & ~3 for n in names)
+    data_start = entry_offset + 34 + 36 + table_length
+    data_length = sum(len(value) for _, value in attrs)
+    header = b"ATTR" + struct.pack(">IIII12sHH", 0, data_start + data_length,
+                                   data_start, data_length, bytes(12), 0, len(attrs))
+    table = b""
+    offset = data_start
+    for n, (_, value) in zip(names, attrs):
+        row = struct.pack(">IIHB", offset, len(value), 0, len(n)) + n
+        table += row.ljust((len(row) + 3) & ~3, b"\0")
+        offset += len(value)
+    return bytes(2) + header + table + b"".join(value for _, value in attrs)
+
+
+def user_tags_value(tags: Sequence[Tuple[str, int]]) -> bytes:
+    """ com.apple.metadata:_kMDItemUserTags value for (name, color) tags, color 0 for none """
+    return plistlib.dumps([f"{name}\n{color}" if color else name for name, color in tags],
+                          fmt=plistlib.FMT_BINARY)
+
+
+def appledouble_bytes(color: int = 0, resource_fork: bytes = b"", file_type: bytes = b"JPEG",
+                      creator: bytes = b"8BIM", magic: bytes = APPLEDOUBLE_MAGIC,
+                      attrs: Sequence[Tuple[str, bytes]] = ()) -> bytes:
+    """ Build a Mac OS X style "._" file: a 32-byte finder_info entry followed by a resource fork.
+        With attrs, (name, value) extended attributes are stored after the Finder info. """
+    finfo = finder_info(color, file_type=file_type, creator=creator)
+    if attrs:
+        finfo += attr_block(attrs, 26 + 2 * 12)    # after the header and a 2-entry table
+    return build_appledouble([(FINDER_INFO, finfo), (RESOURCE_FORK, resource_fork)], magic=magic)
+
+
+def write_appledouble_pair(directory: str, name: str, color: Optional[int] = 0, data: bytes = b"data",
+                           fork_size: int = 0, **kwargs: Any) -> str:
+    """ Create directory/name and its "._name" sidecar, with a resource fork of fork_size bytes.
+        If color is None no sidecar is written.  Returns the data file path. """
+    path = os.path.join(str(directory), name)
+    with open(path, "wb") as f:
+        f.write(data)
+    if color is not None:
+        kwargs.setdefault("resource_fork", os.urandom(fork_size))
+        with open(os.path.join(str(directory), "._" + name), "wb") as f:
+            f.write(appledouble_bytes(color, **kwargs))
+    return path
+
+
+def entry_body(eid: int, rng: random.Random, name: str = "file", fork_size: int = 0) -> bytes:
+    """ A plausible body for each of the 15 entry types """
+    if eid in (DATA_FORK, RESOURCE_FORK):
+        return rng.getrandbits(8 * fork_size).to_bytes(fork_size, "big") if fork_size else b""
+    if eid == REAL_NAME:
+        return name.encode("utf-8")
+    if eid == COMMENT:
+        return f"Spotlight comment for {name}".encode("utf-8")[:200]
+    if eid == ICON_BW:
+        return bytes(rng.getrandbits(8) for _ in range(128))   # 32x32 1-bit icon + mask
+    if eid == ICON_COLOR:
+        return bytes(rng.getrandbits(8) for _ in range(1024))
+    if eid in (FILE_INFO, FILE_DATES_INFO):
+        # create, modify, backup (and access) dates in seconds relative to 2000-01-01
+        dates = [rng.randrange(-300_000_000, 800_000_000) for _ in range(3)]
+        return struct.pack(">iiiI", *dates, rng.getrandbits(32) if eid == FILE_INFO else 0)
+    if eid == FINDER_INFO:
+        other = 0
+        for bit in OTHER_FLAG_BITS:
+            if rng.random() < 0.05:
+                other |= bit
+        return finder_info(rng.randrange(8), other, rng.choice([b"JPEG", b"TIFF", b"MooV", b"TEXT"]),
+                           rng.choice([b"8BIM", b"prvw", b"TVOD", b"ttxt"]),
+                           (rng.randrange(1000), rng.randrange(1000)))
+    if eid == MACINTOSH_FILE_INFO:
+        return struct.pack(">I", rng.getrandbits(32))
+    if eid == PRODOS_FILE_INFO:
+        return struct.pack(">HHI", 0xC3, 0x06, rng.getrandbits(32))
+    if eid == MSDOS_FILE_INFO:
+        return struct.pack(">H", rng.getrandbits(8))
+    if eid == AFP_SHORT_NAME:
+        return name.upper().encode("ascii", "replace")[:12]
+    if eid in (AFP_FILE_INFO, AFP_DIRECTORY_ID):
+        return struct.pack(">I", rng.getrandbits(32))
+    raise ValueError(f"Unknown entry type {eid}")
+
+
+def random_appledouble(rng: random.Random, name: str = "file", fork_size: int = 0,
+                       all_types: bool = False) -> bytes:
+    """ A well-formed "._" file: finder_info and a resource fork, plus (with all_types, or
+        at random) any of the other entry types """
+    eids = [FINDER_INFO, RESOURCE_FORK]
+    if all_types:
+        eids = list(range(1, 16))
+        rng.shuffle(eids)
+    else:
+        eids += [e for e in (REAL_NAME, COMMENT, ICON_BW, ICON_COLOR, FILE_DATES_INFO) if rng.random() < 0.1]
+    return build_appledouble([(eid, entry_body(eid, rng, name, fork_size if eid == RESOURCE_FORK else 0))
+                              for eid in eids])
+
+
+def malformed_appledouble(kind: str, rng: random.Random) -> bytes:
+    """ A broken "._" file of the given kind (see MALFORMED_KINDS) """
+    good = random_appledouble(rng, fork_size=64)
+    if kind == "truncated_header":
+        return good[:rng.randrange(1, 26)]
+    if kind == "truncated_table":
+        return good[:26 + 12 + 5]
+    if kind == "entry_past_eof":
+        return good[:-10]
+    if kind == "short_finder_info":
+        return build_appledouble([(FINDER_INFO, b"JPEG8BI")])
+    if kind == "bad_magic":
+        return b"\xde\xad\xbe\xef" + good[4:]
+    if kind == "no_entries":
+        return build_appledouble([])
+    raise ValueError(f"Unknown malformation {kind!r}")
+
+
+class CorpusStats:
+    """ What generate_corpus() wrote """
+
+    def __init__(self) -> None:
+        self.files: int = 0
+        self.appledouble: int = 0
+        self.large_forks: int = 0
+        self.malformed: Dict[str, int] = {k: 0 for k in MALFORMED_KINDS}
+        self.bytes: int = 0
+        self.paths: List[str] = []
+
+    def __repr__(self) -> str:
+        return (f"CorpusStats(files={self.files}, appledouble={self.appledouble}, "
+                f"large_forks={self.large_forks}, malformed={sum(self.malformed.values())}, "
+                f"bytes={self.bytes})")
+
+
+def generate_corpus(root: str, files: int = 1000, dirs: int = 10, seed: int = 0,
+                    fork_size: int = 286, large_fork_size: int = 4 << 20,
+                    large_fork_fraction: float = 0.01, malformed_fraction: float = 0.01,
+                    bare_fraction: float = 0.05, all_types_fraction: float = 0.01) -> CorpusStats:
+    """ Write `files` data files spread over `dirs` directories under root, most with a "._"
+        sidecar.  Deterministic for a given seed.  The fractions control how many have a
+        large resource fork, a malformed sidecar, no sidecar, or entries of all 15 types. """
+    rng = random.Random(seed)
+    stats = CorpusStats()
+    dirpaths = [os.path.join(root, f"dir{d:04d}") for d in range(max(dirs, 1))]
+    for d in dirpaths:
+        os.makedirs(d, exist_ok=True)
+
+    for i in range(files):
+        directory = dirpaths[i % len(dirpaths)]
+        name = f"IMG_{i:07d}.{rng.choice(['jpg', 'JPG', 'mov', 'tif', 'png'])}"
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(b"\xff\xd8\xff\xe0" + bytes(60))
+        stats.files += 1
+        stats.paths.append(path)
+
+        roll = rng.random()
+        if roll < bare_fraction:
+            continue
+        roll -= bare_fraction
+        if roll < malformed_fraction:
+            kind = rng.choice(MALFORMED_KINDS)
+            stats.malformed[kind] += 1
+            data = malformed_appledouble(kind, rng)
+        else:
+            size = fork_size
+            if rng.random() < large_fork_fraction:
+                size = large_fork_size
+                stats.large_forks += 1
+            data = random_appledouble(rng, name, size, all_types=rng.random() < all_types_fraction)
+        with open(os.path.join(directory, "._" + name), "wb") as f:
+            f.write(data)
+        stats.appledouble += 1
+        stats.bytes += len(data)
+    return stats
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m samba_labels.corpus",
+                                     description="Write a synthetic corpus of files with AppleDouble sidecars")
+    parser.add_argument("root")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--dirs", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--large-fork-size", type=int, default=4 << 20)
+    parser.add_argument("--large-fork-fraction", type=float, default=0.01)
+    parser.add_argument("--malformed-fraction", type=float, default=0.01)
+    opts = parser.parse_args(argv)
+    stats = generate_corpus(opts.root, opts.files, opts.dirs, opts.seed,
+                            large_fork_size=opts.large_fork_size,
+                            large_fork_fraction=opts.large_fork_fraction,
+                            malformed_fraction=opts.malformed_fraction)
+    print(stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,32 +3,262 @@
 # Note that exiftool binary must be installed and on $PATH
 
 import os
+import queue
+import selectors
 import subprocess
+import threading
 #import exiftool  # currently unused in favor of naked subprocess.run()
 import logging
+from typing import Callable, Dict, List, Optional, Tuple
 from tribool import Tribool
 
+from samba_labels import metrics, xmp_sidecar
+from samba_labels.utility import setup_logger
+
+
+class ExifToolCrashed(subprocess.SubprocessError):
+    """ Raised when a persistent exiftool process dies or closes its pipes mid-command """
+
+
+class ExifToolProcess:
+    """ A single persistent exiftool process, started with `-stay_open True -@ -`.
+        Commands are written to its stdin one argument per line and terminated with
+        -executeNUM; exiftool answers with {readyNUM} on stdout.  The exit status of
+        each command is recovered from stderr via `-echo4 ${status}`.
+        Both pipes are drained together (with a selector), so a command that writes a lot
+        to stderr can't block exiftool while we wait on stdout. """
+
+    def __init__(self, executable: str = "exiftool", log_level: int = logging.ERROR) -> None:
+        self.executable: str = executable
+        self.proc: Optional["subprocess.Popen[bytes]"] = None
+        self.seq: int = 0
+        self.commands_run: int = 0
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._buffers: Dict[str, bytearray] = {}
+
+        self.logger = setup_logger(__name__, log_level)
+
+    def start(self) -> None:
+        cmd = [self.executable, "-stay_open", "True", "-@", "-"]
+        self.logger.debug(f"SUBSHELL: {' '.join(cmd)}")
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, bufsize=0)
+        metrics.count("subprocesses")
+        self.seq = 0
+        assert self.proc.stdout is not None and self.proc.stderr is not None
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.proc.stdout, selectors.EVENT_READ, "out")
+        self._selector.register(self.proc.stderr, selectors.EVENT_READ, "err")
+        self._buffers = {"out": bytearray(), "err": bytearray()}
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def restart(self) -> None:
+        self.logger.warning(f"Restarting exiftool process (pid {self.proc.pid if self.proc else None})")
+        self.stop()
+        self.start()
+
+    def stop(self) -> None:
+        """ Ask exiftool to exit cleanly, killing it if it does not """
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+        try:
+            if proc.poll() is None and proc.stdin is not None:
+                proc.stdin.write(b"-stay_open\nFalse\n")
+                proc.stdin.flush()
+            proc.wait(timeout=5)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            proc.kill()
+            proc.wait()
+        finally:
+            for pipe in (proc.stdin, proc.stdout, proc.stderr):
+                try:
+                    if pipe is not None:
+                        pipe.close()
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _split_at(buf: bytearray, match: Callable[[bytes], bool]) -> Optional[Tuple[bytes, bytes]]:
+        """ If buf holds a complete line for which match() is true, remove everything up to
+            and including that line from buf and return (the text before it, the line) """
+        start = 0
+        while True:
+            end = buf.find(b"\n", start)
+            if end < 0:
+                return None
+            line = bytes(buf[start:end]).rstrip(b"\r")
+            if match(line):
+                before = bytes(buf[:start])
+                del buf[:end + 1]
+                return before, line
+            start = end + 1
+
+    def _collect(self) -> Tuple[int, bytes, bytes]:
+        """ Read stdout and stderr as they become readable, until stdout has {readyNUM}
+            and stderr the status line of the current command """
+        assert self._selector is not None
+        ready = f"{{ready{self.seq}}}".encode()
+        suffix = f"=post{self.seq}".encode()
+        out: Optional[Tuple[bytes, bytes]] = None
+        err: Optional[Tuple[bytes, bytes]] = None
+        while out is None or err is None:
+            for key, _ in self._selector.select():
+                data = os.read(key.fd, 65536)
+                if not data:
+                    raise ExifToolCrashed(f"exiftool exited while running command {self.seq}")
+                self._buffers[key.data] += data
+            if out is None:
+                out = self._split_at(self._buffers["out"], lambda line: line == ready)
+            if err is None:
+                err = self._split_at(self._buffers["err"],
+                                     lambda line: line.startswith(b"=") and line.endswith(suffix))
+        status = int(err[1][1:-len(suffix)] or 0)
+        return status, out[0], err[0].rstrip(b"\r\n")
+
+    def execute(self, *args: str) -> Tuple[int, str, str]:
+        """ Run one exiftool command; returns (status, stdout, stderr) """
+        if not self.alive():
+            raise ExifToolCrashed("exiftool process is not running")
+        assert self.proc is not None and self.proc.stdin is not None
+        for a in args:
+            if "\n" in a:
+                raise ValueError(f"exiftool argument may not contain a newline: {a!r}")
+        self.seq += 1
+        lines = list(args) + ["-echo4", f"=${{status}}=post{self.seq}", f"-execute{self.seq}"]
+        payload = b"".join(os.fsencode(a) + b"\n" for a in lines)
+        try:
+            with metrics.stage("exiftool"):
+                self.proc.stdin.write(payload)
+                self.proc.stdin.flush()
+                status, out, err = self._collect()
+        except (BrokenPipeError, ValueError) as e:
+            raise ExifToolCrashed(f"Lost connection to exiftool: {e}")
+        self.commands_run += 1
+        metrics.count("exiftool_commands")
+        return status, os.fsdecode(out), os.fsdecode(err)
+
+    def ping(self) -> bool:
+        """ Health check: exiftool is running and answers a trivial command """
+        try:
+            status, out, _ = self.execute("-ver")
+        except ExifToolCrashed:
+            return False
+        return status == 0 and bool(out.strip())
+
+
+class ExifToolPool:
+    """ A fixed-size pool of persistent exiftool processes, safe to share between threads.
+        Crashed processes are restarted and the interrupted command retried once. """
+
+    def __init__(self, size: int = 1, executable: str = "exiftool", log_level: int = logging.ERROR) -> None:
+        if size < 1:
+            raise ValueError(f"Pool size must be at least 1, got {size}")
+        self.logger = setup_logger(__name__, log_level)
+        self.workers: List[ExifToolProcess] = []
+        self._idle: "queue.Queue[ExifToolProcess]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.restarts: int = 0
+        for _ in range(size):
+            w = ExifToolProcess(executable, log_level)
+            w.start()
+            self.workers.append(w)
+            self._idle.put(w)
+
+    def __enter__(self) -> "ExifToolPool":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def _restart(self, worker: ExifToolProcess) -> None:
+        worker.restart()
+        with self._lock:
+            self.restarts += 1
+
+    def execute(self, *args: str) -> Tuple[int, str, str]:
+        """ Run one command on the next idle process; returns (status, stdout, stderr) """
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                self._restart(worker)
+            try:
+                return worker.execute(*args)
+            except ExifToolCrashed as e:
+                self.logger.warning(f"exiftool crashed ({e}), retrying: {' '.join(args)}")
+                self._restart(worker)
+                return worker.execute(*args)
+        finally:
+            self._idle.put(worker)
+
+    def check_health(self) -> int:
+        """ Ping every process, restarting any that fail to answer.  Returns the number restarted. """
+        restarted = 0
+        for _ in range(len(self.workers)):
+            worker = self._idle.get()
+            try:
+                if not worker.ping():
+                    self._restart(worker)
+                    restarted += 1
+            finally:
+                self._idle.put(worker)
+        return restarted
+
+    def close(self) -> None:
+        for w in self.workers:
+            w.stop()
+
 
 class ExifToolTarget:
     """ Represents an item (image file, etc.) that exiftool can be used to read/write metadata to/from """
 
-    def __init__(self, filepath: str, ext=".xmp", log_level=logging.ERROR) -> None:
+    def __init__(self, filepath: str, ext: str = ".xmp", log_level: int = logging.ERROR,
+                 pool: Optional[ExifToolPool] = None, native_xmp: bool = False,
+                 hassidecar: Optional[bool] = None, mdpath: Optional[str] = None,
+                 get_pool: Optional[Callable[[], ExifToolPool]] = None) -> None:
         self.filepath: str = filepath
         self.mdext: str = ext  # Metadata sidecar file extension, usually ".xmp"
-        self.mdpath: str = self.filepath + self.mdext
+        # An existing sidecar found by the caller may differ in case (e.g. "a.jpg.XMP")
+        self.mdpath: str = mdpath if mdpath is not None else self.filepath + self.mdext
         self.hassidecar: Tribool = Tribool(None)  # Can be True, False, or None (indeterminate)
+        self.pool: Optional[ExifToolPool] = pool  # persistent exiftool processes, if any
+        # or where to get them the first time exiftool is needed (so native_xmp writes
+        # that succeed never start one)
+        self.get_pool: Optional[Callable[[], ExifToolPool]] = get_pool
+        self.native_xmp: bool = native_xmp  # write simple XMP fields in-process when possible
 
         # Logging setup
-        self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(log_level)
-        if not self.logger.handlers:
-            handler = logging.StreamHandler()
-            formatter = logging.Formatter('%(levelname)s: %(message)s')
-            handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
+        self.logger = setup_logger(__name__, log_level)
         
         # Instantiation
-        self.hassidecar = self.check_sidecar_exists()
+        if hassidecar is None:
+            self.hassidecar = self.check_sidecar_exists()
+        else:
+            # Caller already knows from a directory listing (see scanner.py)
+            self.hassidecar = Tribool(hassidecar)
+
+
+    def _run(self, cmd: List[str]) -> int:
+        """ Run an exiftool command line, on the pool if there is one, else via subprocess """
+        self.logger.debug(f"SUBSHELL: {' '.join(cmd)}")
+        if self.pool is None and self.get_pool is not None:
+            self.pool = self.get_pool()
+        if self.pool is None:
+            metrics.count("subprocesses")
+            metrics.count("exiftool_commands")
+            with metrics.stage("exiftool"):
+                return subprocess.run(cmd).returncode
+        status, out, err = self.pool.execute(*cmd[1:])
+        if out.strip():
+            self.logger.debug(f"EXIFTOOL: {out.strip()}")
+        if err.strip():
+            self.logger.warning(f"EXIFTOOL: {err.strip()}")
+        return status
 
 
     def check_sidecar_exists(self) -> Tribool:
@@ -55,32 +285,43 @@ class ExifToolTarget:
         # The -o option will create an XMP if it doesn't exist but error if it does, will not overwrite
         cmd = ["exiftool", self.filepath, "-o", self.mdpath]
 
-        self.logger.debug(f"SUBSHELL: {' '.join(cmd)}")
-        
-        p = subprocess.run(cmd)
-        self.logger.debug(f"SUBSHELL: completed with status {p.returncode}")
+        returncode = self._run(cmd)
+        self.logger.debug(f"SUBSHELL: completed with status {returncode}")
 
-        if p.returncode == 0:
+        if returncode == 0:
             self.hassidecar = Tribool(True)
             self.logger.info(f"Sidecar file created at {self.mdpath}")
             return True
         else:
             self.hassidecar = Tribool(None)  # since we do not know for sure what happened...
-            raise subprocess.SubprocessError(f"exiftool returned {p.returncode} while creating sidecar for {self.filepath}")
+            raise subprocess.SubprocessError(f"exiftool returned {returncode} while creating sidecar for {self.filepath}")
 
 
-    def write_field_value(self, fieldname: str, value: str) -> bool:
+    def write_field_value(self, fieldname: str, value: int) -> bool:
         """ Use exiftool (external) to write value to the metadata property named fieldname.
             The fieldname argument must be a valid exiftool "tag name". """
+        if self.native_xmp and self.mdext == ".xmp" and fieldname in xmp_sidecar.NATIVE_FIELDS:
+            try:
+                with metrics.stage("xmp_native"):
+                    written = xmp_sidecar.write_color_label(self.mdpath, value)
+                if written:
+                    self.logger.debug(f"NATIVE: Wrote {fieldname}={value} to {self.mdpath}")
+                else:
+                    self.logger.debug(f"NATIVE: {self.mdpath} already has {fieldname}={value}")
+                self.hassidecar = Tribool(True)
+                return True
+            except xmp_sidecar.XmpUnsupported as e:
+                self.logger.info(f"Falling back to exiftool for {self.mdpath}: {e}")
+
         if self.hassidecar.value is not True:
             self.create_sidecar()
         
         self.logger.debug(f"Attempting to write {fieldname}={value} to {self.mdpath}")
 
-        p = subprocess.run(["exiftool", "-overwrite_original", f'-{fieldname}={value}', self.mdpath])
-        if p.returncode == 0:
+        returncode = self._run(["exiftool", "-overwrite_original", f'-{fieldname}={value}', self.mdpath])
+        if returncode == 0:
             self.logger.debug(f"EXIFTOOL: Wrote {fieldname}={value} to {self.mdpath}")
             return True
         else:
-            raise subprocess.SubprocessError(f"exiftool returned {p.returncode} while attempting to write {fieldname} to {self.mdpath}")
+            raise subprocess.SubprocessError(f"exiftool returned {returncode} while attempting to write {fieldname} to {self.mdpath}")
     
\ No newline at end of file
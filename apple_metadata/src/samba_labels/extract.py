@@ -0,0 +1,228 @@
+""" Extraction of resource forks, icons, comments etc. from AppleDouble files to plain files """
+
+# dump_file and AppleDoubleMetadata read whole entry bodies into memory, which is fine
+# for Finder info but not for multi-megabyte resource forks across a whole archive.
+# Here only the header and entry table are parsed; each entry's byte range is then
+# copied from the "._" file to its output file inside the kernel, with copy_file_range
+# (or sendfile where that isn't supported, e.g. across filesystems on older kernels),
+# falling back to a fixed-size buffer otherwise.  Memory use is the same for a 1 kB
+# comment and a 1 GB fork.
+#
+# The output for data file "dir/name" is "OUTDIR/dir/name.<entry type>", e.g.
+# "photo.jpg.resource_fork", mirroring the tree below the root.
+
+import errno
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from samba_labels.pooling import bounded_map
+from samba_labels.processor import AppleDoubleMetadata, find_appledouble, read_head_fd
+from samba_labels.scanner import ScanItem, scan_tree
+
+
+# Entries that are worth a file of their own; finder_info and dates are better read
+#  with print_finder_color / inventory
+DEFAULT_TYPES = ("resource_fork", "real_name", "comment", "icon_bw", "icon_color")
+
+DEFAULT_JOBS = 8
+
+# Buffer for the copy fallback, and upper bound per copy_file_range/sendfile call
+CHUNK_SIZE = 1 << 20
+
+# Errors meaning "this copy method doesn't work for these files", not "the copy failed"
+_UNSUPPORTED = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF,
+                getattr(errno, "ENOTSUP", errno.EOPNOTSUPP)}
+
+Types = AppleDoubleMetadata.Entry.Types
+
+logger = logging.getLogger(__name__)
+
+
+def type_name(eid: int) -> str:
+    """ Entry type name used for output files, e.g. "resource_fork", or "entry_16" """
+    try:
+        return Types(eid).name
+    except ValueError:
+        return f"entry_{eid}"
+
+
+def is_type_name(name: str) -> bool:
+    """ Whether name is one type_name() can return, i.e. a type that can be extracted """
+    if name.startswith("entry_") and name[len("entry_"):].isdigit():
+        return type_name(int(name[len("entry_"):])) == name
+    return name in Types.__members__
+
+
+def _copy_file_range(src: int, dst: int, offset: int, count: int) -> int:
+    return os.copy_file_range(src, dst, count, offset)
+
+
+def _sendfile(src: int, dst: int, offset: int, count: int) -> int:
+    return os.sendfile(dst, src, offset, count)
+
+
+def _pread_write(src: int, dst: int, offset: int, count: int) -> int:
+    data = os.pread(src, count, offset)
+    view = memoryview(data)
+    while view:
+        view = view[os.write(dst, view):]
+    return len(data)
+
+
+# (name, function) in order of preference
+COPY_METHODS: List[Tuple[str, Callable[[int, int, int, int], int]]] = []
+if hasattr(os, "copy_file_range"):     # Python 3.8 on Linux 4.5+
+    COPY_METHODS.append(("copy_file_range", _copy_file_range))
+if hasattr(os, "sendfile"):
+    COPY_METHODS.append(("sendfile", _sendfile))
+COPY_METHODS.append(("pread", _pread_write))
+
+
+def copy_range(src: int, dst: int, offset: int, length: int) -> int:
+    """ Copy length bytes at offset of src to the current position of dst, at most
+        CHUNK_SIZE at a time.  Returns the number of bytes copied, less than length
+        only if src ends first. """
+    copied = 0
+    methods = list(COPY_METHODS)
+    while copied < length:
+        name, method = methods[0]
+        try:
+            n = method(src, dst, offset + copied, min(length - copied, CHUNK_SIZE))
+        except OSError as e:
+            if e.errno in _UNSUPPORTED and len(methods) > 1:
+                logger.debug(f"{name} not usable here ({e}), falling back to {methods[1][0]}")
+                methods.pop(0)
+                continue
+            raise
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+class ExtractResult(NamedTuple):
+    path: str
+    outcome: str                            # one of ExtractSummary.OUTCOMES
+    files: Tuple[str, ...] = ()             # output files written
+    nbytes: int = 0
+    detail: str = ""
+
+
+def extract_entries(appledoublepath: str, outbase: str,
+                    types: Sequence[str] = DEFAULT_TYPES) -> List[Tuple[str, int]]:
+    """ Write each non-empty entry of one of the given types to "<outbase>.<type>".
+        Returns (output path, bytes) for each file written. """
+    wanted = set(types)
+    written: List[Tuple[str, int]] = []
+    fd = os.open(appledoublepath, os.O_RDONLY)
+    try:
+        head, entries = read_head_fd(fd, appledoublepath)
+        size = os.fstat(fd).st_size
+        for eid, offset, length in entries:
+            name = type_name(eid)
+            if name not in wanted or not length:
+                continue
+            if offset + length > size:
+                raise ValueError(f"Entry {name} extends past end of {appledoublepath}")
+            outpath = f"{outbase}.{name}"
+            out = os.open(outpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+            try:
+                try:
+                    n = copy_range(fd, out, offset, length)
+                finally:
+                    os.close(out)
+                if n != length:
+                    raise ValueError(f"Short copy of {name} from {appledoublepath} ({n} of {length} bytes)")
+            except BaseException:
+                # a truncated file would pass for a complete extraction
+                try:
+                    os.unlink(outpath)
+                except FileNotFoundError:
+                    pass
+                raise
+            written.append((outpath, n))
+    finally:
+        os.close(fd)
+    return written
+
+
+def extract_file(item: ScanItem, root: str, outdir: str,
+                 types: Sequence[str] = DEFAULT_TYPES) -> ExtractResult:
+    """ extract_entries() for one data file, into the mirror of its directory under outdir """
+    path = item.filepath
+    if item.appledoublepath is None:
+        return ExtractResult(path, "no_appledouble")
+    outbase = os.path.join(outdir, os.path.relpath(path, root))
+    try:
+        os.makedirs(os.path.dirname(outbase), exist_ok=True)
+        written = extract_entries(item.appledoublepath, outbase, types)
+    except FileNotFoundError:
+        return ExtractResult(path, "no_appledouble")
+    except Exception as e:
+        return ExtractResult(path, "error", detail=f"{type(e).__name__}: {e}")
+    if not written:
+        return ExtractResult(path, "nothing")
+    return ExtractResult(path, "extracted", tuple(p for p, _ in written), sum(n for _, n in written))
+
+
+class ExtractSummary:
+    """ Running totals for an extraction """
+
+    OUTCOMES = ("extracted", "nothing", "no_appledouble", "error")
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, int] = {o: 0 for o in self.OUTCOMES}
+        self.files: int = 0
+        self.nbytes: int = 0
+        self.errors: List[Tuple[str, str]] = []
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, result: ExtractResult) -> None:
+        self.counts[result.outcome] += 1
+        self.files += len(result.files)
+        self.nbytes += result.nbytes
+        if result.outcome == "error":
+            self.errors.append((result.path, result.detail))
+            logger.warning(f"{result.path}: {result.detail}")
+        for f in result.files:
+            logger.debug(f"Wrote {f}")
+
+    def report(self) -> str:
+        lines = [f"Checked {self.total} files, wrote {self.files} files ({self.nbytes} bytes)"]
+        for outcome in self.OUTCOMES:
+            lines.append(f"  {outcome:<16}{self.counts[outcome]:>10}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "files_written": self.files,
+            "bytes_written": self.nbytes,
+            "counts": dict(self.counts),
+            "errors": [{"path": p, "error": e} for p, e in self.errors],
+        }
+
+
+def extract_tree(root: str, outdir: str, types: Sequence[str] = DEFAULT_TYPES,
+                 jobs: int = DEFAULT_JOBS, extensions: Optional[Sequence[str]] = None) -> ExtractSummary:
+    """ extract_file() for every data file under root (or for root itself if it is a
+        file), with up to `jobs` copies in flight """
+    summary = ExtractSummary()
+    if not os.path.isdir(root):
+        adpath = find_appledouble(root)
+        item = ScanItem(root, adpath, None)
+        summary.add(extract_file(item, os.path.dirname(root) or ".", outdir, types))
+        return summary
+    logger.info(f"Extracting {', '.join(types)} under {root} to {outdir} with {jobs} threads")
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for result in bounded_map(pool, functools.partial(extract_file, root=root, outdir=outdir, types=types),
+                                  scan_tree(root, extensions), jobs,
+                                  inline=lambda item: item.appledoublepath is None):
+            summary.add(result)
+    return summary
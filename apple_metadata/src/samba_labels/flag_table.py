@@ -0,0 +1,149 @@
+""" Columnar, vectorized decoding of Finder flags for a whole share (needs numpy) """
+
+# Decoding flags one file at a time (mask, shift, Colors(...)) costs Python bytecode per
+# file and per bit.  Here the raw 16-bit flag words are only collected per file (with the
+# header-only fast path in processor.py), into one uint16 array, and the color and every
+# other flag bit are then decoded for all files at once with numpy.  The result is a
+# FlagTable of equal-length columns, ready for group-by style counting or export.
+#
+# numpy is an optional dependency: pip install "samba-labels[numpy]"
+
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+try:
+    import numpy as np
+    import numpy.typing as npt
+except ImportError as e:  # pragma: no cover
+    raise ImportError('samba_labels.flag_table needs numpy: pip install "samba-labels[numpy]"') from e
+
+from samba_labels.processor import read_finder_flags
+from samba_labels.scanner import ScanItem, scan_tree
+from samba_labels.utility import FinderColors, FinderFlags
+
+
+# Single-bit flags, in column order (FinderFlags.color is the 3-bit color field)
+FLAG_BITS: Tuple[FinderFlags, ...] = tuple(f for f in FinderFlags if f is not FinderFlags.color)
+FLAG_NAMES: Tuple[str, ...] = tuple(str(f.name) for f in FLAG_BITS)
+
+COLOR_NAMES: Tuple[str, ...] = ("",) + tuple(c.name for c in sorted(FinderColors))
+
+DEFAULT_JOBS = 16
+
+# Items handed to the thread pool at a time, so a whole share's ScanItems are never held
+CHUNK_SIZE = 4096
+
+
+def decode_flags(flags: "npt.ArrayLike") -> Dict[str, "np.ndarray"]:
+    """ Decode an array of Finder flag words: "color" (uint8, 0 if unset) plus one bool
+        column per FLAG_BITS member, named after it (e.g. "is_invisible") """
+    flags = np.asarray(flags, dtype=np.uint16)
+    columns = {"color": ((flags & FinderFlags.color.value) >> 1).astype(np.uint8)}
+    for name, bit in zip(FLAG_NAMES, FLAG_BITS):
+        columns[name] = (flags & bit.value) != 0
+    return columns
+
+
+class FlagTable:
+    """ Equal-length columns: "path", "has_finder_info", "flags", "color" and the flag bits.
+        Files whose AppleDouble file couldn't be read are listed in errors instead. """
+
+    def __init__(self, paths: Sequence[str], flags: "npt.ArrayLike", has_finder_info: "npt.ArrayLike",
+                 errors: Optional[List[Tuple[str, str]]] = None) -> None:
+        self.columns: Dict[str, "np.ndarray"] = {
+            "path": np.asarray(paths, dtype=object),
+            "has_finder_info": np.asarray(has_finder_info, dtype=bool),
+            "flags": np.asarray(flags, dtype=np.uint16),
+        }
+        self.columns.update(decode_flags(self.columns["flags"]))
+        self.errors: List[Tuple[str, str]] = errors or []
+
+    def __len__(self) -> int:
+        return len(self.columns["flags"])
+
+    def __getitem__(self, name: str) -> "np.ndarray":
+        return self.columns[name]
+
+    def select(self, mask: "np.ndarray") -> "FlagTable":
+        """ The rows where mask (a bool array, or index array) is set """
+        table = FlagTable.__new__(FlagTable)
+        table.columns = {name: col[mask] for name, col in self.columns.items()}
+        table.errors = []
+        return table
+
+    def color_counts(self) -> Dict[str, int]:
+        """ Number of files per Finder color name ("" for no color) """
+        counts = np.bincount(self.columns["color"], minlength=len(COLOR_NAMES))
+        return {COLOR_NAMES[i]: int(n) for i, n in enumerate(counts) if n}
+
+    def flag_counts(self) -> Dict[str, int]:
+        """ Number of files with each flag bit set """
+        return {name: int(np.count_nonzero(self.columns[name])) for name in FLAG_NAMES}
+
+    def group_by_color(self) -> Dict[str, "np.ndarray"]:
+        """ Paths per Finder color name, in one stable sort rather than a pass per color """
+        colors = self.columns["color"]
+        order = np.argsort(colors, kind="stable")
+        bounds = np.searchsorted(colors[order], np.arange(len(COLOR_NAMES) + 1))
+        paths = self.columns["path"][order]
+        return {COLOR_NAMES[c]: paths[bounds[c]:bounds[c + 1]]
+                for c in range(len(COLOR_NAMES)) if bounds[c] < bounds[c + 1]}
+
+    def rows(self) -> Iterator[tuple]:
+        """ One tuple per file, in column order """
+        return zip(*(col.tolist() for col in self.columns.values()))
+
+    def to_csv(self, f: TextIO) -> None:
+        writer = csv.writer(f)
+        writer.writerow(self.columns)
+        writer.writerows(self.rows())
+
+
+def _chunks(items: Iterable[ScanItem], size: int) -> Iterator[List[ScanItem]]:
+    chunk: List[ScanItem] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _read_flags(item: ScanItem) -> Tuple[Optional[int], str]:
+    assert item.appledoublepath is not None  # see read_flag_table()
+    try:
+        return read_finder_flags(item.appledoublepath), ""
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def read_flag_table(items: Iterable[ScanItem], jobs: int = DEFAULT_JOBS) -> FlagTable:
+    """ Collect the Finder flags of every item that has an AppleDouble file, on a thread
+        pool, and decode them into a FlagTable.  Only the flag words and paths are held
+        while reading; decoding happens once at the end. """
+    paths: List[str] = []
+    errors: List[Tuple[str, str]] = []
+    flags = bytearray()     # packed uint16, grows without a Python int object per file
+    present = bytearray()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for chunk in _chunks((i for i in items if i.appledoublepath is not None), CHUNK_SIZE):
+            for item, (value, error) in zip(chunk, pool.map(_read_flags, chunk)):
+                if error:
+                    errors.append((item.filepath, error))
+                    continue
+                paths.append(item.filepath)
+                flags += (value or 0).to_bytes(2, "little")
+                present.append(value is not None)
+    return FlagTable(paths, np.frombuffer(bytes(flags), dtype="<u2"),
+                     np.frombuffer(bytes(present), dtype=np.uint8).astype(bool), errors)
+
+
+def scan_flag_table(root: str, extensions: Optional[Sequence[str]] = None,
+                    jobs: int = DEFAULT_JOBS) -> FlagTable:
+    """ read_flag_table() for every data file under root """
+    if not os.path.isdir(root):
+        raise NotADirectoryError(f"Not a directory: {root}")
+    return read_flag_table(scan_tree(root, extensions), jobs)
@@ -0,0 +1,138 @@
+""" Streaming inventory of AppleDouble metadata for a whole tree, as JSONL or CSV """
+
+# The tree is processed as a pipeline of generators: scan_tree() yields ScanItems, a
+# bounded window of reader threads turns them into records (in tree order), and each
+# record is written out as soon as it is ready.  Nothing is accumulated, so memory use
+# is the same for ten files or ten million.
+#
+# Only the header, entry table and the small entries (finder_info, dates) are read from
+# each "._" file, never resource forks.
+
+import csv
+import datetime
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, TextIO
+
+from samba_labels import parser
+from samba_labels.pooling import bounded_map
+from samba_labels.processor import AppleDoubleMetadata, finder_color_from_flags, read_entry_fd, read_head_fd
+from samba_labels.scanner import ScanItem, scan_tree
+
+
+FORMATS = ("jsonl", "csv")
+
+# Flat columns for CSV; JSONL records have the same keys, with entries as a list
+FIELDS = ("path", "appledouble", "magic", "version", "entries", "file_type", "creator",
+          "flags", "color", "created", "modified", "backup", "accessed", "error")
+
+DEFAULT_JOBS = 8
+
+# AppleDouble dates are signed seconds since 2000-01-01 00:00 GMT; this value means unknown
+EPOCH_2000 = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+UNKNOWN_DATE = -0x80000000
+
+Types = AppleDoubleMetadata.Entry.Types
+
+
+def appledouble_date(seconds: int) -> Optional[str]:
+    """ ISO 8601 form of an AppleDouble date, or None if unknown """
+    if seconds == UNKNOWN_DATE:
+        return None
+    return (EPOCH_2000 + datetime.timedelta(seconds=seconds)).isoformat()
+
+
+def _fourcc(code: bytes) -> str:
+    # Type and creator codes are Mac Roman; most are plain ASCII
+    return code.decode("mac_roman").rstrip("\0")
+
+
+def _type_name(eid: int) -> str:
+    try:
+        return Types(eid).name
+    except ValueError:
+        return str(eid)
+
+
+def read_inventory_record(item: ScanItem) -> Dict:
+    """ One inventory record for a data file.  Reading problems end up in "error" rather
+        than being raised, so one bad file does not stop the export. """
+    record: Dict = {f: None for f in FIELDS}
+    record["path"] = item.filepath
+    record["appledouble"] = item.appledoublepath
+    if item.appledoublepath is None:
+        return record
+    try:
+        fd = os.open(item.appledoublepath, os.O_RDONLY)
+        try:
+            head, table = read_head_fd(fd, item.appledoublepath)
+            header = parser.parse_header(head, item.appledoublepath)
+            record["magic"] = f"0x{header.magic.hex()}"
+            record["version"] = f"0x{header.version:08x}"
+            entries: List[Dict] = []
+            for eid, offset, length in table:
+                entries.append({"type": _type_name(eid), "offset": offset, "length": length})
+                if eid == Types.finder_info and length >= parser.FINDER_INFO.size:
+                    finfo = parser.parse_finder_info(read_entry_fd(fd, head, offset, parser.FINDER_INFO.size))
+                    record["file_type"] = _fourcc(finfo.file_type)
+                    record["creator"] = _fourcc(finfo.creator)
+                    record["flags"] = finfo.flags
+                    color = finder_color_from_flags(finfo.flags)
+                    record["color"] = color.name if color else ""
+                elif eid == Types.file_dates_info and length >= parser.FILE_DATES.size:
+                    dates = parser.parse_file_dates(read_entry_fd(fd, head, offset, parser.FILE_DATES.size))
+                    for key, value in zip(dates._fields, dates):
+                        record[key] = appledouble_date(value)
+            record["entries"] = entries
+        finally:
+            os.close(fd)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def iter_records(items: Iterable[ScanItem], jobs: int = DEFAULT_JOBS) -> Iterator[Dict]:
+    """ read_inventory_record() for each item, in order, with up to `jobs` reads in flight.
+        At most jobs * QUEUE_DEPTH records are pending at any time (see pooling.bounded_map). """
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        yield from bounded_map(pool, read_inventory_record, items, jobs, ordered=True)
+
+
+def _csv_row(record: Dict) -> Dict:
+    row = dict(record)
+    if row["entries"] is not None:
+        row["entries"] = ";".join(f"{e['type']}@{e['offset']}+{e['length']}" for e in row["entries"])
+    return row
+
+
+def write_records(records: Iterable[Dict], out: TextIO, fmt: str = "jsonl") -> int:
+    """ Write each record to out as it arrives; returns the number written """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {FORMATS}")
+    n = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(_csv_row(record))
+            n += 1
+    else:
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False))
+            out.write("\n")
+            n += 1
+    return n
+
+
+def export_inventory(root: str, out: TextIO, fmt: str = "jsonl",
+                     extensions: Optional[Sequence[str]] = None, jobs: int = DEFAULT_JOBS,
+                     include_bare: bool = False) -> int:
+    """ Stream one record per data file under root to out.  Files without an AppleDouble
+        file are left out unless include_bare is set.  Returns the number of records. """
+    if not os.path.isdir(root):
+        raise NotADirectoryError(f"Not a directory: {root}")
+    items: Iterable[ScanItem] = scan_tree(root, extensions)
+    if not include_bare:
+        items = (i for i in items if i.appledoublepath is not None)
+    return write_records(iter_records(items, jobs), out, fmt)
@@ -0,0 +1,183 @@
+""" Resumable batch runs: an append-only journal of finished files, and retries """
+
+# A batch run with --journal appends one JSON line per finished data file to the
+# journal.  Lines are buffered and made durable in checkpoints: every `every` records
+# or `interval` seconds the file is flushed and fsync'd.  If the run dies (SMB
+# disconnect, OOM, Ctrl-C), at most the files since the last checkpoint are done again
+# on the next run, which is harmless since every action is idempotent.
+#
+# Rerunning with the same journal resumes the job: files recorded as done are skipped
+# without being read, and files whose last record is an error are tried again.  A torn
+# last line from a crash mid-write, or a record missing its fields, is ignored (and cut
+# off, with everything after it, before appending).  A journal is only resumed for the
+# action and root it was started with.
+#
+# Transient errors on network filesystems (EIO, ETIMEDOUT, ESTALE, ...) are often gone
+# a moment later, so the worker retries those per RetryPolicy before recording an error.
+
+import errno
+import json
+import logging
+import os
+import random
+import time
+from typing import Dict, FrozenSet, NamedTuple, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_VERSION = 1
+
+DEFAULT_CHECKPOINT_EVERY = 1000       # records
+DEFAULT_CHECKPOINT_INTERVAL = 5.0     # seconds
+
+# errno values worth another try: the file system (or the network under it) may recover
+TRANSIENT_ERRNOS: FrozenSet[int] = frozenset(
+    getattr(errno, name) for name in ("EIO", "EAGAIN", "EBUSY", "EINTR", "ETIMEDOUT", "ESTALE",
+                                      "ECONNRESET", "ECONNABORTED", "ECONNREFUSED", "ENETDOWN",
+                                      "ENETRESET", "ENETUNREACH", "EHOSTDOWN", "EHOSTUNREACH",
+                                      "ENOLCK", "ECOMM", "EREMOTEIO")
+    if hasattr(errno, name))
+
+
+class RetryPolicy(NamedTuple):
+    """ How often, and how long apart, to retry a file that failed with a transient OSError """
+    attempts: int = 3               # in total, including the first
+    delay: float = 0.5              # seconds before the first retry
+    backoff: float = 2.0            # factor the delay grows by per retry
+    max_delay: float = 30.0
+    errnos: FrozenSet[int] = TRANSIENT_ERRNOS
+
+    def should_retry(self, error_code: Optional[int], attempt: int) -> bool:
+        """ Whether to try again after attempt number `attempt` (1-based) failed with error_code """
+        return error_code in self.errnos and attempt < self.attempts
+
+    def wait(self, attempt: int) -> float:
+        """ Seconds to wait after attempt number `attempt`, with up to 10% jitter so that
+            many workers hitting the same outage don't retry in lockstep """
+        delay = min(self.delay * self.backoff ** (attempt - 1), self.max_delay)
+        return delay * random.uniform(0.9, 1.0)
+
+
+class JournalMismatch(ValueError):
+    """ The journal belongs to a run with a different action or root """
+
+
+class Journal:
+    """ Append-only record of the files a batch job has finished, keyed by path relative
+        to the root """
+
+    def __init__(self, path: str, root: str, action: str,
+                 every: int = DEFAULT_CHECKPOINT_EVERY,
+                 interval: float = DEFAULT_CHECKPOINT_INTERVAL) -> None:
+        self.path = path
+        self.root = root
+        self.action = action
+        self.every = every
+        self.interval = interval
+        self.done: Set[str] = set()             # relative paths finished without error
+        self.failed: Dict[str, str] = {}        # relative path -> last error
+        self.resumed = False
+        self._pending = 0
+        self._last_checkpoint = time.monotonic()
+
+        size = self._load() if os.path.exists(path) else 0
+        self._f = open(path, "ab")
+        self._f.truncate(size)          # drop a torn last line
+        if size == 0:
+            self._write({"journal": JOURNAL_VERSION, "action": action, "root": os.path.abspath(root),
+                         "started": time.time()})
+            self.checkpoint()
+            _fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+    def _load(self) -> int:
+        """ Read the existing journal; returns the length of its intact part """
+        good = 0
+        with open(self.path, "rb") as f:
+            for lineno, line in enumerate(f):
+                if not line.endswith(b"\n"):
+                    logger.warning(f"Ignoring incomplete last line of {self.path}")
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                # an incomplete record is as good as a torn one
+                if not isinstance(record, dict) or (lineno > 0 and not ("path" in record and "status" in record)):
+                    logger.warning(f"Ignoring unreadable line {lineno + 1} of {self.path}")
+                    break
+                good += len(line)
+                if lineno == 0:
+                    if record.get("action") != self.action:
+                        raise JournalMismatch(f"{self.path} is a journal for action {record.get('action')!r}, "
+                                              f"not {self.action!r}; remove it to start a new job")
+                    root = os.path.abspath(self.root)
+                    if record.get("root") != root:
+                        raise JournalMismatch(f"{self.path} is a journal for {record.get('root')!r}, "
+                                              f"not {root!r}; remove it to start a new job")
+                    continue
+                if record["status"] == "error":
+                    self.done.discard(record["path"])
+                    self.failed[record["path"]] = record.get("detail", "")
+                else:
+                    self.done.add(record["path"])
+                    self.failed.pop(record["path"], None)
+        self.resumed = good > 0
+        return good
+
+    def _relpath(self, path: str) -> str:
+        return os.path.relpath(path, self.root)
+
+    def _write(self, record: dict) -> None:
+        self._f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def is_done(self, path: str) -> bool:
+        return self._relpath(path) in self.done
+
+    def record(self, path: str, status: str, detail: str = "") -> None:
+        """ Note that path is finished (status "error" means it should be tried again) """
+        rel = self._relpath(path)
+        record = {"path": rel, "status": status}
+        if detail:
+            record["detail"] = detail
+        self._write(record)
+        if status == "error":
+            self.done.discard(rel)
+            self.failed[rel] = detail
+        else:
+            self.done.add(rel)
+            self.failed.pop(rel, None)
+        self._pending += 1
+        if self._pending >= self.every or time.monotonic() - self._last_checkpoint >= self.interval:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """ Make everything recorded so far durable """
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._pending = 0
+        self._last_checkpoint = time.monotonic()
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self.checkpoint()
+            self._f.close()
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def _fsync_dir(dirpath: str) -> None:
+    """ Make a newly created file's directory entry durable too """
+    try:
+        fd = os.open(dirpath, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,105 @@
+""" SQLite manifest of previous runs, so unchanged files can be skipped on the next one """
+
+# For every data file the manifest remembers the identity of its AppleDouble file
+# (size, mtime_ns, inode), the Finder color decoded from it and the last action taken.
+# If the AppleDouble file still has the same identity and the same (or a stronger)
+# action was already applied, the file does not need to be reparsed or rewritten.
+
+import os
+import sqlite3
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+
+# Rows buffered before they are written in one transaction
+FLUSH_EVERY = 1000
+
+
+class FileState(NamedTuple):
+    """ Identity of an AppleDouble file, as far as deciding whether it changed goes """
+    size: int
+    mtime_ns: int
+    inode: int
+
+    @classmethod
+    def from_stat(cls, st: os.stat_result) -> "FileState":
+        return cls(st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+class ManifestEntry(NamedTuple):
+    state: FileState
+    color: int          # Finder color value, 0 if unset
+    action: str         # action applied last time (see batch.ACTIONS)
+
+
+class ScanManifest:
+    """ Path-keyed table of AppleDouble state, decoded color and last action """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            path        TEXT PRIMARY KEY,
+            ad_size     INTEGER NOT NULL,
+            ad_mtime_ns INTEGER NOT NULL,
+            ad_inode    INTEGER NOT NULL,
+            color       INTEGER NOT NULL,
+            action      TEXT NOT NULL,
+            updated     REAL NOT NULL
+        )
+    """
+
+    def __init__(self, dbpath: str, full: bool = False) -> None:
+        """ Open (creating if needed) the manifest at dbpath.
+            With full=True, stored state is ignored, so every file is processed again
+            and its row rewritten. """
+        self.dbpath: str = dbpath
+        self.full: bool = full
+        self.db = sqlite3.connect(dbpath)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(self.SCHEMA)
+        self.db.commit()
+        self._pending: List[Tuple] = []
+
+    def __enter__(self) -> "ScanManifest":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def lookup(self, path: str) -> Optional[ManifestEntry]:
+        row = self.db.execute(
+            "SELECT ad_size, ad_mtime_ns, ad_inode, color, action FROM files WHERE path = ?",
+            (os.path.abspath(path),)).fetchone()
+        if row is None:
+            return None
+        return ManifestEntry(FileState(*row[:3]), row[3], row[4])
+
+    def known(self, path: str, action: str) -> Optional[ManifestEntry]:
+        """ The stored entry for path, if it may let this run skip the file: the same action
+            was applied before (or only the color is wanted).  None with full=True. """
+        if self.full:
+            return None
+        entry = self.lookup(path)
+        if entry is None or (entry.action != action and action != "color"):
+            return None
+        return entry
+
+    def record(self, path: str, state: FileState, color: int, action: str) -> None:
+        self._pending.append((os.path.abspath(path), state.size, state.mtime_ns, state.inode,
+                              int(color), action, time.time()))
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending:
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", self._pending)
+            self.db.commit()
+            self._pending = []
+
+    def __len__(self) -> int:
+        self.flush()
+        return int(self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0])
+
+    def close(self) -> None:
+        self.flush()
+        self.db.close()
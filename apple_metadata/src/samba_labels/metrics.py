@@ -0,0 +1,188 @@
+""" Stage timers, counters and histograms, for finding out where a slow run spends its time """
+
+# Instrumented code calls stage(), count() and observe() on the module-level functions,
+# which record into the Metrics collecting for the current thread.  By default that is
+# one process-wide Metrics; collecting() swaps in a fresh one for a block of work (e.g.
+# one file in process_file()), so the result can be sent back from a worker process or
+# thread and merged into the run's totals without any locking.
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class Histogram:
+    """ Counts of non-negative integer values in power-of-2 buckets (bucket k holds
+        values v with v.bit_length() == k, i.e. 2**(k-1) <= v < 2**k) """
+
+    __slots__ = ("buckets", "count", "total", "min", "max")
+
+    def __init__(self) -> None:
+        self.buckets: Dict[int, int] = {}
+        self.count: int = 0
+        self.total: int = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+
+    def add(self, value: int) -> None:
+        value = max(int(value), 0)
+        k = value.bit_length()
+        self.buckets[k] = self.buckets.get(k, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "Histogram") -> None:
+        for k, n in other.buckets.items():
+            self.buckets[k] = self.buckets.get(k, 0) + n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and other.max is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Histogram":
+        """ Inverse of to_dict() (the quantiles are recomputed from the buckets) """
+        hist = cls()
+        hist.buckets = {int(bound[1:]).bit_length() - 1: n for bound, n in d["buckets"].items()}
+        hist.count, hist.total, hist.min, hist.max = d["count"], d["sum"], d["min"], d["max"]
+        return hist
+
+    def quantile(self, q: float) -> int:
+        """ Upper bound of the bucket holding the q-th quantile (0 if empty) """
+        seen = 0
+        for k in sorted(self.buckets):
+            seen += self.buckets[k]
+            if seen >= q * self.count:
+                return min((1 << k) - 1, self.max or 0)
+        return 0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            # "< upper bound": count
+            "buckets": {f"<{1 << k}": self.buckets[k] for k in sorted(self.buckets)},
+        }
+
+
+class Metrics:
+    """ Seconds spent per stage, event counters and histograms """
+
+    __slots__ = ("timers", "calls", "counters", "histograms")
+
+    def __init__(self) -> None:
+        self.timers: Dict[str, float] = {}      # stage -> total seconds
+        self.calls: Dict[str, int] = {}         # stage -> times entered
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.timers or self.counters or self.histograms)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, value: int) -> None:
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram()
+        hist.add(value)
+
+    def merge(self, other: Optional["Metrics"]) -> None:
+        if not other:
+            return
+        for name, seconds in other.timers.items():
+            self.timers[name] = self.timers.get(name, 0.0) + seconds
+        for name, n in other.calls.items():
+            self.calls[name] = self.calls.get(name, 0) + n
+        for name, n in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + n
+        for name, hist in other.histograms.items():
+            self.histograms.setdefault(name, Histogram()).merge(hist)
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": {name: {"seconds": round(self.timers[name], 6), "calls": self.calls[name]}
+                       for name in sorted(self.timers)},
+            "counters": dict(sorted(self.counters.items())),
+            "histograms": {name: self.histograms[name].to_dict() for name in sorted(self.histograms)},
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Metrics":
+        """ Inverse of to_dict(), e.g. to merge the JSON summaries of separate runs """
+        m = cls()
+        for name, stage in d.get("stages", {}).items():
+            m.timers[name] = stage["seconds"]
+            m.calls[name] = stage["calls"]
+        m.counters = dict(d.get("counters", {}))
+        m.histograms = {name: Histogram.from_dict(h) for name, h in d.get("histograms", {}).items()}
+        return m
+
+    def report(self) -> str:
+        lines = []
+        if self.timers:
+            lines.append("Stages:")
+            for name in sorted(self.timers, key=lambda name: self.timers[name], reverse=True):
+                lines.append(f"  {name:<16}{self.timers[name]:>10.3f}s {self.calls[name]:>10} calls")
+        if self.counters:
+            lines.append("Counters:")
+            for name, n in sorted(self.counters.items()):
+                lines.append(f"  {name:<16}{n:>10}")
+        for name, hist in sorted(self.histograms.items()):
+            lines.append(f"{name}: n={hist.count} p50<={hist.quantile(0.5)} "
+                         f"p90<={hist.quantile(0.9)} p99<={hist.quantile(0.99)} max={hist.max}")
+        return "\n".join(lines)
+
+
+_process_metrics = Metrics()
+_local = threading.local()
+
+
+def current() -> Metrics:
+    """ The Metrics the calling thread is recording into """
+    m = getattr(_local, "metrics", None)
+    return _process_metrics if m is None else m
+
+
+@contextmanager
+def collecting() -> Iterator[Metrics]:
+    """ Record into a fresh Metrics for the duration of the block (per thread) """
+    outer = getattr(_local, "metrics", None)
+    _local.metrics = m = Metrics()
+    try:
+        yield m
+    finally:
+        _local.metrics = outer
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """ Add the time spent in the block to stage `name` """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current().add_time(name, time.perf_counter() - start)
+
+
+def count(name: str, n: int = 1) -> None:
+    current().count(name, n)
+
+
+def observe(name: str, value: int) -> None:
+    current().observe(name, value)
@@ -0,0 +1,226 @@
+""" Zero-copy AppleSingle/AppleDouble parsing with precompiled structs over a memoryview """
+
+# One parser for everything that reads AppleDouble data: the per-file commands (through
+# AppleDoubleMetadata), the header-only fast path used by batch runs, and the inventory.
+# Each structure is a precompiled struct.Struct unpacked straight out of the caller's
+# buffer (bytes, bytearray, mmap or memoryview), and entry bodies are memoryview slices
+# of that buffer, so nothing is copied until a caller asks for bytes.
+#
+# The generated kaitai parser in apple_single_double.py stays for writing files, and as
+# the reference the results here are checked against (see benchmarks/bench_parsers.py).
+#
+# Mac OS X (copyfile(3)) stores a file's extended attributes in its "._" file by growing
+# the finder_info entry: after the 32 bytes of Finder info and 2 bytes of padding comes
+# an "ATTR" header, a table of (offset, length, flags, name) entries aligned to 4 bytes,
+# and the attribute values, at offsets counted from the start of the file.  parse_attrs()
+# reads only the table; values stay views until asked for, and the Finder tags in
+# com.apple.metadata:_kMDItemUserTags (a binary plist) are decoded by parse_user_tags()
+# only when a caller wants them.
+
+import struct
+from typing import List, NamedTuple, Optional, Union
+
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+HEADER = struct.Struct(">4sI16sH")       # magic, version, filler/home file system, number of entries
+ENTRY = struct.Struct(">III")            # entry ID, offset, length
+FINDER_INFO = struct.Struct(">4s4sHhhH")  # FInfo: type, creator, flags, location (v, h), folder
+FILE_DATES = struct.Struct(">iiii")      # create, modify, backup, access: seconds since 2000-01-01
+# magic, debug tag, total size, data start, data length, 3 reserved, flags, number of attributes
+ATTR_HEADER = struct.Struct(">4sIIII12sHH")
+ATTR_ENTRY = struct.Struct(">IIHB")      # value offset, value length, flags, name length (with NUL)
+
+HEADER_LENGTH = HEADER.size   # 26
+ENTRY_LENGTH = ENTRY.size     # 12
+FLAGS_OFFSET = 8              # Finder flags follow file type and creator in finder_info
+FINDER_INFO_LENGTH = 32       # FInfo + FXInfo; a longer finder_info entry holds an ATTR block
+ATTR_OFFSET = 34              # of the ATTR header in the finder_info body, after 2 bytes padding
+ATTR_MAGIC = b"ATTR"
+
+USER_TAGS = "com.apple.metadata:_kMDItemUserTags"
+
+FINDER_INFO_ID = 9
+FILE_DATES_INFO_ID = 8
+
+
+class Header(NamedTuple):
+    magic: bytes
+    version: int
+    filler: bytes
+    num_entries: int
+
+
+class EntryRef(NamedTuple):
+    """ One row of the entry table """
+    type: int
+    offset: int
+    length: int
+
+
+class FinderInfo(NamedTuple):
+    """ The FInfo half of a finder_info entry (the FXInfo half is not decoded) """
+    file_type: bytes
+    creator: bytes
+    flags: int
+    location: tuple         # (v, h) in the window
+    folder_id: int
+
+    @property
+    def colorval(self) -> int:
+        """ Finder label color value in bits 1-3 of the flags, 0 if unset """
+        return (self.flags & 0b1110) >> 1
+
+
+class AttrRef(NamedTuple):
+    """ One row of the attribute table of an ATTR block """
+    name: str
+    offset: int             # of the value, from the start of the file
+    length: int
+    flags: int
+
+
+class UserTag(NamedTuple):
+    """ A Finder tag: a name, and a label color (0 for none, else as in the Finder flags) """
+    name: str
+    color: int
+
+
+class FileDates(NamedTuple):
+    """ Seconds relative to 2000-01-01 00:00 GMT; -0x80000000 means unknown """
+    created: int
+    modified: int
+    backup: int
+    accessed: int
+
+
+def parse_header(buf: Buffer, path: str = "") -> Header:
+    if len(buf) < HEADER_LENGTH:
+        raise ValueError(f"Truncated AppleDouble header in {path}")
+    return Header._make(HEADER.unpack_from(buf))
+
+
+def parse_entries(buf: Buffer, num_entries: int, path: str = "",
+                  check_bodies: bool = True) -> List[EntryRef]:
+    """ The entry table following the header.  With check_bodies, every entry must also
+        lie within buf (i.e. buf holds the whole file). """
+    end = HEADER_LENGTH + num_entries * ENTRY_LENGTH
+    if end > len(buf):
+        raise ValueError(f"Truncated AppleDouble entry table in {path}")
+    entries = [EntryRef._make(t) for t in ENTRY.iter_unpack(memoryview(buf)[HEADER_LENGTH:end])]
+    if check_bodies:
+        for e in entries:
+            if e.offset + e.length > len(buf):
+                raise ValueError(f"Entry {e.type} extends past end of {path}")
+    return entries
+
+
+def parse_finder_info(body: Buffer) -> FinderInfo:
+    if len(body) < FINDER_INFO.size:
+        raise ValueError(f"finder_info entry too short ({len(body)} bytes)")
+    file_type, creator, flags, v, h, folder_id = FINDER_INFO.unpack_from(body)
+    return FinderInfo(file_type, creator, flags, (v, h), folder_id)
+
+
+def parse_file_dates(body: Buffer) -> FileDates:
+    if len(body) < FILE_DATES.size:
+        raise ValueError(f"file_dates_info entry too short ({len(body)} bytes)")
+    return FileDates._make(FILE_DATES.unpack_from(body))
+
+
+def parse_attrs(buf: Buffer, finder_info: EntryRef, path: str = "") -> List[AttrRef]:
+    """ The attribute table of the ATTR block in a finder_info entry, [] if it has none.
+        buf must hold the whole entry; attribute values must lie within buf. """
+    start = finder_info.offset + ATTR_OFFSET
+    end = finder_info.offset + finder_info.length
+    if end - start < ATTR_HEADER.size or bytes(buf[start:start + 4]) != ATTR_MAGIC:
+        return []
+    view = memoryview(buf)
+    num_attrs = ATTR_HEADER.unpack_from(view, start)[-1]
+    attrs = []
+    pos = start + ATTR_HEADER.size
+    for _ in range(num_attrs):
+        if pos + ATTR_ENTRY.size > end:
+            raise ValueError(f"Truncated attribute table in {path}")
+        offset, length, flags, namelen = ATTR_ENTRY.unpack_from(view, pos)
+        name_end = pos + ATTR_ENTRY.size + namelen
+        if name_end > end:
+            raise ValueError(f"Truncated attribute table in {path}")
+        name = bytes(view[pos + ATTR_ENTRY.size:name_end]).rstrip(b"\0").decode("utf-8", "replace")
+        if offset + length > len(buf):
+            raise ValueError(f"Attribute {name} extends past end of {path}")
+        attrs.append(AttrRef(name, offset, length, flags))
+        pos = (name_end + 3) & ~3
+    return attrs
+
+
+def parse_user_tags(value: Buffer) -> List[UserTag]:
+    """ Decode the binary plist of com.apple.metadata:_kMDItemUserTags: an array of
+        "name" or "name\\ncolor" strings """
+    import plistlib  # here, so that loading the parser (i.e. every command) doesn't pay for it
+    try:
+        tags = plistlib.loads(bytes(value))
+    except Exception as e:
+        raise ValueError(f"Unreadable {USER_TAGS} value: {e}")
+    if not isinstance(tags, list):
+        raise ValueError(f"{USER_TAGS} holds a {type(tags).__name__}, not an array")
+    result = []
+    for tag in tags:
+        name, _, color = str(tag).partition("\n")
+        result.append(UserTag(name, int(color) if color.isdigit() else 0))
+    return result
+
+
+class ParsedFile:
+    """ Header and entry table of a whole AppleSingle/AppleDouble file held in memory,
+        with entry bodies as views into it """
+
+    __slots__ = ("buffer", "header", "entries")
+
+    def __init__(self, data: Buffer, path: str = "") -> None:
+        self.buffer: memoryview = memoryview(data)
+        self.header: Header = parse_header(self.buffer, path)
+        self.entries: List[EntryRef] = parse_entries(self.buffer, self.header.num_entries, path)
+
+    def find(self, eid: int) -> Optional[EntryRef]:
+        for e in self.entries:
+            if e.type == eid:
+                return e
+        return None
+
+    def body(self, entry: EntryRef) -> memoryview:
+        return self.buffer[entry.offset:entry.offset + entry.length]
+
+    @property
+    def finder_info(self) -> Optional[FinderInfo]:
+        e = self.find(FINDER_INFO_ID)
+        return parse_finder_info(self.body(e)) if e else None
+
+    @property
+    def file_dates(self) -> Optional[FileDates]:
+        e = self.find(FILE_DATES_INFO_ID)
+        return parse_file_dates(self.body(e)) if e else None
+
+    @property
+    def attrs(self) -> List[AttrRef]:
+        """ Extended attributes stored after the Finder info, see parse_attrs() """
+        e = self.find(FINDER_INFO_ID)
+        return parse_attrs(self.buffer, e) if e else []
+
+    def attr(self, name: str) -> Optional[memoryview]:
+        """ Value of one extended attribute, as a view into the file """
+        for a in self.attrs:
+            if a.name == name:
+                return self.buffer[a.offset:a.offset + a.length]
+        return None
+
+    @property
+    def user_tags(self) -> Optional[List[UserTag]]:
+        """ Finder tags (all of them, not just the one label in the flags), None if unset """
+        value = self.attr(USER_TAGS)
+        return parse_user_tags(value) if value is not None else None
+
+
+def parse(data: Buffer, path: str = "") -> ParsedFile:
+    """ Parse a complete AppleSingle/AppleDouble file from memory """
+    return ParsedFile(data, path)
@@ -0,0 +1,223 @@
+""" Plan-then-apply label sync: diff current XMP/xattr values before writing anything """
+
+# set_color_sidecar and batch --action sidecar write XMP-digiKam:ColorLabel whether or not
+# the sidecar already holds that value, which costs an exiftool command and bumps the
+# sidecar's mtime (so backups copy it again).  Here the whole tree is read first, in
+# process: the Finder label from each AppleDouble file, the ColorLabel from an existing
+# .xmp sidecar (with xmp_sidecar's expat scan) and the current user.color.  What comes
+# out is the minimal list of Changes, which can be printed (--dry-run) or applied, so
+# only files that actually differ are written.
+#
+# Like the existing writers, a file without a Finder label is left alone, unless
+# clear=True: then a stale user.color is removed and a ColorLabel reset to 0.
+
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import xattr  # see https://github.com/iustin/pyxattr
+
+from samba_labels import xmp_sidecar
+from samba_labels.pooling import bounded_map
+from samba_labels.processor import finder_color_from_flags, read_finder_flags
+from samba_labels.scanner import ScanItem, scan_tree
+from samba_labels.utility import digikam_color_for_finder
+from samba_labels.xattr_sync import XATTR_NAME, read_color_xattr
+
+if TYPE_CHECKING:
+    from samba_labels.exiftooling import ExifToolPool  # imported only when sidecars are written
+
+
+TARGETS = ("xattr", "sidecar")
+
+COLOR_LABEL = "XMP-digiKam:ColorLabel"
+
+DEFAULT_JOBS = 16
+
+logger = logging.getLogger(__name__)
+
+
+class Change(NamedTuple):
+    """ One write the plan calls for """
+    path: str                   # data file
+    target: str                 # "xattr" or "sidecar"
+    old: Optional[str]          # current value, None if there is none (or no sidecar)
+    new: Optional[str]          # value to write, None to remove the xattr
+    xmppath: Optional[str] = None   # existing sidecar, for "sidecar" changes
+
+    def __str__(self) -> str:
+        old = "-" if self.old is None else self.old
+        new = "(remove)" if self.new is None else self.new
+        return f"{self.path}: {self.target} {old} -> {new}"
+
+
+class FilePlan(NamedTuple):
+    """ What planning found for one data file """
+    path: str
+    status: str                         # one of Plan.STATUSES
+    color: str = ""                     # Finder color name, "" if unset
+    changes: Tuple[Change, ...] = ()
+    detail: str = ""                    # error message
+
+
+def _sidecar_label(item: ScanItem) -> Tuple[Optional[str], bool]:
+    """ (current ColorLabel as a string or None, whether it could be read) """
+    if item.xmppath is None:
+        return None, True
+    try:
+        value = xmp_sidecar.read_color_label(item.xmppath)
+    except xmp_sidecar.XmpUnsupported as e:
+        logger.info(f"Can't read {item.xmppath} in-process ({e}), planning a write")
+        return None, False
+    return (None if value is None else str(value)), True
+
+
+def plan_file(item: ScanItem, targets: Sequence[str] = TARGETS, clear: bool = False) -> FilePlan:
+    """ The changes that would bring the targets of one data file in line with its Finder label """
+    path = item.filepath
+    if item.appledoublepath is None:
+        return FilePlan(path, "no_appledouble")
+    try:
+        finder_color = finder_color_from_flags(read_finder_flags(item.appledoublepath))
+    except FileNotFoundError:
+        return FilePlan(path, "no_appledouble")
+    except Exception as e:
+        return FilePlan(path, "error", detail=f"{type(e).__name__}: {e}")
+    if finder_color is None and not clear:
+        return FilePlan(path, "unlabeled")
+    name = finder_color.name if finder_color else ""
+
+    changes: List[Change] = []
+    try:
+        if "xattr" in targets:
+            current = read_color_xattr(path)
+            old = current.decode("utf-8", "replace") if current is not None else None
+            if old != (name or None):
+                changes.append(Change(path, "xattr", old, name or None))
+        if "sidecar" in targets:
+            wanted = str(int(digikam_color_for_finder(name))) if name else "0"
+            old, readable = _sidecar_label(item)
+            # Nothing to clear where there is no label; else write unless known to match
+            if not readable or (old != wanted and (name or old not in (None, "0"))):
+                changes.append(Change(path, "sidecar", old, wanted, item.xmppath))
+    except Exception as e:
+        return FilePlan(path, "error", name, detail=f"{type(e).__name__}: {e}")
+    return FilePlan(path, "labeled" if name else "unlabeled", name, tuple(changes))
+
+
+class Plan:
+    """ The change set for a tree, with running totals """
+
+    STATUSES = ("labeled", "unlabeled", "no_appledouble", "error")
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, int] = {s: 0 for s in self.STATUSES}
+        self.changes: List[Change] = []
+        self.errors: List[Tuple[str, str]] = []
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, result: FilePlan) -> None:
+        self.counts[result.status] += 1
+        self.changes.extend(result.changes)
+        if result.status == "error":
+            self.errors.append((result.path, result.detail))
+            logger.warning(f"{result.path}: {result.detail}")
+
+    def by_target(self) -> Dict[str, int]:
+        counts = {t: 0 for t in TARGETS}
+        for c in self.changes:
+            counts[c.target] += 1
+        return counts
+
+    def report(self) -> str:
+        lines = [f"Planned {len(self.changes)} changes for {self.total} files"]
+        for status in self.STATUSES:
+            lines.append(f"  {status:<16}{self.counts[status]:>10}")
+        for target, n in self.by_target().items():
+            lines.append(f"  {target + ' writes':<16}{n:>10}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "counts": dict(self.counts),
+            "changes": [c._asdict() for c in self.changes],
+            "errors": [{"path": p, "error": e} for p, e in self.errors],
+        }
+
+
+def iter_plans(items: Iterator[ScanItem], targets: Sequence[str] = TARGETS, clear: bool = False,
+               jobs: int = DEFAULT_JOBS) -> Iterator[FilePlan]:
+    """ plan_file() for each item, with up to `jobs` threads; results in completion order """
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        yield from bounded_map(pool, functools.partial(plan_file, targets=targets, clear=clear), items, jobs,
+                               inline=lambda item: item.appledoublepath is None)
+
+
+def plan_tree(root: str, targets: Sequence[str] = TARGETS, clear: bool = False,
+              jobs: int = DEFAULT_JOBS, extensions: Optional[Sequence[str]] = None) -> Plan:
+    """ Read every data file under root and return the changes needed; nothing is written """
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        raise ValueError(f"Unknown targets {sorted(unknown)}, expected some of {TARGETS}")
+    if not os.path.isdir(root):
+        raise NotADirectoryError(f"Not a directory: {root}")
+    plan = Plan()
+    for result in iter_plans(scan_tree(root, extensions), targets, clear, jobs):
+        plan.add(result)
+    plan.changes.sort()
+    return plan
+
+
+def apply_change(change: Change, native_xmp: bool = False, pool: Optional["ExifToolPool"] = None,
+                 log_level: int = logging.ERROR) -> None:
+    """ Make one planned write """
+    if change.target == "xattr":
+        if change.new is None:
+            xattr.removexattr(change.path, XATTR_NAME)
+        else:
+            xattr.setxattr(change.path, XATTR_NAME, change.new.encode("utf-8"))
+        return
+    from samba_labels.exiftooling import ExifToolTarget
+    target = ExifToolTarget(change.path, log_level=log_level, pool=pool, native_xmp=native_xmp,
+                            hassidecar=change.xmppath is not None, mdpath=change.xmppath)
+    target.write_field_value(COLOR_LABEL, int(change.new or 0))  # no value: no label, i.e. 0
+
+
+def _try_change(change: Change, native_xmp: bool, pool: Optional["ExifToolPool"],
+                log_level: int) -> Optional[Tuple[Change, str]]:
+    """ apply_change(), returning (change, error) if it failed """
+    try:
+        apply_change(change, native_xmp, pool, log_level)
+    except Exception as e:
+        logger.warning(f"{change}: {type(e).__name__}: {e}")
+        return change, f"{type(e).__name__}: {e}"
+    return None
+
+
+def apply_plan(plan: Plan, jobs: int = DEFAULT_JOBS, native_xmp: bool = False,
+               log_level: int = logging.ERROR) -> List[Tuple[Change, str]]:
+    """ Make every write in plan, with up to `jobs` threads.  Returns the (change, error)
+        pairs that failed. """
+    failed: List[Tuple[Change, str]] = []
+    if not plan.changes:
+        return failed
+    pool = None
+    if not native_xmp and any(c.target == "sidecar" for c in plan.changes):
+        from samba_labels.exiftooling import ExifToolPool
+        pool = ExifToolPool(min(jobs, 4), log_level=log_level)
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            apply = functools.partial(_try_change, native_xmp=native_xmp, pool=pool, log_level=log_level)
+            for failure in bounded_map(executor, apply, plan.changes, jobs, ordered=True):
+                if failure is not None:
+                    failed.append(failure)
+    finally:
+        if pool is not None:
+            pool.close()
+    return failed
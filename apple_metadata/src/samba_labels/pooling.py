@@ -0,0 +1,54 @@
+""" Bounded submission of work to an executor, for tree walks of any size """
+
+# Submitting every file of a tree to a pool up front would hold a future (and its
+# arguments) per file.  bounded_map() keeps only a few per worker in flight instead.
+# Standard library only, so the modules that use it don't pull in batch.py's imports.
+
+from collections import deque
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, as_completed, wait
+from typing import Callable, Deque, Iterable, Iterator, Optional, Set, TypeVar
+
+
+# Number of tasks queued per worker before the caller waits for results.
+#  Keeps memory flat no matter how many files the tree holds.
+QUEUE_DEPTH = 4
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def bounded_map(pool: Executor, fn: Callable[[T], R], items: Iterable[T], jobs: int,
+                inline: Optional[Callable[[T], bool]] = None, ordered: bool = False) -> Iterator[R]:
+    """ fn(item) on pool for each item, with no more than jobs * QUEUE_DEPTH submitted and
+        not yet collected, so items can come from a tree walk of any size.  Results are in
+        completion order, or with ordered, in the order of items.  Items for which
+        inline(item) is true (e.g. files with no AppleDouble file, which need no I/O) are
+        run on the calling thread instead of being sent to the pool. """
+    limit = jobs * QUEUE_DEPTH
+    if ordered:
+        window: Deque[Future] = deque()
+        for item in items:
+            if inline is not None and inline(item):
+                fut: Future = Future()
+                fut.set_result(fn(item))
+                window.append(fut)
+            else:
+                window.append(pool.submit(fn, item))
+            if len(window) >= limit:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+        return
+
+    pending: Set[Future] = set()
+    for item in items:
+        if inline is not None and inline(item):
+            yield fn(item)
+            continue
+        pending.add(pool.submit(fn, item))
+        if len(pending) >= limit:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+    for fut in as_completed(pending):
+        yield fut.result()
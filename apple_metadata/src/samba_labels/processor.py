@@ -1,91 +1,379 @@
 # Processing logic for AppleDouble metadata.
 #  Ref http://kaiser-edv.de/documents/AppleSingle_AppleDouble.pdf
 
-from kaitaistruct import KaitaiStruct, KaitaiStream, BytesIO
 from enum import IntEnum
+from typing import Any, List, NamedTuple, Optional, Tuple, Union
 import os
+import struct
 import logging
 
+from samba_labels import metrics, parser
+from samba_labels.parser import HEADER_LENGTH, ENTRY_LENGTH, FLAGS_OFFSET
+from samba_labels.utility import setup_logger
+
+
+logger = logging.getLogger(__name__)
+
+
+# Fixed-size parts of an AppleDouble file (see docs/appledouble_files.md and parser.py):
+#  HEADER_LENGTH, ENTRY_LENGTH and FLAGS_OFFSET are re-exported from parser
+
+# First read of the fast path: enough for the header, a typical Mac OS X entry table
+#  (finder_info + resource_fork) and the Finder flags at offset 58, in a single pread
+PREFETCH_LENGTH = 128
+
+# Per kaitai.io and ArchiveTeam; an AppleSingle file holds the data fork as well
+APPLEDOUBLE_MAGIC = b'\x00\x05\x16\x07'
+APPLESINGLE_MAGIC = b'\x00\x05\x16\x00'
+MAGIC_NUMBERS = (APPLEDOUBLE_MAGIC, APPLESINGLE_MAGIC)
+
+# Sidecar naming conventions for single files, in order of preference (see scanner.py)
+SIDECAR_PATTERNS = ("._{}", ".AppleDouble/{}", "%{}", "R.{}")
+
+
+
+class NotAppleSingle(ValueError):
+    """ A file probed as a possible AppleSingle container turned out not to be one """
+
+
+def appledouble_path(filepath: str) -> str:
+    """ Path of the modern "._" AppleDouble sidecar for a data file """
+    return os.path.join(os.path.dirname(filepath), f"._{os.path.basename(filepath)}")
+
+
+def find_appledouble(filepath: str) -> Optional[str]:
+    """ Path of the metadata for a single data file: its "._", ".AppleDouble/", "%" or "R."
+        sidecar (in that order), else the file itself if it is an AppleSingle container, else
+        None.  Costs one failed open per convention tried; for whole trees use scanner.py,
+        which resolves all of them from the directory listing instead. """
+    dirname, basename = os.path.split(filepath)
+    for pattern in SIDECAR_PATTERNS:
+        path = os.path.join(dirname, pattern.format(basename))
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        os.close(fd)
+        return path
+    try:
+        with open(filepath, "rb") as f:
+            if f.read(4) == APPLESINGLE_MAGIC:
+                return filepath
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def read_head_fd(fd: int, appledoublepath: str, container: bool = False) -> Tuple[bytes, List[parser.EntryRef]]:
+    """ pread the header and complete entry table; returns (bytes read, parsed entry table).
+        The bytes may go past the table (up to PREFETCH_LENGTH) so small entries come for free.
+        With container, the file is a data file probed as a possible AppleSingle container,
+        and NotAppleSingle is raised if it is not one. """
+    head = os.pread(fd, PREFETCH_LENGTH, 0)
+    metrics.count("preads")
+    metrics.count("bytes_read", len(head))
+    if container and head[:4] != APPLESINGLE_MAGIC:
+        raise NotAppleSingle(f"Not an AppleSingle file: {appledoublepath}")
+    header = parser.parse_header(head, appledoublepath)
+    if header.magic not in MAGIC_NUMBERS:
+        logger.warning(f"Invalid or unusual magic number: {header.magic!r}")
+
+    table_end = HEADER_LENGTH + header.num_entries * ENTRY_LENGTH
+    if table_end > len(head):
+        more = os.pread(fd, table_end - len(head), len(head))
+        metrics.count("preads")
+        metrics.count("bytes_read", len(more))
+        head += more
+    # entry bodies are only checked when read, the file having been read only this far
+    return head, parser.parse_entries(head, header.num_entries, appledoublepath, check_bodies=False)
+
+
+def read_entry_fd(fd: int, head: bytes, offset: int, length: int) -> bytes:
+    """ length bytes at offset: sliced from head (see read_head_fd()) if it holds them,
+        else with one pread.  May be short if the file ends first. """
+    if offset + length <= len(head):
+        return head[offset:offset + length]
+    data = os.pread(fd, length, offset)
+    metrics.count("preads")
+    metrics.count("bytes_read", len(data))
+    return data
+
+
+def _read_flags(fd: int, head: bytes, entries: List[parser.EntryRef], appledoublepath: str) -> Optional[int]:
+    for eid, offset, length in entries:
+        if eid != AppleDoubleMetadata.Entry.Types.finder_info:
+            continue
+        if length < FLAGS_OFFSET + 2:
+            raise ValueError(f"finder_info entry too short ({length} bytes) in {appledoublepath}")
+        flags = read_entry_fd(fd, head, offset + FLAGS_OFFSET, 2)
+        if len(flags) != 2:
+            raise ValueError(f"finder_info entry past end of file in {appledoublepath}")
+        return int.from_bytes(flags, byteorder='big')
+    return None
+
+
+def read_finder_flags(appledoublepath: str) -> Optional[int]:
+    """ Read only the 16-bit Finder flags from an AppleDouble file, without reading the rest.
+        Uses positioned reads of the header, the entry table and the 2 flag bytes inside the
+        finder_info entry; for typical files this is one pread of PREFETCH_LENGTH bytes.
+        Returns None if the file has no finder_info entry. """
+    fd = os.open(appledoublepath, os.O_RDONLY)
+    try:
+        return read_finder_flags_fd(fd, appledoublepath)
+    finally:
+        os.close(fd)
+
+
+def read_finder_flags_fd(fd: int, appledoublepath: str = "", container: bool = False) -> Optional[int]:
+    """ read_finder_flags() on an already open file descriptor (left open).
+        See read_head_fd() for container. """
+    head, entries = read_head_fd(fd, appledoublepath, container)
+    return _read_flags(fd, head, entries, appledoublepath)
+
+
+def finder_color_from_flags(flags: Optional[int]) -> Optional["AppleDoubleMetadata.Entry.Colors"]:
+    """ The Finder label color held in bits 1-3 of the Finder flags, or None if unset """
+    colorbits = ((flags or 0) & 0b1110) >> 1
+    return AppleDoubleMetadata.Entry.Colors(colorbits) if colorbits else None
+
+
+def read_user_tags(appledoublepath: str) -> Optional[List[parser.UserTag]]:
+    """ All the Finder tags of a file, from com.apple.metadata:_kMDItemUserTags in the ATTR
+        block of its AppleDouble file, or None if it has none.  Reads the header and the
+        finder_info entry (one or two preads, a few KB), never the resource fork. """
+    fd = os.open(appledoublepath, os.O_RDONLY)
+    try:
+        head, entries = read_head_fd(fd, appledoublepath)
+        for entry in entries:
+            if entry.type != parser.FINDER_INFO_ID:
+                continue
+            if entry.length <= parser.FINDER_INFO_LENGTH:
+                return None     # Finder info only, no ATTR block
+            buf = read_entry_fd(fd, head, 0, entry.offset + entry.length)
+            for attr in parser.parse_attrs(buf, entry, appledoublepath):
+                if attr.name == parser.USER_TAGS:
+                    return parser.parse_user_tags(memoryview(buf)[attr.offset:attr.offset + attr.length])
+        return None
+    finally:
+        os.close(fd)
+
+
+def read_record(filepath: str, appledoublepath: Optional[str] = None) -> "AppleDoubleRecord":
+    """ Like read_finder_color(), but returns an AppleDoubleRecord with the entry table too """
+    appledoublepath = appledoublepath or find_appledouble(filepath) or appledouble_path(filepath)
+    fd = os.open(appledoublepath, os.O_RDONLY)
+    try:
+        head, entries = read_head_fd(fd, appledoublepath)
+        flags = _read_flags(fd, head, entries, appledoublepath)
+    finally:
+        os.close(fd)
+    magic, version = struct.unpack_from(">II", head)
+    table = head[HEADER_LENGTH:HEADER_LENGTH + len(entries) * ENTRY_LENGTH]
+    return AppleDoubleRecord(filepath, appledoublepath, magic, version, table, flags)
+
+
+def read_finder_color(filepath: str, appledoublepath: Optional[str] = None
+                      ) -> Optional["AppleDoubleMetadata.Entry.Colors"]:
+    """ Fast path for the Finder label color of a data file: reads only the header, entry
+        table and Finder flags of its "._" file, never the resource fork or other entries.
+        appledoublepath may be given if already known (e.g. from scanner.py), otherwise it is
+        looked for with find_appledouble().
+        Returns None if no color is set.  Raises FileNotFoundError if there is no AppleDouble file. """
+    if appledoublepath is None:
+        appledoublepath = find_appledouble(filepath)
+        if appledoublepath is None:
+            raise FileNotFoundError(f"AppleDouble file not found: {appledouble_path(filepath)}")
+    return finder_color_from_flags(read_finder_flags(appledoublepath))
+
+
+class AppleDoubleRecord(NamedTuple):
+    """ Compact summary of one parsed AppleDouble file, for holding a whole share in memory.
+        A tuple of str/int/bytes only: no per-instance __dict__, no back-references, and
+        CPython's GC stops tracking such tuples, so millions of them cost no collection time.
+        The entry table is kept as the raw 12-byte-per-entry bytes from the file. """
+    filepath: str
+    appledoublepath: str
+    magic: int
+    version: int
+    table: bytes                 # raw entry table, see entries
+    flags: Optional[int]         # Finder flags, None if there is no finder_info entry
+
+    @property
+    def entries(self) -> Tuple[Tuple[int, int, int], ...]:
+        """ (type, offset, length) of each entry """
+        return tuple(parser.ENTRY.iter_unpack(self.table))
+
+    @property
+    def color(self) -> Optional["AppleDoubleMetadata.Entry.Colors"]:
+        return finder_color_from_flags(self.flags)
+
 
 class AppleDoubleMetadata:
-    def __init__(self, filepath, log_level=logging.WARNING):
+    def __init__(self, filepath: str, log_level: int = logging.WARNING,
+                 appledoublepath: Optional[str] = None) -> None:
         self.filepath: str = filepath
         self.appledoublepath: str = ""
         self.entries: dict = {}
-        self.color: str = ""
         self.magic: bytes = bytes(0)
         self.version: int = 0
         self.reserved: bytes = bytes(0)
         self.num_entries: int = 0
 
-        # Logging setup
-        self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(log_level)
-        if not self.logger.handlers:
-            handler = logging.StreamHandler()
-            formatter = logging.Formatter('%(levelname)s: %(message)s')
-            handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
-        
-        # Check for input file
-        self.logger.info(f"Processing input data file {self.filepath}")
-        if not os.path.exists(self.filepath):
-            raise FileNotFoundError(f"Input file not found: {self.filepath}")
+        # Logging setup (module-level logger, shared by all instances and their entries)
+        setup_logger(__name__, log_level)
         
-        # Check for AppleDouble metadata sidecar file:
-        #   Modern AppleDouble files usually have "._" prepended to the filename
-        #   Older implementations can use "%" or "R." prefixes instead
-        self.appledoublepath = os.path.join(os.path.dirname(self.filepath), f"._{os.path.basename(self.filepath)}")
-        
-        self.logger.debug(f"Checking for AppleDouble file at {self.appledoublepath}")
-        if not os.path.exists(self.appledoublepath):
-            # TODO: Check for old-style "%filename" and "R.filename" as well
-            raise FileNotFoundError(f"AppleDouble file not found: {self.appledoublepath}")
-        self.logger.info(f"AppleDouble file found at {self.appledoublepath}")
-
-        with open(self.appledoublepath, "rb") as f:
-            stream = KaitaiStream(BytesIO(f.read()))
-            self._parse_stream(stream)
+        logger.info(f"Processing input data file {self.filepath}")
+        if appledoublepath:
+            # Already resolved from a directory listing (see scanner.py), no need to stat
+            self.appledoublepath = appledoublepath
+        else:
+            # Check for input file
+            if not os.path.exists(self.filepath):
+                raise FileNotFoundError(f"Input file not found: {self.filepath}")
+
+            # Check for AppleDouble metadata sidecar file:
+            #   Modern AppleDouble files usually have "._" prepended to the filename
+            #   Older implementations use ".AppleDouble/", "%" or "R." instead,
+            #   or the file may be an AppleSingle file holding its own metadata
+            logger.debug(f"Checking for AppleDouble file for {self.filepath}")
+            found = find_appledouble(self.filepath)
+            if found is None:
+                raise FileNotFoundError(f"AppleDouble file not found: {appledouble_path(self.filepath)}")
+            self.appledoublepath = found
+            logger.info(f"AppleDouble file found at {self.appledoublepath}")
+
+        with metrics.stage("read"), open(self.appledoublepath, "rb") as f:
+            # One buffer for the whole file; entries are zero-copy slices of it
+            self.buffer: memoryview = memoryview(f.read())
+        metrics.count("bytes_read", len(self.buffer))
+        with metrics.stage("parse"):
+            self._parse_buffer(self.buffer)
+
+
+    @classmethod
+    def from_bytes(cls, data: bytes, filepath: str = "", appledoublepath: str = "") -> "AppleDoubleMetadata":
+        """ Parse an AppleDouble file that is already in memory; no filesystem access """
+        self = cls.__new__(cls)
+        self.filepath = filepath
+        self.appledoublepath = appledoublepath
+        self.entries = {}
+        self.buffer = memoryview(data)
+        self._parse_buffer(self.buffer)
+        return self
+
+
+    def record(self) -> AppleDoubleRecord:
+        """ Compact AppleDoubleRecord of this file, independent of the file buffer """
+        finfo = self.entries.get(AppleDoubleMetadata.Entry.Types.finder_info)
+        flags = int.from_bytes(finfo["obj"].flags, byteorder='big') if finfo else None
+        table = bytes(self.buffer[HEADER_LENGTH:HEADER_LENGTH + self.num_entries * ENTRY_LENGTH])
+        return AppleDoubleRecord(self.filepath, self.appledoublepath,
+                                 int.from_bytes(self.magic, byteorder='big'), self.version, table, flags)
     
 
-    def _parse_stream(self, stream):
-        self.logger.debug("Starting _parse_stream(): li.52")
+    @property
+    def color(self) -> Union[str, "AppleDoubleMetadata.Entry.Colors"]:
+        """ Finder label color from the finder_info entry (decoding only that entry),
+            or "" if there is no finder_info entry or no color is set """
+        finfo = self.entries.get(AppleDoubleMetadata.Entry.Types.finder_info)
+        if finfo is None or not finfo["obj"].finder_colorval:
+            return ""
+        return AppleDoubleMetadata.Entry.Colors(finfo["obj"].finder_colorval)
 
-        self.magic: bytes = stream.read_bytes(4)  # returns bytes
-        self.version: int = stream.read_u4be()
-        self.reserved: bytes = stream.read_bytes(16)
-        self.num_entries: int = stream.read_u2be()
 
-        self.logger.debug(f"Magic bytes: {hex(int.from_bytes(self.magic, byteorder='big'))}")
-        self.logger.debug(f"AppleDouble version {self.version}")
-        self.logger.debug(f"Found {self.num_entries} Entry objects")
+    @property
+    def attrs(self) -> List[parser.AttrRef]:
+        """ Extended attributes held in the ATTR block after the Finder info (Mac OS X "._"
+            files), [] if there is none.  The table is read on each access, not at parse time. """
+        finfo = self.entries.get(AppleDoubleMetadata.Entry.Types.finder_info)
+        if finfo is None:
+            return []
+        ref = parser.EntryRef(parser.FINDER_INFO_ID, finfo["offset"], finfo["length"])
+        return parser.parse_attrs(self.buffer, ref, self.appledoublepath)
 
-        # Per kaitai.io and ArchiveTeam, apple_double = 00 05 16 07 (decimal 333319)
-        if self.magic != b'\x00\x05\x16\x07':
-            self.logger.warning(f"Invalid or unusual magic number: {self.magic}")
-        
-        for _ in range(self.num_entries):
-            entry_id: int = stream.read_u4be()   # elsewhere called "type"
-            offset: int = stream.read_u4be()     # aka "ofs_body"
-            length: int = stream.read_u4be()     # aka "len_body"
+
+    @property
+    def user_tags(self) -> Optional[List[parser.UserTag]]:
+        """ All Finder tags and their colors (the flags only keep one label), or None if the
+            file has no com.apple.metadata:_kMDItemUserTags attribute """
+        for a in self.attrs:
+            if a.name == parser.USER_TAGS:
+                return parser.parse_user_tags(self.buffer[a.offset:a.offset + a.length])
+        return None
+
+
+    def _parse_buffer(self, buf: memoryview) -> None:
+        """ Parse the header and entry table.  Entry bodies are only sliced, not decoded. """
+        logger.debug("Starting _parse_buffer()")
+
+        self.magic, self.version, self.reserved, self.num_entries = parser.parse_header(buf, self.appledoublepath)
+
+        logger.debug(f"Magic bytes: {hex(int.from_bytes(self.magic, byteorder='big'))}")
+        logger.debug(f"AppleDouble version {self.version}")
+        logger.debug(f"Found {self.num_entries} Entry objects")
+
+        # Per kaitai.io and ArchiveTeam, apple_double = 00 05 16 07 (decimal 333319),
+        #  apple_single = 00 05 16 00 (decimal 333312)
+        if self.magic not in MAGIC_NUMBERS:
+            logger.warning(f"Invalid or unusual magic number: {self.magic!r}")
+
+        # entry_id is elsewhere called "type"; offset aka "ofs_body"; length aka "len_body"
+        for entry_id, offset, length in parser.parse_entries(buf, self.num_entries, self.appledoublepath):
             self.entries[entry_id] = {
                 "offset": offset,
-                "length": length
+                "length": length,
+                # Decoded on first access to one of its fields
+                "obj": AppleDoubleMetadata.Entry(entry_id, buf[offset:offset + length]),
             }
-        
-        for eid in self.entries:
-            self.logger.debug(f"Reading entry with ID = {eid}")
-            stream.seek(0)
-            stream.seek(self.entries[eid]["offset"])
-            data: bytes = stream.read_bytes(self.entries[eid]["length"])
-            # Create an Entry object for each, passing self as parent
-            self.entries[eid]["obj"]= AppleDoubleMetadata.Entry(self, eid, data, log_level=self.logger.level)
 
 
     class Entry:
-        def __init__(self, parent, eid: int, data: bytes, log_level=logging.WARNING):
-            self.parent = parent  # so we can access parent attributes
-            self.type: int = 0
+        """ One entry of an AppleDouble file.  Construction only records the type and a view
+            of the entry body; the body is decoded the first time a decoded field is read.
+            Slotted, with no reference back to the AppleDoubleMetadata that holds it. """
+
+        # Fields set by decode()
+        DECODED_FIELDS = ("file_type", "file_creator", "flags", "location", "folder_id",
+                          "finder_colorval", "cdate_bytes", "mdate_bytes", "bdate_bytes",
+                          "flags_bytes")
+        __slots__ = ("type", "_data", "_decoded") + DECODED_FIELDS
+
+        def __init__(self, eid: int, data: Union[bytes, memoryview]) -> None:
+            self._data = data  # bytes or memoryview of the entry body, not copied
+            self._decoded: bool = False
+
+            # Look up entry type in Types enum, keeping the plain integer if it isn't there
+            try:
+                self.type: int = AppleDoubleMetadata.Entry.Types(eid)
+            except ValueError:
+                self.type = eid
+
+            # Type codes above 15 are not defined by Apple (that I can find), unlikely to be valid
+            if self.type > 15:
+                logger.warning(f"Unknown Entry type with value {self.type} found")
+
+
+        def __getattr__(self, name: str) -> Any:
+            # Only reached for slots that are not set yet, i.e. fields not yet decoded
+            if name in AppleDoubleMetadata.Entry.DECODED_FIELDS and not self._decoded:
+                self.decode()
+                return getattr(self, name)
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+
+        def fields(self) -> dict:
+            """ Decoded fields as a dict (decoding first if necessary) """
+            self.decode()
+            return {f: getattr(self, f) for f in ("type",) + AppleDoubleMetadata.Entry.DECODED_FIELDS
+                    if hasattr(self, f)}
+
+
+        def decode(self) -> None:
+            """ Parse the entry body into fields; does nothing if already done """
+            if self._decoded:
+                return
+            self._decoded = True
+            data = self._data
             self.file_type: bytes = bytes(0)
             self.file_creator: bytes = bytes(0)
             self.flags: bytes = bytes(0)
@@ -93,65 +381,36 @@ class AppleDoubleMetadata:
             self.folder_id: int = 0
             self.finder_colorval: int = 0
 
-            self.logger = logging.getLogger(__name__)
-            self.logger.setLevel(log_level)
-            if not self.logger.handlers:
-                handler = logging.StreamHandler()
-                formatter = logging.Formatter('%(levelname)s: %(message)s')
-                handler.setFormatter(formatter)
-                self.logger.addHandler(handler)
-            
-            self.logger.debug(f"Parsing Entry with ID = {eid}")
-
-            # Look up entry type in Types enum and store integer to self.types
-            self.type = KaitaiStream.resolve_enum(AppleDoubleMetadata.Entry.Types, eid)
-            self.logger.debug(f"  ID corresponds to type {AppleDoubleMetadata.Entry.Types(self.type).name}")
+            logger.debug(f"Parsing Entry with ID = {self.type}")
 
             # Special handling for finder_info entries (type 9) which store the Label color
             if self.type == AppleDoubleMetadata.Entry.Types.finder_info:
-                self.logger.debug(f"  Finder info entry detected, parsing subfields")
-                ds = KaitaiStream(BytesIO(data))
+                logger.debug(f"  Finder info entry detected, parsing subfields")
                 # Per Apple docs, 16B of 'Finder information' followed by 16B of extended info
                 # "the fields ioFlFndrInfo followed by ioFlXFndrInfo, as returned by the PBGetCatinfo call"
-                self.file_type: bytes = ds.read_bytes(4)
-                self.file_creator: bytes = ds.read_bytes(4)
-                self.flags: bytes = ds.read_bytes(2)  # 16 bits of flags
-                self.location: bytes = ds.read_bytes(4)
-                self.folder_id: int = ds.read_u2be()
-                flagint: int = int.from_bytes(self.flags, byteorder='big')
-
-                self.logger.debug(f"  self.flags = {flagint:b} (Boolean {bool(flagint)}) ")
-
-                if flagint:  # False if all zeros...
-                    # Need to extract 3 bits from 16 total, in positions 'Y':  NNNNNNNNNNNNYYYN
-                    # This requires some bitwise twiddling...
-                    start_mask: int = 1  # counting from LSB, i.e. "right to left"
-                    end_mask: int = 4
-                    labelmask = ( (1 << (end_mask - start_mask)) - 1) << start_mask
-                    colorbits = (flagint & labelmask) >> start_mask
-
-                    self.logger.debug(f"  Flag bits {flagint:b} with bitmask {labelmask:b} -> {colorbits:b} (decimal {colorbits})")
-                    
-                    self.finder_colorval = colorbits
-                    parent.color = AppleDoubleMetadata.Entry.Colors(colorbits)
-
-            
+                finfo = parser.parse_finder_info(data)
+                self.file_type = finfo.file_type
+                self.file_creator = finfo.creator
+                self.flags = bytes(data[8:10])  # 16 bits of flags
+                self.location = bytes(data[10:14])
+                self.folder_id = finfo.folder_id
+                # 3 bits out of 16, in positions 'Y':  NNNNNNNNNNNNYYYN
+                self.finder_colorval = finfo.colorval
+                logger.debug(f"  Flag bits {finfo.flags:b} -> color {self.finder_colorval}")
+
             # Special handling for file_info entries (type 7)
             #  On Buffalo Terastation SMB implementation, these seem to be all zero-byte filled
             if self.type == AppleDoubleMetadata.Entry.Types.file_info:
-                self.logger.debug(f"  File info entry detected, parsing subfields")
-                ds = KaitaiStream(BytesIO(data))
+                logger.debug(f"  File info entry detected, parsing subfields")
+                if len(data) < 16:
+                    raise ValueError(f"file_info entry too short ({len(data)} bytes)")
                 # For Macintosh HFS files, the entry is 16 bytes long and consists of three long-integer dates 
                 # (create date, last modification date, and last backup date) 
                 # and a long integer containing 32 Boolean flags.
-                self.cdate_bytes = ds.read_bytes(4)
-                self.mdate_bytes = ds.read_bytes(4)
-                self.bdate_bytes = ds.read_bytes(4)
-                self.flags_bytes = ds.read_bytes(4)
-            
-            # Type codes above 15 are not defined by Apple (that I can find), unlikely to be valid
-            if self.type > 15:
-                self.logger.warning(f"Unknown Entry type with value {self.type} found")
+                self.cdate_bytes = bytes(data[0:4])
+                self.mdate_bytes = bytes(data[4:8])
+                self.bdate_bytes = bytes(data[8:12])
+                self.flags_bytes = bytes(data[12:16])
 
 
         class Types(IntEnum):
@@ -183,7 +442,7 @@ class AppleDoubleMetadata:
             Orange =    7
 
 
-    def dump(self):
+    def dump(self) -> None:
         """ Dump contents to stdout, mostly for debugging """
         from pprint import pprint
         print("---------------------------------")
@@ -196,5 +455,14 @@ class AppleDoubleMetadata:
             print(f"  Offset {self.entries[e]['offset']} (Length {self.entries[e]['length']}) ")
             #print(self.entries[e]["data"])
             eobj = self.entries[e]["obj"] # Entry object
-            pprint(vars(eobj))
+            pprint(eobj.fields())
+            print()
+        attrs = self.attrs
+        if attrs:
+            print(f"Extended Attributes: {len(attrs)}")
+            for a in attrs:
+                print(f"  {a.name} (Length {a.length})")
+            tags = self.user_tags
+            if tags:
+                print(f"Finder Tags: {', '.join(f'{t.name} ({t.color})' if t.color else t.name for t in tags)}")
             print()
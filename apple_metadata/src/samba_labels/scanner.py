@@ -0,0 +1,142 @@
+""" Directory scanning that pairs data files with their sidecars from one listing per directory """
+
+# Probing for "._name", then the data file, then "name.xmp" costs a stat (a network
+# round-trip on SMB) each, per file.  A directory listing already holds all of those
+# names, so here every directory is read once with os.scandir and the sidecars are
+# matched up in memory.  The resulting ScanItems carry pre-resolved paths that the
+# processor and ExifToolTarget use without checking the filesystem again.
+#
+# Older conventions are resolved from the same listing: "%name" and "R.name" files next
+# to the data file, and Netatalk's ".AppleDouble/name" (one extra listing for the whole
+# directory, not a probe per file).  AppleSingle containers, which hold the data fork and
+# the metadata in one file, can't be told apart by name; with applesingle=True, data
+# files without a sidecar are handed on as their own container (ScanItem.is_container)
+# and the processor checks the magic number as part of its normal header read.
+
+import os
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from samba_labels import metrics
+
+
+# AppleDouble naming conventions, in order of preference:
+#  modern Mac OS X "._name", and older "%name" / "R.name" implementations
+APPLEDOUBLE_PREFIXES = ("._", "%", "R.")
+
+# Netatalk keeps AppleDouble files under the data file's own name in this subdirectory;
+#  preferred after "._" and before "%" / "R."
+NETATALK_DIR = ".AppleDouble"
+
+
+class ScanItem(NamedTuple):
+    """ A data file and the sidecars found next to it (None where there is none) """
+    filepath: str
+    appledoublepath: Optional[str]
+    xmppath: Optional[str]
+
+    @property
+    def is_container(self) -> bool:
+        """ Possibly an AppleSingle file holding its own metadata, see scan_tree(applesingle=True) """
+        return self.appledoublepath is not None and self.appledoublepath == self.filepath
+
+
+class DirectoryIndex:
+    """ The names in one directory, sorted into data files and the sidecars that belong to them """
+
+    def __init__(self, dirpath: str, filenames: Sequence[str], xmp_ext: str = ".xmp",
+                 netatalk: Sequence[str] = ()) -> None:
+        """ filenames are the files in dirpath, netatalk those in its .AppleDouble subdirectory """
+        self.dirpath: str = dirpath
+        self.xmp_ext: str = xmp_ext
+        names = set(filenames)
+        self.appledouble: Dict[str, str] = {}   # data file name -> AppleDouble file name
+        self.xmp: Dict[str, str] = {}           # data file name -> XMP sidecar name
+        self.datafiles: List[str] = []
+        self.orphans: List[str] = []            # "._" files whose data file is missing
+
+        sidecars = set()
+        for prefix in APPLEDOUBLE_PREFIXES:  # most preferred first
+            for name in filenames:
+                if not name.startswith(prefix) or len(name) == len(prefix) or name in sidecars:
+                    continue
+                target = name[len(prefix):]
+                # "%name" and "R.name" are only sidecars when "name" is there too,
+                #  otherwise they are ordinary files that happen to look like one
+                if target in names:
+                    self.appledouble.setdefault(target, name)
+                elif prefix == "._":
+                    self.orphans.append(name)
+                else:
+                    continue
+                sidecars.add(name)
+            if prefix == "._":
+                for name in netatalk:
+                    if name in names:
+                        self.appledouble.setdefault(name, os.path.join(NETATALK_DIR, name))
+
+        for name in sorted(filenames):
+            if name in sidecars:
+                continue
+            if name.lower().endswith(xmp_ext):
+                target = name[:-len(xmp_ext)]
+                if target in names:
+                    self.xmp[target] = name
+                continue
+            self.datafiles.append(name)
+
+    def item(self, name: str) -> ScanItem:
+        ad = self.appledouble.get(name)
+        xmp = self.xmp.get(name)
+        return ScanItem(os.path.join(self.dirpath, name),
+                        os.path.join(self.dirpath, ad) if ad else None,
+                        os.path.join(self.dirpath, xmp) if xmp else None)
+
+    def items(self, extensions: Optional[Sequence[str]] = None,
+              applesingle: bool = False) -> Iterator[ScanItem]:
+        """ ScanItems for the data files, optionally only those with the given extensions.
+            With applesingle, files without a sidecar are their own (candidate) container. """
+        wanted = {e.lower().lstrip(".") for e in extensions} if extensions else None
+        for name in self.datafiles:
+            if wanted is not None and os.path.splitext(name)[1].lower().lstrip(".") not in wanted:
+                continue
+            item = self.item(name)
+            if applesingle and item.appledoublepath is None:
+                item = item._replace(appledoublepath=item.filepath)
+            yield item
+
+
+def _list_files(dirpath: str, subdirs: Optional[List[str]] = None) -> List[str]:
+    filenames: List[str] = []
+    metrics.count("directories")
+    with metrics.stage("scan"), os.scandir(dirpath) as it:
+        for entry in it:
+            # d_type from the listing answers this without a stat, except for symlinks
+            if not entry.is_dir(follow_symlinks=False):
+                filenames.append(entry.name)
+            elif subdirs is not None:
+                subdirs.append(entry.path)
+    return filenames
+
+
+def index_directory(dirpath: str, xmp_ext: str = ".xmp") -> Tuple[DirectoryIndex, List[str]]:
+    """ List dirpath once (plus its .AppleDouble subdirectory, if it has one); returns its
+        DirectoryIndex and the paths of its other subdirectories """
+    subdirs: List[str] = []
+    filenames = _list_files(dirpath, subdirs)
+    netatalk: List[str] = []
+    netatalk_dir = os.path.join(dirpath, NETATALK_DIR)
+    if netatalk_dir in subdirs:
+        subdirs.remove(netatalk_dir)
+        netatalk = _list_files(netatalk_dir)
+    subdirs.sort()
+    return DirectoryIndex(dirpath, filenames, xmp_ext, netatalk), subdirs
+
+
+def scan_tree(root: str, extensions: Optional[Sequence[str]] = None,
+              xmp_ext: str = ".xmp", applesingle: bool = False) -> Iterator[ScanItem]:
+    """ Walk root depth-first, yielding a ScanItem per data file, with one scandir per directory """
+    stack = [root]
+    while stack:
+        index, subdirs = index_directory(stack.pop(), xmp_ext)
+        yield from index.items(extensions, applesingle)
+        stack.extend(reversed(subdirs))
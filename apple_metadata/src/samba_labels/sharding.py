@@ -0,0 +1,91 @@
+""" Deterministic split of one tree between several machines, and merging their results """
+
+# Each node mounts the same share (possibly at a different mount point) and runs
+#   batch ROOT --shard i/n --json results-i.json
+# Every node walks the whole tree, but only processes the files whose path relative to
+# ROOT hashes to its shard.  The hash is blake2b over the UTF-8 relative path with "/"
+# separators, so all nodes agree on who owns what without talking to each other, and
+# the split stays the same from one night to the next (handy with --manifest).
+#
+# The per-shard JSON results are then combined with `merge results-*.json`, which
+# checks that every shard of the run is there exactly once.  A merged result lists the
+# shards it covers, so partial merges can themselves be merged.
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Sequence
+
+from samba_labels.scanner import ScanItem
+
+
+class Shard(NamedTuple):
+    """ Shard `number` (1-based) of `total` """
+    number: int
+    total: int
+
+    def __str__(self) -> str:
+        return f"{self.number}/{self.total}"
+
+    def owns(self, relpath: str) -> bool:
+        return shard_of(relpath, self.total) == self.number
+
+
+def parse_shard(spec: str) -> Shard:
+    """ Shard from "i/n", with 1 <= i <= n """
+    try:
+        number, total = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must be given as i/n, e.g. 1/4, not {spec!r}")
+    if total < 1 or not 1 <= number <= total:
+        raise ValueError(f"Shard {spec!r} out of range, i must be from 1 to n")
+    return Shard(number, total)
+
+
+def shard_of(relpath: str, total: int) -> int:
+    """ The shard (1-based) of total that owns the file at relpath """
+    key = relpath.replace(os.sep, "/").encode("utf-8", "surrogateescape")
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return int.from_bytes(digest, "big") % total + 1
+
+
+def shard_items(items: Iterable[ScanItem], root: str, shard: Shard) -> Iterator[ScanItem]:
+    """ The items owned by shard, by their path relative to root """
+    for item in items:
+        if shard.owns(os.path.relpath(item.filepath, root)):
+            yield item
+
+
+def result_shards(result: Dict) -> List[Shard]:
+    """ The shards a JSON result covers: that of a batch --shard run, or those combined
+        into a merged result ([] for a run over the whole tree) """
+    if result.get("shard"):
+        return [parse_shard(result["shard"])]
+    return [parse_shard(s) for s in result.get("merged_shards", [])]
+
+
+def load_results(paths: Sequence[str]) -> List[Dict]:
+    """ Read per-shard JSON results (from batch --shard i/n --json PATH, or earlier merges)
+        and check that they are the shards of one run: same total, each shard once """
+    results = []
+    for path in paths:
+        with open(path) as f:
+            results.append(json.load(f))
+    if not all(result_shards(r) for r in results):
+        raise ValueError("Every result to merge must come from a run with --shard")
+    shards = [s for r in results for s in result_shards(r)]
+    totals = {s.total for s in shards}
+    if len(totals) != 1:
+        raise ValueError(f"Results are from runs split differently: {sorted(str(s) for s in shards)}")
+    if len(set(shards)) != len(shards):
+        raise ValueError(f"Shard given more than once: {sorted(str(s) for s in shards)}")
+    return results
+
+
+def missing_shards(results: Sequence[Dict]) -> List[Shard]:
+    """ Shards of the run that none of results cover """
+    shards = [s for r in results for s in result_shards(r)]
+    if not shards:
+        return []
+    total = shards[0].total
+    return [Shard(i, total) for i in range(1, total + 1) if Shard(i, total) not in shards]
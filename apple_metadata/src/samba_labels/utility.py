@@ -1,6 +1,22 @@
 """ Reusable utility logic """
 
-from enum import Enum, IntEnum
+import logging
+from enum import Enum, IntEnum, IntFlag
+
+
+def setup_logger(name: str, log_level: int = logging.WARNING) -> logging.Logger:
+    """ Return the named logger set to log_level, adding a stderr handler the first time.
+        Cheap to call repeatedly: the level is only changed (which flushes the logging
+        module's level cache) when it differs. """
+    logger = logging.getLogger(name)
+    if logger.level != log_level:
+        logger.setLevel(log_level)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        formatter = logging.Formatter('%(levelname)s: %(message)s')
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
 
 finder_to_digikam_color = {
     "Gray" : "Gray",
@@ -14,6 +30,18 @@ finder_to_digikam_color = {
     False : False,
 }
 
+# Reverse of the above, for writing digiKam labels back to the Finder.
+#  Black and White have no Finder equivalent.
+digikam_to_finder_color = {
+    "Gray" : "Gray",
+    "Green" : "Green",
+    "Magenta" : "Purple",
+    "Blue" : "Blue",
+    "Yellow" : "Yellow",
+    "Red" : "Red",
+    "Orange" : "Orange",
+}
+
 
 # Below classes are currently unused, but extracted here for future use
 
@@ -27,6 +55,20 @@ class FinderColors(IntEnum):
     Red    =    6
     Orange =    7
 
+class FinderFlags(IntFlag):
+    """ Bits of the 16-bit Finder flags word (FInfo.fdFlags) in a finder_info entry """
+    is_on_desk        = 0x0001
+    color             = 0x000E   # 3-bit field, see FinderColors
+    is_shared         = 0x0040
+    has_no_inits      = 0x0080
+    has_been_inited   = 0x0100
+    has_custom_icon   = 0x0400
+    is_stationery     = 0x0800
+    name_locked       = 0x1000
+    has_bundle        = 0x2000
+    is_invisible      = 0x4000
+    is_alias          = 0x8000
+
 class FinderInfoTypes(IntEnum):
     """ Type codes used by the Finder Info entry """
     data_fork = 1
@@ -56,3 +98,8 @@ class DigikamColors(IntEnum):
     Gray     =  7
     Black    =  8
     White    =  9
+
+
+def digikam_color_for_finder(name: str) -> DigikamColors:
+    """ digiKam color for a Finder color name, e.g. "Purple" -> DigikamColors.Magenta """
+    return DigikamColors[str(finder_to_digikam_color[name])]
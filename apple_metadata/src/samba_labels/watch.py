@@ -0,0 +1,395 @@
+""" Watch mode: reprocess files as their AppleDouble files change, instead of rescanning """
+
+# A full batch run reads every "._" file of the share to pick up the few that were
+# relabeled.  Here the tree is watched instead, and only the data files whose sidecars
+# changed are run through the same per-file pipeline as batch (process_file, so the
+# same xattr / sidecar actions).
+#
+# Change events come from inotify (through ctypes, Linux only) where they can be
+# trusted.  On SMB/NFS mounts changes made by other clients don't raise local events,
+# so there the tree is polled instead: every `interval` seconds each directory is listed
+# and the sidecars' (mtime, size, inode) compared with the previous pass.
+#
+# The Finder writes a "._" file in several steps, and copying a folder touches many at
+# once, so events are debounced: a path is handled once it has been quiet for `debounce`
+# seconds.  Ready files go through a bounded queue to a few worker threads; when the
+# queue is full the event loop waits, and the kernel (or the next poll) keeps the rest.
+#
+# If the kernel's event queue overflows, events have been lost and the whole tree is
+# rescanned.  Work already pending is dropped, since the rescan covers it, and the
+# rescan itself waits until no more overflows have come for `debounce` seconds.
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from samba_labels.batch import ACTIONS, BatchSummary, FileResult, close_worker, init_worker, process_file
+from samba_labels.pooling import QUEUE_DEPTH
+from samba_labels.scanner import APPLEDOUBLE_PREFIXES, NETATALK_DIR, ScanItem, index_directory, scan_tree
+
+
+DEFAULT_DEBOUNCE = 0.5      # seconds a sidecar must be quiet before it is processed
+DEFAULT_INTERVAL = 30.0     # seconds between passes of the polling watcher
+DEFAULT_JOBS = 4
+
+# Filesystems where inotify only sees changes made through this machine
+NETWORK_FS = ("cifs", "smb3", "smbfs", "nfs", "nfs4", "afpfs", "fuse.sshfs")
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT = struct.Struct("iIII")     # wd, mask, cookie, len; followed by len bytes of name
+
+logger = logging.getLogger(__name__)
+
+
+def is_sidecar_path(path: str) -> bool:
+    """ Whether path is named like an AppleDouble file ("._name", "%name", "R.name", or
+        anything in a Netatalk .AppleDouble directory) """
+    dirpath, name = os.path.split(path)
+    return os.path.basename(dirpath) == NETATALK_DIR or name.startswith(APPLEDOUBLE_PREFIXES)
+
+
+def datafile_for_sidecar(path: str) -> Optional[Tuple[str, str]]:
+    """ (directory, data file name) an AppleDouble path would belong to, or None """
+    dirpath, name = os.path.split(path)
+    if os.path.basename(dirpath) == NETATALK_DIR:
+        return os.path.dirname(dirpath), name
+    for prefix in APPLEDOUBLE_PREFIXES:
+        if name.startswith(prefix) and len(name) > len(prefix):
+            return dirpath, name[len(prefix):]
+    return None
+
+
+def walk_dirs(root: str) -> Iterator[str]:
+    """ root and every directory below it, including .AppleDouble directories """
+    stack = [root]
+    while stack:
+        dirpath = stack.pop()
+        yield dirpath
+        try:
+            with os.scandir(dirpath) as it:
+                stack.extend(e.path for e in it if e.is_dir(follow_symlinks=False))
+        except OSError as e:
+            logger.warning(f"Can't list {dirpath}: {e}")
+
+
+def filesystem_type(path: str) -> str:
+    """ Type of the filesystem path is on, from /proc/self/mounts ("" if unknown) """
+    path = os.path.realpath(path)
+    best, fstype = "", ""
+    try:
+        with open("/proc/self/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mnt = fields[1].replace("\\040", " ")
+                if (path == mnt or path.startswith(mnt.rstrip("/") + "/")) and len(mnt) >= len(best):
+                    best, fstype = mnt, fields[2]
+    except OSError:
+        pass
+    return fstype
+
+
+class InotifyWatcher:
+    """ Sidecar changes under root, from inotify watches on every directory """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(name, use_errno=True)
+        self.fd: int = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, f"inotify_init1: {os.strerror(e)}")
+        self.dirs: Dict[int, str] = {}      # watch descriptor -> directory
+        try:
+            for dirpath in walk_dirs(root):
+                self._add_watch(dirpath)
+        except OSError:
+            self.close()
+            raise
+        logger.info(f"Watching {len(self.dirs)} directories under {root} with inotify")
+
+    def _add_watch(self, dirpath: str) -> None:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK | IN_ONLYDIR)
+        if wd < 0:
+            e = ctypes.get_errno()
+            if e in (errno.ENOENT, errno.ENOTDIR):  # gone again already
+                return
+            if e == errno.ENOSPC:
+                raise OSError(e, "Out of inotify watches, raise fs.inotify.max_user_watches or use polling")
+            raise OSError(e, f"inotify_add_watch {dirpath}: {os.strerror(e)}")
+        self.dirs[wd] = dirpath
+
+    def poll(self, timeout: float) -> Tuple[Set[str], bool]:
+        """ Wait up to timeout seconds; returns the changed sidecar paths, and whether
+            events were lost (queue overflow) so the caller should rescan """
+        changed: Set[str] = set()
+        overflow = False
+        if not select.select([self.fd], [], [], max(timeout, 0))[0]:
+            return changed, overflow
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos + EVENT.size <= len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, pos)
+                name = os.fsdecode(data[pos + EVENT.size:pos + EVENT.size + length].rstrip(b"\0"))
+                pos += EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                dirpath = self.dirs.get(wd)
+                if dirpath is None:
+                    continue
+                if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                    if mask & IN_IGNORED:
+                        del self.dirs[wd]
+                    continue
+                path = os.path.join(dirpath, name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # A new directory may already hold sidecars by the time it is watched
+                        for sub in walk_dirs(path):
+                            try:
+                                self._add_watch(sub)
+                            except OSError as e:
+                                logger.warning(f"Not watching {sub}: {e}")
+                            changed.update(_sidecars_in(sub))
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and is_sidecar_path(path):
+                    changed.add(path)
+        return changed, overflow
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def _sidecars_in(dirpath: str) -> List[str]:
+    try:
+        with os.scandir(dirpath) as it:
+            return [e.path for e in it if not e.is_dir(follow_symlinks=False) and is_sidecar_path(e.path)]
+    except OSError:
+        return []
+
+
+class PollingWatcher:
+    """ Sidecar changes under root, found by listing the tree every `interval` seconds """
+
+    def __init__(self, root: str, interval: float = DEFAULT_INTERVAL) -> None:
+        self.root = root
+        self.interval = interval
+        self.state: Dict[str, Tuple[int, int, int]] = self._snapshot()
+        self.next_pass = time.monotonic() + interval
+        logger.info(f"Polling {len(self.state)} sidecars under {root} every {interval}s")
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int, int]]:
+        state = {}
+        for path in (p for d in walk_dirs(self.root) for p in _sidecars_in(d)):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            state[path] = (st.st_mtime_ns, st.st_size, st.st_ino)
+        return state
+
+    def poll(self, timeout: float) -> Tuple[Set[str], bool]:
+        """ Same contract as InotifyWatcher.poll(); a pass is made when one is due """
+        wait = self.next_pass - time.monotonic()
+        if wait > timeout:
+            time.sleep(max(timeout, 0))
+            return set(), False
+        time.sleep(max(wait, 0))
+        state = self._snapshot()
+        changed = {p for p, sig in state.items() if self.state.get(p) != sig}
+        self.state = state
+        self.next_pass = time.monotonic() + self.interval
+        return changed, False
+
+    def close(self) -> None:
+        pass
+
+
+def make_watcher(root: str, polling: Optional[bool] = None,
+                 interval: float = DEFAULT_INTERVAL) -> Union[InotifyWatcher, PollingWatcher]:
+    """ An InotifyWatcher, or a PollingWatcher if polling is set, if root is on a network
+        filesystem (with polling=None), or if inotify isn't available """
+    if polling is None:
+        fstype = filesystem_type(root)
+        polling = fstype in NETWORK_FS
+        if polling:
+            logger.info(f"{root} is on {fstype}, where inotify misses remote changes; polling instead")
+    if not polling:
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:   # AttributeError: no inotify in this libc
+            logger.warning(f"inotify unavailable ({e}), polling instead")
+    return PollingWatcher(root, interval)
+
+
+class Debouncer:
+    """ Holds paths until they have had no new events for `delay` seconds """
+
+    def __init__(self, delay: float = DEFAULT_DEBOUNCE) -> None:
+        self.delay = delay
+        self.pending: Dict[str, float] = {}     # path -> time of its last event
+
+    def add(self, paths: Iterable[str], now: float) -> None:
+        for path in paths:
+            self.pending[path] = now
+
+    def next_due(self) -> Optional[float]:
+        return min(self.pending.values()) + self.delay if self.pending else None
+
+    def ready(self, now: float) -> List[str]:
+        due = [p for p, t in self.pending.items() if now - t >= self.delay]
+        for p in due:
+            del self.pending[p]
+        return due
+
+
+def items_for_sidecars(paths: Sequence[str]) -> Iterator[ScanItem]:
+    """ ScanItems for the data files the changed sidecar paths belong to, with one listing
+        per directory so that sidecar precedence and XMP pairing match scan_tree() """
+    by_dir: Dict[str, Set[str]] = {}
+    for path in paths:
+        target = datafile_for_sidecar(path)
+        if target:
+            by_dir.setdefault(target[0], set()).add(target[1])
+    for dirpath, names in sorted(by_dir.items()):
+        try:
+            index, _ = index_directory(dirpath)
+        except OSError as e:
+            logger.debug(f"Can't list {dirpath}: {e}")
+            continue
+        for name in sorted(names):
+            if name in index.appledouble:   # else a plain file that merely looks like a sidecar
+                yield index.item(name)
+
+
+def _discard_queued(todo: "queue.Queue") -> int:
+    """ Empty todo of the items not yet taken by a worker; returns how many there were """
+    n = 0
+    while True:
+        try:
+            todo.get_nowait()
+        except queue.Empty:
+            return n
+        n += 1
+
+
+def _worker(todo: "queue.Queue", results: "queue.SimpleQueue", action: str) -> None:
+    while True:
+        item = todo.get()
+        if item is None:
+            return
+        results.put(process_file(item, action))
+
+
+def watch(root: str, action: str = "color", jobs: int = DEFAULT_JOBS,
+          debounce: float = DEFAULT_DEBOUNCE, polling: Optional[bool] = None,
+          interval: float = DEFAULT_INTERVAL, log_level: int = logging.WARNING,
+          native_xmp: bool = False, stop: Optional[threading.Event] = None,
+          on_result: Optional[Callable[[FileResult], None]] = None) -> BatchSummary:
+    """ Process the data files under root whose AppleDouble files change, until stop is
+        set (or KeyboardInterrupt).  on_result is called with each FileResult, from this
+        thread.  Returns the totals for the whole session.
+        interval only applies to the polling watcher (see make_watcher()). """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action {action!r}, expected one of {ACTIONS}")
+    if not os.path.isdir(root):
+        raise NotADirectoryError(f"Not a directory: {root}")
+    stop = stop or threading.Event()
+    summary = BatchSummary()
+    init_worker(log_level, native_xmp, exiftool_processes=jobs)  # the work happens on this process's threads
+
+    def collect(result: FileResult) -> None:
+        summary.add(result)
+        if on_result is not None:
+            on_result(result)
+
+    def drain() -> None:
+        while True:
+            try:
+                collect(results.get_nowait())
+            except queue.Empty:
+                return
+
+    def submit(item: ScanItem) -> None:
+        # Waits while the queue is full, handing back results meanwhile
+        while True:
+            try:
+                todo.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                drain()
+
+    todo: "queue.Queue" = queue.Queue(maxsize=jobs * QUEUE_DEPTH)
+    results: "queue.SimpleQueue" = queue.SimpleQueue()
+    threads = [threading.Thread(target=_worker, args=(todo, results, action), daemon=True)
+               for _ in range(jobs)]
+    for t in threads:
+        t.start()
+
+    watcher = make_watcher(root, polling, interval)
+    debouncer = Debouncer(debounce)
+    rescan_due: Optional[float] = None      # after an overflow, see above
+    start = time.perf_counter()
+    try:
+        while not stop.is_set():
+            due = min((t for t in (debouncer.next_due(), rescan_due) if t is not None), default=None)
+            timeout = 0.2 if due is None else min(0.2, max(due - time.monotonic(), 0))
+            changed, overflow = watcher.poll(timeout)
+            debouncer.add(changed, time.monotonic())
+            if overflow:
+                if rescan_due is None:
+                    logger.warning(f"Change events were lost, rescanning the whole tree in {debounce}s")
+                rescan_due = time.monotonic() + debounce
+            if rescan_due is not None and time.monotonic() >= rescan_due:
+                rescan_due = None
+                debouncer.pending.clear()
+                dropped = _discard_queued(todo)
+                logger.info(f"Rescanning {root} ({dropped} queued files dropped)")
+                for item in scan_tree(root):
+                    if item.appledoublepath is not None:
+                        submit(item)
+            for item in items_for_sidecars(debouncer.ready(time.monotonic())):
+                submit(item)
+            drain()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        for _ in threads:
+            todo.put(None)
+        for t in threads:
+            t.join()
+        close_worker()
+        drain()
+        summary.elapsed = time.perf_counter() - start
+    return summary
@@ -0,0 +1,228 @@
+""" Reverse sync: write labels set on Linux (digiKam XMP or user.color) back to the Finder """
+
+# The Finder label lives in 3 bits of the 16-bit flags word inside the finder_info entry
+# of the "._" file.  Rather than parsing and rewriting the whole file (resource fork and
+# all), only those 2 bytes are read and, if the color differs, written back with one
+# pwrite at the same offset.  Files with no AppleDouble file at all get a minimal one
+# holding just a finder_info entry, built with the kaitai AppleSingleDouble writer.
+
+import errno
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from kaitaistruct import KaitaiStream
+
+from samba_labels import parser
+from samba_labels.apple_single_double import AppleSingleDouble
+from samba_labels.pooling import bounded_map
+from samba_labels.processor import FLAGS_OFFSET, appledouble_path, read_entry_fd, read_head_fd
+from samba_labels.scanner import ScanItem, scan_tree
+from samba_labels.utility import DigikamColors, FinderColors, digikam_to_finder_color
+
+
+SOURCES = ("xmp", "xattr")
+
+DEFAULT_JOBS = 16
+
+COLOR_MASK = 0b1110
+
+logger = logging.getLogger(__name__)
+
+
+class WritebackUnsupported(ValueError):
+    """ The AppleDouble file has no finder_info entry to patch in place """
+
+
+class WritebackResult(NamedTuple):
+    path: str
+    outcome: str            # one of WritebackSummary.OUTCOMES
+    color: str = ""         # Finder color written, "" for none
+    detail: str = ""
+
+
+def finder_color_for_digikam(value: int) -> Optional[FinderColors]:
+    """ Finder color for a digiKam ColorLabel value; None for 0 (no label).
+        Raises KeyError for digiKam colors the Finder doesn't have (Black, White). """
+    if not value:
+        return None
+    return FinderColors[digikam_to_finder_color[DigikamColors(value).name]]
+
+
+def set_flags_color(flags: int, colorval: int) -> int:
+    """ flags with the 3 color bits replaced, all other Finder flags kept """
+    return (flags & ~COLOR_MASK & 0xFFFF) | ((colorval & 0b111) << 1)
+
+
+def minimal_appledouble(colorval: int) -> bytes:
+    """ A "._" file with only a 32-byte finder_info entry carrying colorval """
+    ad = AppleSingleDouble()
+    ad.magic = AppleSingleDouble.FileType.apple_double
+    ad.version = 0x00020000
+    ad.reserved = b"Mac OS X        "
+    ad.num_entries = 1
+    entry = AppleSingleDouble.Entry(None, ad, ad._root)
+    entry.type = AppleSingleDouble.Entry.Types.finder_info
+    entry.ofs_body = parser.HEADER_LENGTH + parser.ENTRY_LENGTH
+    entry.len_body = 32     # FInfo + FXInfo; the writer fills in FInfo, FXInfo stays zero
+    finfo = AppleSingleDouble.FinderInfo(None, entry, ad._root)
+    finfo.file_type = bytes(4)
+    finfo.file_creator = bytes(4)
+    finfo.flags = set_flags_color(0, colorval)
+    finfo.folder_id = 0
+    finfo.location = AppleSingleDouble.Point(None, finfo, ad._root)
+    finfo.location.x = finfo.location.y = 0
+    entry.body = finfo
+    ad.entries = [entry]
+    for obj in (finfo.location, finfo, entry, ad):
+        obj._check()
+
+    io = KaitaiStream(BytesIO(bytearray(entry.ofs_body + entry.len_body)))
+    ad._write(io)
+    data: bytes = io.to_byte_array()
+    return data
+
+
+def write_finder_color(appledoublepath: str, colorval: int) -> bool:
+    """ Set the Finder color of an existing AppleDouble file by patching the 2 flag bytes
+        in place.  Returns False if it already had that color (nothing written). """
+    fd = os.open(appledoublepath, os.O_RDWR)
+    try:
+        head, entries = read_head_fd(fd, appledoublepath)
+        for eid, offset, length in entries:
+            if eid == parser.FINDER_INFO_ID and length >= FLAGS_OFFSET + 2:
+                pos = offset + FLAGS_OFFSET
+                break
+        else:
+            raise WritebackUnsupported(f"No finder_info entry in {appledoublepath}")
+        raw = read_entry_fd(fd, head, pos, 2)
+        if len(raw) != 2:
+            raise ValueError(f"finder_info entry past end of file in {appledoublepath}")
+        flags = int.from_bytes(raw, byteorder="big")
+        newflags = set_flags_color(flags, colorval)
+        if newflags == flags:
+            return False
+        os.pwrite(fd, newflags.to_bytes(2, byteorder="big"), pos)
+        return True
+    finally:
+        os.close(fd)
+
+
+def create_appledouble(filepath: str, colorval: int) -> str:
+    """ Write a minimal "._" file for filepath; fails if one appeared in the meantime """
+    path = appledouble_path(filepath)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        os.write(fd, minimal_appledouble(colorval))
+    finally:
+        os.close(fd)
+    return path
+
+
+def read_source_label(item: ScanItem, source: str) -> Optional[FinderColors]:
+    """ The label to write back, as a Finder color (None for an explicit "no label").
+        Raises LookupError if the source has nothing to say about this file. """
+    if source == "xmp":
+        from samba_labels.xmp_sidecar import read_color_label
+        if item.xmppath is None:
+            raise LookupError("no XMP sidecar")
+        value = read_color_label(item.xmppath)
+        if value is None:
+            raise LookupError("no ColorLabel in XMP sidecar")
+        return finder_color_for_digikam(value)
+
+    import xattr
+    try:
+        value = xattr.getxattr(item.filepath, "user.color")
+    except OSError as e:
+        if e.errno in (errno.ENODATA, getattr(errno, "ENOATTR", errno.ENODATA)):
+            raise LookupError("no user.color")
+        raise
+    return FinderColors[value.decode("utf-8")]
+
+
+def writeback_file(item: ScanItem, source: str = "xmp") -> WritebackResult:
+    """ Make the Finder label of one file match its XMP ColorLabel or user.color """
+    path = item.filepath
+    try:
+        try:
+            color = read_source_label(item, source)
+        except KeyError as e:      # before LookupError, which it is a subclass of
+            return WritebackResult(path, "unmappable", "", f"No Finder color for {e}")
+        except LookupError as e:
+            return WritebackResult(path, "no_source", "", str(e))
+        colorval = int(color) if color else 0
+        name = color.name if color else ""
+
+        if item.appledoublepath is None:
+            if not colorval:
+                return WritebackResult(path, "unchanged")
+            create_appledouble(path, colorval)
+            return WritebackResult(path, "created", name)
+        if write_finder_color(item.appledoublepath, colorval):
+            return WritebackResult(path, "patched", name)
+        return WritebackResult(path, "unchanged", name)
+    except Exception as e:
+        return WritebackResult(path, "error", "", f"{type(e).__name__}: {e}")
+
+
+class WritebackSummary:
+    """ Running totals for a reverse sync """
+
+    OUTCOMES = ("patched", "created", "unchanged", "no_source", "unmappable", "error")
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, int] = {o: 0 for o in self.OUTCOMES}
+        self.colors: Dict[str, int] = {}
+        self.errors: List[Tuple[str, str]] = []
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, result: WritebackResult) -> None:
+        self.counts[result.outcome] += 1
+        if result.outcome in ("patched", "created"):
+            key = result.color or "(cleared)"
+            self.colors[key] = self.colors.get(key, 0) + 1
+        elif result.outcome in ("error", "unmappable"):
+            self.errors.append((result.path, result.detail))
+            logger.warning(f"{result.path}: {result.detail}")
+
+    def report(self) -> str:
+        lines = [f"Checked {self.total} files"]
+        for outcome in self.OUTCOMES:
+            lines.append(f"  {outcome:<16}{self.counts[outcome]:>10}")
+        if self.colors:
+            lines.append("Finder colors written:")
+            for color, n in sorted(self.colors.items()):
+                lines.append(f"  {color:<16}{n:>10}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "counts": dict(self.counts),
+            "colors": dict(sorted(self.colors.items())),
+            "errors": [{"path": p, "error": e} for p, e in self.errors],
+        }
+
+
+def writeback_tree(root: str, source: str = "xmp", jobs: int = DEFAULT_JOBS,
+                   extensions: Optional[Sequence[str]] = None) -> WritebackSummary:
+    """ writeback_file() every data file under root, with up to `jobs` threads """
+    if source not in SOURCES:
+        raise ValueError(f"Unknown source {source!r}, expected one of {SOURCES}")
+    if not os.path.isdir(root):
+        raise NotADirectoryError(f"Not a directory: {root}")
+    summary = WritebackSummary()
+    logger.info(f"Writing {source} labels back to AppleDouble files under {root} with {jobs} threads")
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for result in bounded_map(pool, functools.partial(writeback_file, source=source),
+                                  scan_tree(root, extensions), jobs,
+                                  inline=lambda item: source == "xmp" and item.xmppath is None):
+            summary.add(result)
+    return summary
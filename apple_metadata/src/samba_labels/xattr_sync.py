@@ -0,0 +1,136 @@
+""" Tree-level sync of Finder labels into the user.color extended attribute """
+
+# Unlike set_color_xattr, which always writes, this reads the current user.color of
+# every file first and only touches it when it differs from the Finder label: a rerun
+# over an already synced share makes (almost) no metadata writes.  A user.color left
+# over from a label that has since been cleared in the Finder is removed.
+#
+# xattr calls are blocking system calls that release the GIL, and on SMB each one is a
+# network round-trip, so the files are handled on a thread pool rather than processes.
+
+import errno
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import xattr  # see https://github.com/iustin/pyxattr
+
+from samba_labels.pooling import bounded_map
+from samba_labels.processor import finder_color_from_flags, read_finder_flags
+from samba_labels.scanner import ScanItem, scan_tree
+
+
+XATTR_NAME = "user.color"
+
+DEFAULT_JOBS = 16
+
+# "No such attribute" is ENODATA on Linux, ENOATTR on the BSDs and macOS
+_NO_ATTR = {errno.ENODATA, getattr(errno, "ENOATTR", errno.ENODATA)}
+
+logger = logging.getLogger(__name__)
+
+
+class SyncResult(NamedTuple):
+    """ What sync_file() did for one data file """
+    path: str
+    outcome: str            # one of SyncSummary.OUTCOMES
+    color: str = ""         # Finder color name, "" if unset
+    detail: str = ""        # error message, or the previous value for written/removed
+
+
+def read_color_xattr(path: str) -> Optional[bytes]:
+    """ Current user.color of path, or None if it has none """
+    try:
+        value: bytes = xattr.getxattr(path, XATTR_NAME)
+        return value
+    except OSError as e:
+        if e.errno in _NO_ATTR:
+            return None
+        raise
+
+
+def sync_file(item: ScanItem) -> SyncResult:
+    """ Make user.color of one data file match the Finder label in its AppleDouble file.
+        Files without an AppleDouble file are left alone: there is nothing to say the
+        label was cleared, rather than the "._" file never having been copied. """
+    path = item.filepath
+    if item.appledoublepath is None:
+        return SyncResult(path, "no_appledouble")
+    try:
+        flags = read_finder_flags(item.appledoublepath)
+    except FileNotFoundError:
+        return SyncResult(path, "no_appledouble")  # removed since the directory was listed
+    except Exception as e:
+        return SyncResult(path, "error", "", f"{type(e).__name__}: {e}")
+    try:
+        finder_color = finder_color_from_flags(flags)
+        name = finder_color.name if finder_color else ""
+        wanted = name.encode("utf-8") if name else None
+        current = read_color_xattr(path)
+
+        if current == wanted:
+            return SyncResult(path, "unchanged" if wanted else "clean", name)
+        previous = current.decode("utf-8", "replace") if current is not None else ""
+        if wanted is None:
+            xattr.removexattr(path, XATTR_NAME)
+            return SyncResult(path, "removed", "", previous)
+        xattr.setxattr(path, XATTR_NAME, wanted)
+        return SyncResult(path, "written", name, previous)
+    except Exception as e:  # including the data file itself having gone
+        return SyncResult(path, "error", "", f"{type(e).__name__}: {e}")
+
+
+class SyncSummary:
+    """ Running totals for an xattr sync """
+
+    OUTCOMES = ("written", "removed", "unchanged", "clean", "no_appledouble", "error")
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, int] = {o: 0 for o in self.OUTCOMES}
+        self.errors: List[Tuple[str, str]] = []
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def writes(self) -> int:
+        """ Metadata writes made (sets and removals) """
+        return self.counts["written"] + self.counts["removed"]
+
+    def add(self, result: SyncResult) -> None:
+        self.counts[result.outcome] += 1
+        if result.outcome == "error":
+            self.errors.append((result.path, result.detail))
+            logger.warning(f"{result.path}: {result.detail}")
+        elif result.outcome in ("written", "removed"):
+            logger.debug(f"{result.path}: {result.outcome} ({result.detail!r} -> {result.color!r})")
+
+    def report(self) -> str:
+        lines = [f"Checked {self.total} files, {self.writes} xattr writes"]
+        for outcome in self.OUTCOMES:
+            lines.append(f"  {outcome:<16}{self.counts[outcome]:>10}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "writes": self.writes,
+            "counts": dict(self.counts),
+            "errors": [{"path": p, "error": e} for p, e in self.errors],
+        }
+
+
+def sync_tree(root: str, jobs: int = DEFAULT_JOBS,
+              extensions: Optional[Sequence[str]] = None) -> SyncSummary:
+    """ sync_file() every data file under root, with up to `jobs` threads """
+    if not os.path.isdir(root):
+        raise NotADirectoryError(f"Not a directory: {root}")
+    summary = SyncSummary()
+    logger.info(f"Syncing {XATTR_NAME} under {root} with {jobs} threads")
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for result in bounded_map(pool, sync_file, scan_tree(root, extensions), jobs,
+                                  inline=lambda item: item.appledoublepath is None):
+            summary.add(result)
+    return summary
@@ -0,0 +1,236 @@
+""" In-process reading and writing of the digiKam ColorLabel in XMP sidecar files """
+
+# Creating or updating a sidecar that only needs XMP-digiKam:ColorLabel does not need
+# a whole exiftool process.  This module makes the edit itself:
+#   * a missing sidecar is created from a minimal XMP packet
+#   * an existing sidecar is parsed once with expat to find the ColorLabel (element or
+#     attribute form, under whatever prefix is bound to the digiKam namespace) and
+#     only those bytes are replaced; everything else in the file is left untouched
+#   * the result is written to a temporary file and renamed over the original
+# Anything it can't handle safely raises XmpUnsupported so the caller can fall back
+# to exiftool.
+
+import os
+import re
+import xml.parsers.expat
+from typing import Dict, List, Optional, Tuple
+
+from samba_labels import __version__
+
+
+DIGIKAM_NS = "http://www.digikam.org/ns/1.0/"
+RDF_NS = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+
+# exiftool tag names that write_color_label() can handle
+NATIVE_FIELDS = ("XMP-digiKam:ColorLabel",)
+
+MINIMAL_SIDECAR = """<?xpacket begin='\ufeff' id='W5M0MpCehiHzreSzNTczkc9d'?>
+<x:xmpmeta xmlns:x='adobe:ns:meta/' x:xmptk='samba_labels {version}'>
+<rdf:RDF xmlns:rdf='http://www.w3.org/1999/02/22-rdf-syntax-ns#'>
+
+ <rdf:Description rdf:about=''
+  xmlns:digiKam='http://www.digikam.org/ns/1.0/'>
+  <digiKam:ColorLabel>{value}</digiKam:ColorLabel>
+ </rdf:Description>
+</rdf:RDF>
+</x:xmpmeta>
+<?xpacket end='w'?>
+"""
+
+class XmpUnsupported(ValueError):
+    """ The sidecar can't be read or edited safely in-process; use exiftool instead """
+
+
+class _LabelScan:
+    """ Where the ColorLabel lives in an XMP document, found in one expat pass """
+
+    def __init__(self) -> None:
+        self.value: Optional[str] = None
+        self.elem_start: int = -1      # byte index of <prefix:ColorLabel ...>
+        self.elem_end: int = -1        # byte index of </prefix:ColorLabel>
+        self.attr_start: int = -1      # byte index of <rdf:Description ...> holding it as attribute
+        self.desc_start: int = -1      # byte index of the first <rdf:Description ...>
+        self.prefix: Optional[str] = None        # prefix bound to DIGIKAM_NS where the label is
+        self.desc_prefix: Optional[str] = None   # ... at the first rdf:Description
+        self.desc_digikam_taken: bool = False    # "digiKam" is bound to some other namespace there
+        self.count: int = 0
+
+
+def _scan(data: bytes) -> _LabelScan:
+    if data[:2] in (b"\xff\xfe", b"\xfe\xff") or data[:4] in (b"\x00\x00\xfe\xff", b"\xff\xfe\x00\x00"):
+        raise XmpUnsupported("UTF-16/32 encoded XMP")
+
+    scan = _LabelScan()
+    bindings: Dict[str, List[str]] = {}
+    text: List[str] = []
+    in_label = False
+    parser = xml.parsers.expat.ParserCreate(namespace_separator=" ")
+
+    def prefix_for(uri: str) -> Optional[str]:
+        for prefix, uris in bindings.items():
+            if prefix and uris and uris[-1] == uri:
+                return prefix
+        return None
+
+    def start_ns(prefix: Optional[str], uri: str) -> None:
+        bindings.setdefault(prefix or "", []).append(uri)
+
+    def end_ns(prefix: Optional[str]) -> None:
+        bindings[prefix or ""].pop()
+
+    def start(name: str, attrs: Dict[str, str]) -> None:
+        nonlocal in_label
+        if name == f"{RDF_NS} Description":
+            if scan.desc_start < 0:
+                scan.desc_start = parser.CurrentByteIndex
+                scan.desc_prefix = prefix_for(DIGIKAM_NS)
+                taken = bindings.get("digiKam")
+                scan.desc_digikam_taken = bool(taken and taken[-1] != DIGIKAM_NS)
+            if f"{DIGIKAM_NS} ColorLabel" in attrs:
+                scan.count += 1
+                scan.value = attrs[f"{DIGIKAM_NS} ColorLabel"]
+                scan.attr_start = parser.CurrentByteIndex
+                scan.prefix = prefix_for(DIGIKAM_NS)
+        elif name == f"{DIGIKAM_NS} ColorLabel":
+            scan.count += 1
+            scan.elem_start = parser.CurrentByteIndex
+            scan.prefix = prefix_for(DIGIKAM_NS)
+            in_label = True
+            del text[:]
+
+    def chardata(data: str) -> None:
+        if in_label:
+            text.append(data)
+
+    def end(name: str) -> None:
+        nonlocal in_label
+        if in_label and name == f"{DIGIKAM_NS} ColorLabel":
+            scan.elem_end = parser.CurrentByteIndex
+            scan.value = "".join(text)
+            in_label = False
+
+    parser.StartNamespaceDeclHandler = start_ns
+    parser.EndNamespaceDeclHandler = end_ns
+    parser.StartElementHandler = start
+    parser.CharacterDataHandler = chardata
+    parser.EndElementHandler = end
+    try:
+        parser.Parse(data, True)
+    except xml.parsers.expat.ExpatError as e:
+        raise XmpUnsupported(f"Unparseable XMP: {e}")
+    if scan.count > 1:
+        raise XmpUnsupported("More than one digiKam:ColorLabel")
+    return scan
+
+
+def _tag_end(data: bytes, start: int) -> int:
+    """ Index of the '>' closing the start tag at data[start], skipping quoted attribute values """
+    quote = None
+    for i in range(start, len(data)):
+        c = data[i:i + 1]
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in (b"'", b'"'):
+            quote = c
+        elif c == b">":
+            return i
+    raise XmpUnsupported("Unterminated start tag")
+
+
+def _edit(data: bytes, scan: _LabelScan, value: int) -> bytes:
+    newval = str(value).encode("ascii")
+    if scan.elem_start >= 0:
+        gt = _tag_end(data, scan.elem_start)
+        if data[gt - 1:gt] == b"/" or scan.elem_end <= gt:
+            raise XmpUnsupported("Empty digiKam:ColorLabel element")
+        return data[:gt + 1] + newval + data[scan.elem_end:]
+
+    if scan.attr_start >= 0:
+        gt = _tag_end(data, scan.attr_start)
+        tag = data[scan.attr_start:gt]
+        assert scan.prefix is not None  # an attribute only has a namespace through a prefix
+        pattern = re.compile(rb"(\s" + re.escape(scan.prefix.encode()) + rb":ColorLabel\s*=\s*)(['\"])[^'\"]*\2")
+        tag, n = pattern.subn(lambda m: m.group(1) + m.group(2) + newval + m.group(2), tag)
+        if n != 1:
+            raise XmpUnsupported("Couldn't locate digiKam:ColorLabel attribute")
+        return data[:scan.attr_start] + tag + data[gt:]
+
+    # No label yet: add it as an attribute of the first rdf:Description
+    if scan.desc_start < 0:
+        raise XmpUnsupported("No rdf:Description to hold digiKam:ColorLabel")
+    gt = _tag_end(data, scan.desc_start)
+    insert_at = gt - 1 if data[gt - 1:gt] == b"/" else gt
+    if scan.desc_prefix is not None:
+        attr = f"\n  {scan.desc_prefix}:ColorLabel='{value}'"
+    elif scan.desc_digikam_taken:
+        raise XmpUnsupported("Prefix digiKam is bound to another namespace")
+    else:
+        attr = f"\n  xmlns:digiKam='{DIGIKAM_NS}'\n  digiKam:ColorLabel='{value}'"
+    return data[:insert_at] + attr.encode("ascii") + data[insert_at:]
+
+
+def _create_temp(dirpath: str) -> Tuple[int, str]:
+    """ Create a new, uniquely named file in dirpath.  Unlike mkstemp() (always 0600), it
+        gets 0666 less the umask, like any file open() creates, without reading the umask
+        (os.umask() can only be read by changing it, which isn't thread-safe). """
+    for _ in range(100):
+        tmppath = os.path.join(dirpath, f".{os.urandom(6).hex()}.tmp")
+        try:
+            return os.open(tmppath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), tmppath
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"Could not create a temporary file in {dirpath}")
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """ Write data to a temporary file next to path, then rename it into place.
+        An existing file's permissions are kept; a new one gets the usual ones. """
+    try:
+        mode: Optional[int] = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = None
+    fd, tmppath = _create_temp(os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if mode is not None:
+                os.fchmod(f.fileno(), mode)
+        os.replace(tmppath, path)
+    except BaseException:
+        try:
+            os.unlink(tmppath)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def read_color_label(mdpath: str) -> Optional[int]:
+    """ Return the digiKam ColorLabel stored in an XMP sidecar, or None if it has none """
+    with open(mdpath, "rb") as f:
+        data = f.read()
+    value = _scan(data).value
+    if value is None or not value.strip():
+        return None
+    try:
+        return int(value.strip())
+    except ValueError:
+        raise XmpUnsupported(f"Non-integer digiKam:ColorLabel {value!r}")
+
+
+def write_color_label(mdpath: str, value: int) -> bool:
+    """ Create or update mdpath so that it holds digiKam:ColorLabel = value.
+        Returns False if the sidecar already had that value (nothing written). """
+    value = int(value)
+    try:
+        with open(mdpath, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        _atomic_write(mdpath, MINIMAL_SIDECAR.format(version=__version__, value=value).encode("utf-8"))
+        return True
+
+    scan = _scan(data)
+    if scan.value is not None and scan.value.strip() == str(value):
+        return False
+    _atomic_write(mdpath, _edit(data, scan, value))
+    return True
@@ -0,0 +1,9 @@
+"""Helpers for building small AppleDouble files in tests."""
+
+from samba_labels.corpus import APPLEDOUBLE_MAGIC, appledouble_bytes, write_appledouble_pair
+
+
+def write_sample(directory, name: str, color=0, data: bytes = b"data", **kwargs) -> str:
+    """Create directory/name and its ._name sidecar; returns the data file path.
+    If color is None, no AppleDouble file is written."""
+    return write_appledouble_pair(directory, name, color, data, **kwargs)
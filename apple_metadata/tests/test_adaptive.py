@@ -0,0 +1,116 @@
+"""Tests for samba_labels.adaptive and adaptive concurrency in the asyncio engine."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from samba_labels.adaptive import MIN_WINDOW, AimdController
+from samba_labels.aio import iter_results, run_async
+from samba_labels.batch import BatchSummary, process_file
+from tests.samples import write_sample
+
+
+def feed(controller, latency, windows, error=False):
+    for _ in range(windows * max(controller.limit, MIN_WINDOW)):
+        controller.record(latency, error)
+
+
+def test_additive_increase_up_to_max():
+    c = AimdController(initial=4, minimum=2, maximum=10)
+    feed(c, 0.01, 3)
+    assert c.limit == 7
+    feed(c, 0.01, 20)
+    assert c.limit == 10
+    assert [level.limit for level in c.history] == list(range(4, 11))
+
+
+def test_multiplicative_decrease_down_to_min():
+    c = AimdController(initial=40, minimum=5, maximum=64)
+    feed(c, 0.01, 1)
+    assert c.limit == 41
+    feed(c, 0.05, 1)            # five times the baseline: the server is queueing
+    assert c.limit == 30
+    for _ in range(20):
+        feed(c, 0.5, 1)
+    assert c.limit == 5
+
+
+def test_errors_cut_the_limit():
+    c = AimdController(initial=20, maximum=64)
+    feed(c, 0.01, 1)
+    feed(c, 0.01, 1, error=True)
+    assert c.limit == 15
+    assert c.history[-1].error_rate == 1.0
+
+
+def test_bounds_are_checked():
+    with pytest.raises(ValueError):
+        AimdController(minimum=0)
+    with pytest.raises(ValueError):
+        AimdController(minimum=10, maximum=5)
+    assert AimdController(initial=100, maximum=16).limit == 16
+
+
+class FixedLimit(AimdController):
+    """ A controller that keeps its limit and just remembers what it was told """
+
+    def __init__(self, limit):
+        super().__init__(initial=limit, minimum=limit, maximum=limit)
+        self.latencies = []
+
+    def record(self, latency, error=False):
+        self.latencies.append(latency)
+
+
+def test_iter_results_keeps_the_limit_in_flight(tmp_path):
+    for i in range(12):
+        write_sample(tmp_path, f"img{i:02d}.jpg", color=1)
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+    together = threading.Barrier(6, timeout=10)  # only passes with 6 in flight at once
+
+    def server(item, action, known=None):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        together.wait()
+        with lock:
+            in_flight -= 1
+        return process_file(item, action, known)
+
+    controller = FixedLimit(6)
+
+    async def collect():
+        return [r async for r in iter_results(str(tmp_path), worker=server, controller=controller)]
+
+    assert [r.status for r in asyncio.run(collect())] == ["labeled"] * 12
+    assert peak == 6
+    assert len(controller.latencies) == 12
+
+
+def test_latency_leaves_out_loop_delay(tmp_path):
+    for i in range(5):
+        write_sample(tmp_path, f"img{i}.jpg", color=1)
+    controller = FixedLimit(5)
+
+    async def slow_consumer():
+        async for _ in iter_results(str(tmp_path), controller=controller):
+            time.sleep(0.2)  # blocks the loop while the other results are ready
+
+    asyncio.run(slow_consumer())
+    assert len(controller.latencies) == 5
+    assert max(controller.latencies) < 0.2
+
+
+def test_run_async_records_levels(tmp_path):
+    for i in range(30):
+        write_sample(tmp_path, f"img{i:02d}.jpg", color=2)
+    summary = run_async(str(tmp_path), controller=AimdController(initial=2, minimum=1, maximum=4))
+    assert summary.counts["labeled"] == 30
+    assert summary.concurrency[0].limit == 2
+    assert "Concurrency 2 ->" in summary.report()
+    assert BatchSummary.from_dict(summary.to_dict()).concurrency == summary.concurrency
@@ -0,0 +1,44 @@
+"""Tests for the asyncio engine."""
+
+import asyncio
+import threading
+import time
+
+from samba_labels.aio import iter_results, run_async
+from samba_labels.batch import process_file
+from tests.samples import write_sample
+
+
+def test_run_async_matches_batch(tmp_path):
+    for i in range(20):
+        write_sample(tmp_path, f"img{i:02d}.jpg", color=i % 8)
+    write_sample(tmp_path, "bare.jpg", color=None)
+    summary = run_async(str(tmp_path), concurrency=4)
+    assert summary.counts == {"labeled": 17, "unlabeled": 3, "no_appledouble": 1, "error": 0}
+
+
+def test_iter_results_bounded_and_in_completion_order(tmp_path):
+    for i in range(12):
+        write_sample(tmp_path, f"img{i:02d}.jpg", color=1)
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def slow_worker(item, action, known=None):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        # first file is slowest, so it must not come back first
+        time.sleep(0.2 if item.filepath.endswith("img00.jpg") else 0.01)
+        with lock:
+            in_flight -= 1
+        return process_file(item, action, known)
+
+    async def collect():
+        return [r.path async for r in iter_results(str(tmp_path), concurrency=3, worker=slow_worker)]
+
+    paths = asyncio.run(collect())
+    assert len(paths) == 12
+    assert not paths[0].endswith("img00.jpg")
+    assert peak <= 3
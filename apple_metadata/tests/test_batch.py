@@ -0,0 +1,148 @@
+"""Tests for samba_labels.batch."""
+
+import logging
+import os
+import sys
+
+import pytest
+
+from samba_labels.batch import close_worker, run_batch, process_file
+from samba_labels.manifest import ScanManifest
+from samba_labels.scanner import scan_tree
+from tests.samples import write_sample
+from tests.test_exiftooling import FAKE_EXIFTOOL
+
+
+@pytest.fixture
+def tree(tmp_path):
+    write_sample(tmp_path, "red.jpg", color=6)
+    write_sample(tmp_path, "plain.jpg", color=0)
+    write_sample(tmp_path, "bare.mov", color=None)
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    write_sample(sub, "blue.JPG", color=4)
+    (sub / "blue.JPG.xmp").write_text("<x/>")
+    return tmp_path
+
+
+def test_process_file_statuses(tree):
+    items = {os.path.basename(i.filepath): i for i in scan_tree(str(tree))}
+    assert process_file(items["red.jpg"], "color")[1:3] == ("labeled", "Red")
+    assert process_file(items["plain.jpg"], "color")[1] == "unlabeled"
+    assert process_file(items["bare.mov"], "color")[1] == "no_appledouble"
+
+
+def test_run_batch_summary(tree):
+    summary = run_batch(str(tree), action="color", jobs=2)
+    assert summary.total == 4
+    assert summary.counts == {"labeled": 2, "unlabeled": 1, "no_appledouble": 1, "error": 0}
+    assert summary.colors == {"Red": 1, "Blue": 1}
+    assert "Processed 4 files" in summary.report()
+
+
+def test_run_batch_rejects_unknown_action(tree):
+    with pytest.raises(ValueError):
+        run_batch(str(tree), action="bogus")
+
+
+def test_manifest_skips_unchanged_files(tree, tmp_path_factory):
+    dbpath = str(tmp_path_factory.mktemp("db") / "manifest.sqlite")
+    with ScanManifest(dbpath) as manifest:
+        first = run_batch(str(tree), jobs=2, manifest=manifest)
+        assert first.skipped == 0
+        assert len(manifest) == 3  # every file with an AppleDouble file
+
+    # relabel one file: only that one is read again
+    write_sample(tree, "plain.jpg", color=5)
+    with ScanManifest(dbpath) as manifest:
+        second = run_batch(str(tree), jobs=2, manifest=manifest)
+    assert second.skipped == 2
+    assert second.colors == {"Red": 1, "Blue": 1, "Yellow": 1}
+
+    with ScanManifest(dbpath, full=True) as manifest:
+        assert run_batch(str(tree), jobs=2, manifest=manifest).skipped == 0
+
+
+def test_manifest_needs_matching_action(tree, tmp_path_factory):
+    dbpath = str(tmp_path_factory.mktemp("db") / "manifest.sqlite")
+    with ScanManifest(dbpath) as manifest:
+        run_batch(str(tree), action="color", jobs=1, manifest=manifest)
+        assert manifest.known(str(tree / "red.jpg"), "color") is not None
+        assert manifest.known(str(tree / "red.jpg"), "xattr") is None
+
+
+def test_applesingle_containers(tree):
+    from samba_labels.corpus import APPLESINGLE_MAGIC, DATA_FORK, FINDER_INFO, build_appledouble, finder_info
+    (tree / "single.jpg").write_bytes(build_appledouble(
+        [(FINDER_INFO, finder_info(3)), (DATA_FORK, b"data")], magic=APPLESINGLE_MAGIC))
+    summary = run_batch(str(tree), jobs=1, applesingle=True)
+    assert summary.counts == {"labeled": 3, "unlabeled": 1, "no_appledouble": 1, "error": 0}
+    assert summary.colors["Purple"] == 1
+
+
+@pytest.fixture
+def exiftool_log(tmp_path_factory, monkeypatch):
+    """ Put a fake exiftool on PATH that logs when it starts and stops; returns the log path """
+    bindir = tmp_path_factory.mktemp("bin")
+    log = bindir / "log"
+    script = FAKE_EXIFTOOL.replace("sys.exit(0)", "open(os.environ['FAKE_LOG'], 'a').write('stopped\\n'); sys.exit(0)")
+    (bindir / "exiftool").write_text(f"#!{sys.executable}\nimport os\n"
+                                     "open(os.environ['FAKE_LOG'], 'a').write('started\\n')\n" + script)
+    (bindir / "exiftool").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bindir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_LOG", str(log))
+    return log
+
+
+def test_workers_stop_their_exiftool(tree, exiftool_log):
+    summary = run_batch(str(tree), action="sidecar", jobs=3)
+    assert summary.counts["labeled"] == 2 and summary.counts["error"] == 0
+    lines = exiftool_log.read_text().split()
+    assert lines.count("started") >= 1
+    assert lines.count("stopped") == lines.count("started")
+
+
+def test_sidecar_writes_existing_upper_case_sidecar(tree, exiftool_log):
+    (tree / "red.jpg.XMP").write_text("<x/>")
+    items = {os.path.basename(i.filepath): i for i in scan_tree(str(tree))}
+    assert os.path.basename(items["red.jpg"].xmppath) == "red.jpg.XMP"
+    try:
+        assert process_file(items["red.jpg"], "sidecar")[1] == "labeled"
+    finally:
+        close_worker()
+    assert "-XMP-digiKam:ColorLabel=" in (tree / "red.jpg.XMP").read_text()
+    assert not (tree / "red.jpg.xmp").exists()
+
+
+def test_native_xmp_needs_no_exiftool(tree, tmp_path_factory, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path_factory.mktemp("empty")))   # no exiftool anywhere
+    (tree / "sub" / "blue.JPG.xmp").unlink()    # "<x/>" is beyond the native writer
+    summary = run_batch(str(tree), action="sidecar", jobs=2, native_xmp=True)
+    assert summary.counts == {"labeled": 2, "unlabeled": 1, "no_appledouble": 1, "error": 0}
+    assert "<digiKam:ColorLabel>" in (tree / "red.jpg.xmp").read_text()
+    assert (tree / "sub" / "blue.JPG.xmp").exists()
+
+
+def test_threads_share_one_exiftool_pool(exiftool_log):
+    import threading
+    from samba_labels import batch
+    batch.init_worker(logging.WARNING, exiftool_processes=3)
+    start = threading.Barrier(8)
+    pools = []
+
+    def get() -> None:
+        start.wait()
+        pools.append(batch._exiftool_pool())
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(set(map(id, pools))) == 1
+        assert len(pools[0].workers) == 3
+    finally:
+        close_worker()
+        batch.init_worker(logging.WARNING)
+    assert sorted(exiftool_log.read_text().split()) == ["started"] * 3 + ["stopped"] * 3
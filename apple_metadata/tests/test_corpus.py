@@ -0,0 +1,37 @@
+"""Tests for the synthetic corpus generator, checked against both parsers."""
+
+import os
+import random
+
+import pytest
+
+from samba_labels.apple_single_double import AppleSingleDouble
+from samba_labels.corpus import MALFORMED_KINDS, generate_corpus, malformed_appledouble, random_appledouble
+from samba_labels.processor import AppleDoubleMetadata
+
+
+def test_all_entry_types_parse():
+    data = random_appledouble(random.Random(1), "x.jpg", fork_size=100, all_types=True)
+    md = AppleDoubleMetadata.from_bytes(data)
+    assert sorted(md.entries) == list(range(1, 16))
+    assert md.entries[2]["length"] == 100
+    kt = AppleSingleDouble.from_bytes(data)
+    kt._read()
+    assert sorted(int(e.type) for e in kt.entries) == list(range(1, 16))
+
+
+@pytest.mark.parametrize("kind", [k for k in MALFORMED_KINDS if k not in ("bad_magic", "no_entries")])
+def test_malformed_files_are_rejected(kind):
+    with pytest.raises(ValueError):
+        md = AppleDoubleMetadata.from_bytes(malformed_appledouble(kind, random.Random(0)))
+        md.color
+
+
+def test_generate_corpus_is_deterministic(tmp_path):
+    a = generate_corpus(str(tmp_path / "a"), files=50, dirs=3, seed=7, large_fork_size=1024)
+    b = generate_corpus(str(tmp_path / "b"), files=50, dirs=3, seed=7, large_fork_size=1024)
+    assert repr(a) == repr(b)
+    assert a.files == 50
+    names = sorted(os.listdir(tmp_path / "a" / "dir0000"))
+    assert (tmp_path / "a" / "dir0000" / names[0]).read_bytes() == \
+        (tmp_path / "b" / "dir0000" / names[0]).read_bytes()
@@ -0,0 +1,144 @@
+"""Tests for the persistent exiftool pool, using a fake exiftool that speaks -stay_open."""
+
+import sys
+import textwrap
+
+import pytest
+
+from samba_labels.exiftooling import ExifToolPool, ExifToolProcess, ExifToolTarget, ExifToolCrashed
+
+FAKE_EXIFTOOL = textwrap.dedent("""\
+    import os, sys
+    args = []
+    for line in sys.stdin:
+        arg = line.rstrip("\\n")
+        if arg.startswith("-execute"):
+            seq = arg[len("-execute"):]
+            status = 0
+            if "CRASH" in args:
+                os._exit(3)
+            if "NOISY" in args:
+                sys.stderr.write("Warning: minor issue\\n" * 20000)   # far more than a pipe holds
+                sys.stderr.flush()
+            if "-ver" in args:
+                print("12.70")
+            elif "-o" in args:
+                out = args[args.index("-o") + 1]
+                if os.path.exists(out):
+                    status = 1
+                else:
+                    open(out, "w").write("<x:xmpmeta/>")
+                    print("    1 image files created")
+            elif "-overwrite_original" in args:
+                end = args.index("-echo4")
+                with open(args[end - 1], "a") as f:
+                    f.write(args[end - 2] + "\\n")
+                print("    1 image files updated")
+            if "-echo4" in args:
+                echo = args[args.index("-echo4") + 1].replace("${status}", str(status))
+                sys.stderr.write(echo + "\\n")
+                sys.stderr.flush()
+            print("{ready%s}" % seq, flush=True)
+            args = []
+        elif args[-1:] == ["-stay_open"] and arg == "False":
+            sys.exit(0)
+        else:
+            args.append(arg)
+""")
+
+
+@pytest.fixture
+def fake_exiftool(tmp_path):
+    script = tmp_path / "exiftool"
+    script.write_text(f"#!{sys.executable}\n" + FAKE_EXIFTOOL)
+    script.chmod(0o755)
+    return str(script)
+
+
+def test_process_execute_and_ping(fake_exiftool):
+    p = ExifToolProcess(fake_exiftool)
+    p.start()
+    try:
+        status, out, err = p.execute("-ver")
+        assert (status, out.strip(), err) == (0, "12.70", "")
+        assert p.ping()
+        assert p.commands_run == 2
+    finally:
+        p.stop()
+    assert not p.alive()
+
+
+def test_process_drains_stderr(fake_exiftool):
+    p = ExifToolProcess(fake_exiftool)
+    p.start()
+    try:
+        status, out, err = p.execute("NOISY", "-ver")
+        assert (status, out.strip()) == (0, "12.70")
+        assert err.count("Warning: minor issue") == 20000
+        assert p.execute("-ver")[2] == ""    # nothing left over for the next command
+    finally:
+        p.stop()
+
+
+def test_process_reports_crash(fake_exiftool):
+    p = ExifToolProcess(fake_exiftool)
+    p.start()
+    with pytest.raises(ExifToolCrashed):
+        p.execute("CRASH")
+    p.stop()
+
+
+def test_pool_restarts_crashed_worker(fake_exiftool):
+    with ExifToolPool(2, executable=fake_exiftool) as pool:
+        pool.workers[0].proc.kill()
+        pool.workers[0].proc.wait()
+        assert pool.check_health() == 1
+        assert all(w.alive() for w in pool.workers)
+        with pytest.raises(ExifToolCrashed):
+            pool.execute("CRASH")  # crashes again on the retry
+        assert pool.restarts == 2
+        assert pool.execute("-ver")[0] == 0
+
+
+def test_target_uses_pool(fake_exiftool, tmp_path):
+    photo = tmp_path / "a.jpg"
+    photo.write_bytes(b"jpeg")
+    with ExifToolPool(1, executable=fake_exiftool) as pool:
+        target = ExifToolTarget(str(photo), pool=pool)
+        assert target.write_field_value("XMP-digiKam:ColorLabel", 5)
+        assert target.hassidecar.value is True
+        assert pool.workers[0].commands_run == 2
+    assert "-XMP-digiKam:ColorLabel=5" in (tmp_path / "a.jpg.xmp").read_text()
+
+
+def test_target_native_xmp_falls_back_to_pool(fake_exiftool, tmp_path):
+    photo = tmp_path / "a.jpg"
+    photo.write_bytes(b"jpeg")
+    with ExifToolPool(1, executable=fake_exiftool) as pool:
+        target = ExifToolTarget(str(photo), pool=pool, native_xmp=True)
+        assert target.write_field_value("XMP-digiKam:ColorLabel", 5)
+        assert pool.workers[0].commands_run == 0  # written in-process
+        (tmp_path / "a.jpg.xmp").write_text("garbage")
+        assert target.write_field_value("XMP-digiKam:ColorLabel", 2)
+        assert pool.workers[0].commands_run == 1  # unparseable, so exiftool wrote it
+
+
+def test_target_gets_pool_only_for_fallback(fake_exiftool, tmp_path):
+    photo = tmp_path / "a.jpg"
+    photo.write_bytes(b"jpeg")
+    pools = []
+
+    def get_pool():
+        pools.append(ExifToolPool(1, executable=fake_exiftool))
+        return pools[-1]
+
+    target = ExifToolTarget(str(photo), native_xmp=True, get_pool=get_pool)
+    assert target.write_field_value("XMP-digiKam:ColorLabel", 5)
+    assert pools == []  # written in-process, no exiftool started
+    (tmp_path / "a.jpg.xmp").write_text("garbage")
+    try:
+        assert target.write_field_value("XMP-digiKam:ColorLabel", 2)
+        assert len(pools) == 1 and pools[0].workers[0].commands_run == 1
+    finally:
+        for pool in pools:
+            pool.close()
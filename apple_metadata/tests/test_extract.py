@@ -0,0 +1,99 @@
+"""Tests for samba_labels.extract."""
+
+import os
+
+import pytest
+
+from samba_labels import extract
+from samba_labels.corpus import COMMENT, FINDER_INFO, ICON_BW, RESOURCE_FORK, build_appledouble, finder_info
+from samba_labels.extract import copy_range, extract_tree, is_type_name
+from tests.samples import write_sample
+
+
+def test_copy_range_every_method(tmp_path, monkeypatch):
+    src = tmp_path / "src"
+    src.write_bytes(os.urandom(3 * 1024 + 7))
+    monkeypatch.setattr(extract, "CHUNK_SIZE", 1000)    # several calls per copy
+    for name, method in extract.COPY_METHODS:
+        monkeypatch.setattr(extract, "COPY_METHODS", [(name, method)])
+        dst = tmp_path / f"dst_{name}"
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            os.write(d.fileno(), b"x")
+            assert copy_range(s.fileno(), d.fileno(), 100, 2900) == 2900
+            assert copy_range(s.fileno(), d.fileno(), 3000, 500) == 3 * 1024 + 7 - 3000   # short
+        assert dst.read_bytes() == b"x" + src.read_bytes()[100:3000] + src.read_bytes()[3000:]
+
+
+def test_copy_range_falls_back(tmp_path, monkeypatch):
+    def unsupported(*args):
+        raise OSError(extract.errno.EXDEV, "cross-device")
+    monkeypatch.setattr(extract, "COPY_METHODS", [("broken", unsupported), ("pread", extract._pread_write)])
+    src = tmp_path / "src"
+    src.write_bytes(b"0123456789")
+    with open(src, "rb") as s, open(tmp_path / "dst", "wb") as d:
+        assert copy_range(s.fileno(), d.fileno(), 2, 5) == 5
+    assert (tmp_path / "dst").read_bytes() == b"23456"
+
+
+def test_extract_tree(tmp_path):
+    root = tmp_path / "photos"
+    (root / "sub").mkdir(parents=True)
+    fork = os.urandom(300_000)
+    write_sample(root / "sub", "a.jpg", color=2, resource_fork=fork)
+    (root / "b.jpg").write_bytes(b"data")
+    (root / "._b.jpg").write_bytes(build_appledouble([(FINDER_INFO, finder_info(3)), (COMMENT, b"hello"),
+                                                      (ICON_BW, bytes(128)), (RESOURCE_FORK, b"")]))
+    write_sample(root, "bare.jpg", color=None)
+    write_sample(root, "plain.jpg", color=1)                    # empty resource fork
+    (root / "bad.jpg").write_bytes(b"data")
+    (root / "._bad.jpg").write_bytes(build_appledouble([(RESOURCE_FORK, b"abc")])[:-1])
+
+    out = tmp_path / "out"
+    summary = extract_tree(str(root), str(out), jobs=2)
+    assert summary.counts == {"extracted": 2, "nothing": 1, "no_appledouble": 1, "error": 1}
+    assert (out / "sub" / "a.jpg.resource_fork").read_bytes() == fork
+    assert (out / "b.jpg.comment").read_bytes() == b"hello"
+    assert (out / "b.jpg.icon_bw").read_bytes() == bytes(128)
+    assert not (out / "b.jpg.resource_fork").exists()
+    assert summary.files == 3
+    assert summary.nbytes == len(fork) + 5 + 128
+
+
+def test_extract_single_file_and_types(tmp_path):
+    path = write_sample(tmp_path, "a.jpg", color=2, fork_size=10)
+    out = tmp_path / "out"
+    summary = extract_tree(path, str(out), types=["finder_info"])
+    assert summary.counts["extracted"] == 1
+    assert len((out / "a.jpg.finder_info").read_bytes()) == 32
+
+
+def test_type_names():
+    assert is_type_name("resource_fork") and is_type_name("icon_color")
+    assert is_type_name("entry_16")
+    assert not is_type_name("entry_2")          # that one is resource_fork
+    assert not is_type_name("resource-fork")
+    assert not is_type_name("entry_")
+
+
+def test_failed_copy_leaves_no_output(tmp_path, monkeypatch):
+    adpath = tmp_path / "._a.jpg"
+    adpath.write_bytes(build_appledouble([(COMMENT, b"hello"), (RESOURCE_FORK, b"x" * 1000)]))
+    outbase = str(tmp_path / "a.jpg")
+    real = extract.copy_range
+
+    def short(src, dst, offset, length):
+        # as if the AppleDouble file shrank after it was measured
+        return real(src, dst, offset, length - 1 if length == 1000 else length)
+    monkeypatch.setattr(extract, "copy_range", short)
+    with pytest.raises(ValueError, match="Short copy of resource_fork"):
+        extract.extract_entries(str(adpath), outbase, ("comment", "resource_fork"))
+    assert not os.path.exists(outbase + ".resource_fork")
+    assert (tmp_path / "a.jpg.comment").read_bytes() == b"hello"     # complete, so kept
+
+    def failing(src, dst, offset, length):
+        os.write(dst, b"partial")
+        raise OSError(extract.errno.EIO, "I/O error")
+    monkeypatch.setattr(extract, "copy_range", failing)
+    with pytest.raises(OSError):
+        extract.extract_entries(str(adpath), outbase, ("resource_fork",))
+    assert not os.path.exists(outbase + ".resource_fork")
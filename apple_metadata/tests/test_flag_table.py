@@ -0,0 +1,49 @@
+"""Tests for samba_labels.flag_table."""
+
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from samba_labels.flag_table import FLAG_BITS, decode_flags, scan_flag_table
+from samba_labels.processor import finder_color_from_flags
+from samba_labels.utility import FinderFlags
+from samba_labels.corpus import FINDER_INFO, build_appledouble, finder_info, write_appledouble_pair
+
+
+def test_decode_flags_matches_scalar_decode():
+    words = np.arange(0, 1 << 16, 7, dtype=np.uint16)
+    columns = decode_flags(words)
+    expected = [int(finder_color_from_flags(int(w)) or 0) for w in words]
+    assert columns["color"].tolist() == expected
+    assert columns["is_invisible"].tolist() == [bool(w & 0x4000) for w in words]
+    assert set(columns) == {"color"} | {b.name for b in FLAG_BITS}
+
+
+def test_scan_flag_table(tmp_path):
+    write_appledouble_pair(tmp_path, "red.jpg", color=6)
+    write_appledouble_pair(tmp_path, "red2.jpg", color=6)
+    write_appledouble_pair(tmp_path, "plain.jpg", color=0)
+    write_appledouble_pair(tmp_path, "bare.jpg", color=None)
+    (tmp_path / "hidden.jpg").write_bytes(b"data")
+    flags = FinderFlags.is_invisible | FinderFlags.is_alias
+    (tmp_path / "._hidden.jpg").write_bytes(build_appledouble([(FINDER_INFO, finder_info(4, flags))]))
+    (tmp_path / "broken.jpg").write_bytes(b"data")
+    (tmp_path / "._broken.jpg").write_bytes(b"\x00\x05")
+
+    table = scan_flag_table(str(tmp_path), jobs=2)
+    assert len(table) == 4
+    assert [p for p, _ in table.errors] == [str(tmp_path / "broken.jpg")]
+    assert table.color_counts() == {"": 1, "Blue": 1, "Red": 2}
+    assert table.flag_counts()["is_invisible"] == 1
+    assert table.flag_counts()["is_alias"] == 1
+    groups = table.group_by_color()
+    assert sorted(groups["Red"].tolist()) == [str(tmp_path / "red.jpg"), str(tmp_path / "red2.jpg")]
+    assert len(table.select(table["color"] == 6)) == 2
+
+    out = io.StringIO()
+    table.to_csv(out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith("path,has_finder_info,flags,color,")
+    assert len(lines) == 5
@@ -0,0 +1,55 @@
+"""Tests for samba_labels.inventory."""
+
+import csv
+import io
+import json
+import struct
+
+from samba_labels.corpus import FILE_DATES_INFO, FINDER_INFO, RESOURCE_FORK, build_appledouble, finder_info
+from samba_labels.inventory import appledouble_date, export_inventory
+from tests.samples import write_sample
+
+
+def test_appledouble_date():
+    assert appledouble_date(0) == "2000-01-01T00:00:00+00:00"
+    assert appledouble_date(-86400) == "1999-12-31T00:00:00+00:00"
+    assert appledouble_date(-0x80000000) is None
+
+
+def make_tree(tmp_path):
+    write_sample(tmp_path, "red.jpg", color=6)
+    write_sample(tmp_path, "bare.mov", color=None)
+    dates = struct.pack(">iiii", 86400, 172800, -0x80000000, 0)
+    (tmp_path / "dated.tif").write_bytes(b"data")
+    (tmp_path / "._dated.tif").write_bytes(build_appledouble(
+        [(FINDER_INFO, finder_info(4, file_type=b"TIFF", creator=b"prvw")),
+         (FILE_DATES_INFO, dates), (RESOURCE_FORK, bytes(1000))]))
+    (tmp_path / "broken.jpg").write_bytes(b"data")
+    (tmp_path / "._broken.jpg").write_bytes(b"\x00\x05\x16")
+    return tmp_path
+
+
+def test_jsonl_inventory(tmp_path):
+    root = make_tree(tmp_path)
+    out = io.StringIO()
+    assert export_inventory(str(root), out) == 3
+    records = {json.loads(line)["path"].rsplit("/", 1)[1]: json.loads(line)
+               for line in out.getvalue().splitlines()}
+    assert set(records) == {"red.jpg", "dated.tif", "broken.jpg"}
+    dated = records["dated.tif"]
+    assert (dated["file_type"], dated["creator"], dated["color"]) == ("TIFF", "prvw", "Blue")
+    assert dated["created"] == "2000-01-02T00:00:00+00:00"
+    assert dated["backup"] is None
+    assert [e["type"] for e in dated["entries"]] == ["finder_info", "file_dates_info", "resource_fork"]
+    assert records["red.jpg"]["color"] == "Red"
+    assert records["broken.jpg"]["error"].startswith("ValueError")
+
+
+def test_csv_inventory_with_bare_files(tmp_path):
+    root = make_tree(tmp_path)
+    out = io.StringIO()
+    assert export_inventory(str(root), out, "csv", include_bare=True, jobs=1) == 4
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert [r["path"].rsplit("/", 1)[1] for r in rows] == ["bare.mov", "broken.jpg", "dated.tif", "red.jpg"]
+    assert rows[0]["appledouble"] == ""
+    assert rows[2]["entries"].startswith("finder_info@62+32;file_dates_info@94+16;")
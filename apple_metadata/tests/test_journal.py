@@ -0,0 +1,132 @@
+"""Tests for samba_labels.journal and resuming batch runs."""
+
+import errno
+import json
+
+import pytest
+
+from samba_labels import batch as batch_module
+from samba_labels.aio import run_async
+from samba_labels.batch import FileResult, process_file, run_batch
+from samba_labels.cli import batch
+from samba_labels.journal import Journal, JournalMismatch, RetryPolicy
+from samba_labels.scanner import scan_tree
+from tests.samples import write_sample
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "share"
+    (root / "sub").mkdir(parents=True)
+    for d in (root, root / "sub"):
+        for i in range(6):
+            write_sample(d, f"img{i}.jpg", color=(None if i == 5 else i + 1))
+    return root
+
+
+def test_journal_reload(tmp_path):
+    path = str(tmp_path / "j")
+    with Journal(path, "/share", "xattr", every=2) as j:
+        assert not j.resumed
+        j.record("/share/a.jpg", "labeled")
+        j.record("/share/b.jpg", "error", "OSError: boom")
+        j.record("/share/c.jpg", "error", "OSError: boom")
+        j.record("/share/c.jpg", "labeled")
+
+    # a crash mid-write leaves a torn line, which is dropped
+    with open(path, "ab") as f:
+        f.write(b'{"path": "d.jp')
+    with Journal(path, "/share", "xattr") as j:
+        assert j.resumed
+        assert j.done == {"a.jpg", "c.jpg"}
+        assert j.failed == {"b.jpg": "OSError: boom"}
+        assert j.is_done("/share/a.jpg") and not j.is_done("/share/b.jpg")
+        j.record("/share/b.jpg", "unlabeled")
+    assert Journal(path, "/share", "xattr").failed == {}
+
+    with pytest.raises(JournalMismatch):
+        Journal(path, "/share", "sidecar")
+    with pytest.raises(JournalMismatch):
+        Journal(path, "/mnt/share", "xattr")     # another tree: its files weren't done
+
+
+@pytest.mark.parametrize("line", [b'{"path": "b.jpg"}\n', b'{"status": "labeled"}\n', b'[1, 2]\n'])
+def test_journal_ignores_incomplete_records(tmp_path, line):
+    path = str(tmp_path / "j")
+    with Journal(path, "/share", "xattr") as j:
+        j.record("/share/a.jpg", "labeled")
+    with open(path, "ab") as f:
+        f.write(line + b'{"path": "c.jpg", "status": "labeled"}\n')
+    with Journal(path, "/share", "xattr") as j:
+        assert j.done == {"a.jpg"}      # cut off at the incomplete record, like a torn line
+        j.record("/share/d.jpg", "labeled")
+    assert Journal(path, "/share", "xattr").done == {"a.jpg", "d.jpg"}
+
+
+def test_retry_policy():
+    policy = RetryPolicy(attempts=3, delay=1.0, max_delay=3.0)
+    assert policy.should_retry(errno.EIO, 1) and policy.should_retry(errno.ETIMEDOUT, 2)
+    assert not policy.should_retry(errno.EIO, 3)
+    assert not policy.should_retry(errno.EACCES, 1)
+    assert not policy.should_retry(None, 1)
+    assert 0.9 <= policy.wait(1) <= 1.0
+    assert 2.7 <= policy.wait(3) <= 3.0    # capped
+
+
+def test_process_file_retries_transient_errors(tree, monkeypatch):
+    item = next(i for i in scan_tree(str(tree)) if i.filepath.endswith("img0.jpg"))
+    real = batch_module._process_file
+    calls = []
+
+    def flaky(item, action, known):
+        calls.append(item.filepath)
+        if len(calls) < 3:
+            return FileResult(item.filepath, "error", "OSError: timed out", error_code=errno.ETIMEDOUT)
+        return real(item, action, known)
+    monkeypatch.setattr(batch_module, "_process_file", flaky)
+
+    result = process_file(item, "color", retry=RetryPolicy(attempts=3, delay=0))
+    assert result.status == "labeled" and result.attempts == 3
+    assert result.metrics.counters["retries"] == 2
+
+    calls.clear()
+    assert process_file(item, "color").status == "error"
+    assert len(calls) == 1
+
+
+def test_batch_resumes(tree, tmp_path):
+    path = str(tmp_path / "journal")
+    with Journal(path, str(tree), "color") as j:
+        j.record(str(tree / "img0.jpg"), "labeled")
+        j.record(str(tree / "img1.jpg"), "error", "OSError: boom")
+    with Journal(path, str(tree), "color") as j:
+        summary = run_batch(str(tree), jobs=2, journal=j)
+    assert summary.resumed == 1
+    assert summary.total == 11
+    assert len(Journal(path, str(tree), "color").done) == 12
+
+    with Journal(path, str(tree), "color") as j:
+        summary = run_async(str(tree), concurrency=4, journal=j)
+    assert (summary.resumed, summary.total) == (12, 0)
+
+
+def test_batch_command_journal(tree, tmp_path, capsys):
+    path = str(tmp_path / "journal")
+    assert batch(["batch", str(tree), "--journal", path, "--retries", "2", "-j", "2"]) == 0
+    assert "Processed 12 files" in capsys.readouterr().out
+    assert batch(["batch", str(tree), "--journal", path, "--async"]) == 0
+    out = capsys.readouterr().out
+    assert "Resuming from" in out and "(already done)" in out
+    assert batch(["batch", str(tree), "--journal", path, "--action", "xattr"]) == 2
+    assert batch(["batch", str(tree / "sub"), "--journal", path]) == 2
+    assert "not " + repr(str(tree / "sub")) in capsys.readouterr().err
+
+
+def test_batch_command_journal_json_stdout(tree, tmp_path, capsys):
+    path = str(tmp_path / "journal")
+    assert batch(["batch", str(tree), "--journal", path, "-j", "2"]) == 0
+    capsys.readouterr()
+    assert batch(["batch", str(tree), "--journal", path, "-j", "2", "--json", "-"]) == 0
+    captured = capsys.readouterr()
+    assert json.loads(captured.out)["resumed"] == 12
+    assert "Resuming from" in captured.err
@@ -0,0 +1,62 @@
+"""Tests for the samba-labels entry point in samba_labels.__main__."""
+
+import io
+import os
+import subprocess
+import sys
+
+from samba_labels.__main__ import COMMANDS, iter_stdin_paths, load_command, main, run_per_file
+from tests.samples import write_sample
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+
+class FakeStdin(io.StringIO):
+    def isatty(self) -> bool:
+        return False
+
+
+def test_every_command_loads():
+    for name in COMMANDS:
+        assert callable(load_command(name))
+
+
+def test_iter_stdin_paths():
+    assert list(iter_stdin_paths(io.StringIO("a b\nc\n\nd"))) == ["a b", "c", "d"]
+    assert list(iter_stdin_paths(io.StringIO("a\nb\0c\0"), null=True)) == ["a\nb", "c"]
+
+
+def test_many_paths_and_stdin(tmp_path, capsys):
+    red = write_sample(tmp_path, "red.jpg", color=6)
+    blue = write_sample(tmp_path, "blue.jpg", color=4)
+
+    assert main(["samba-labels", "print_finder_color", red, blue]) == 0
+    assert capsys.readouterr().out.splitlines() == ["red.jpg: Red", "blue.jpg: Blue"]
+
+    stdin = FakeStdin(f"{blue}\0{red}\0")
+    assert run_per_file("print_finder_color", ["-0"], stdin) == 0
+    assert capsys.readouterr().out.splitlines() == ["blue.jpg: Blue", "red.jpg: Red"]
+
+
+def test_failure_does_not_stop_the_rest(tmp_path, capsys):
+    red = write_sample(tmp_path, "red.jpg", color=6)
+    missing = str(tmp_path / "missing.jpg")
+    assert main(["samba-labels", "print_finder_color", missing, red]) == 1
+    out, err = capsys.readouterr()
+    assert out.splitlines() == ["red.jpg: Red"]
+    assert missing in err
+
+
+def test_unknown_command():
+    assert main(["samba-labels", "nope"]) == 2
+
+
+def test_startup_imports_stay_light():
+    """ Loading the entry point and the per-file reader must not pull in the heavy modules """
+    code = ("import sys; from samba_labels.__main__ import load_command; "
+            "load_command('print_finder_color'); "
+            "print(' '.join(m for m in ('xattr', 'kaitaistruct', 'tribool', 'numpy', 'plistlib', "
+            "'samba_labels.exiftooling', 'samba_labels.batch') if m in sys.modules))")
+    env = dict(os.environ, PYTHONPATH=SRC)
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
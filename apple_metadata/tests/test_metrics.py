@@ -0,0 +1,78 @@
+"""Tests for samba_labels.metrics."""
+
+import json
+import threading
+
+from samba_labels import metrics
+from samba_labels.batch import run_batch
+from samba_labels.cli import batch
+from samba_labels.metrics import Histogram, Metrics
+from tests.samples import write_sample
+
+
+def test_histogram_buckets_and_quantiles():
+    hist = Histogram()
+    for v in (0, 1, 3, 100, 1000):
+        hist.add(v)
+    assert hist.buckets == {0: 1, 1: 1, 2: 1, 7: 1, 10: 1}
+    assert (hist.count, hist.min, hist.max) == (5, 0, 1000)
+    assert hist.quantile(0.5) == 3
+    assert hist.quantile(1.0) == 1000
+
+
+def test_metrics_merge():
+    a, b = Metrics(), Metrics()
+    a.add_time("read", 1.0)
+    a.count("bytes_read", 10)
+    b.add_time("read", 0.5)
+    b.count("bytes_read", 5)
+    b.observe("file_latency_us", 40)
+    a.merge(b)
+    assert a.timers == {"read": 1.5} and a.calls == {"read": 2}
+    assert a.counters == {"bytes_read": 15}
+    assert a.histograms["file_latency_us"].count == 1
+    json.dumps(a.to_dict())
+
+
+def test_collecting_is_per_thread():
+    seen = {}
+
+    def work(name, n):
+        with metrics.collecting() as m:
+            for _ in range(n):
+                metrics.count("calls")
+        seen[name] = m.counters["calls"]
+
+    threads = [threading.Thread(target=work, args=(i, 100 * (i + 1))) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert seen == {0: 100, 1: 200, 2: 300, 3: 400}
+
+
+def test_batch_metrics_and_json(tmp_path, capsys):
+    root = tmp_path / "tree"
+    root.mkdir()
+    write_sample(root, "red.jpg", color=6)
+    write_sample(root, "bare.mov", color=None)
+
+    summary = run_batch(str(root), jobs=1)
+    assert summary.metrics.calls["read"] == 1
+    assert summary.metrics.counters["bytes_read"] > 0
+    assert summary.metrics.counters["directories"] == 1
+    assert summary.metrics.histograms["file_latency_us"].count == 2
+
+    out = tmp_path / "summary.json"
+    prof = tmp_path / "run.prof"
+    assert batch(["batch", str(root), "-j", "1", "--json", str(out), "--profile", str(prof)]) == 0
+    data = json.loads(out.read_text())
+    assert data["counts"]["labeled"] == 1
+    assert "read" in data["metrics"]["stages"]
+    assert prof.stat().st_size > 0
+
+    capsys.readouterr()
+    assert batch(["batch", str(root), "-j", "1", "--stats", "--json", "-"]) == 0
+    captured = capsys.readouterr()
+    assert json.loads(captured.out)["counts"]["labeled"] == 1   # nothing but the JSON
+    assert "Processed 2 files" in captured.err
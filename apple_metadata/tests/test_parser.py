@@ -0,0 +1,81 @@
+"""Tests for samba_labels.parser."""
+
+import io
+import random
+
+import pytest
+from kaitaistruct import KaitaiStream
+
+from samba_labels import parser
+from samba_labels.apple_single_double import AppleSingleDouble
+from samba_labels.corpus import (MALFORMED_KINDS, FILE_DATES_INFO, FINDER_INFO, appledouble_bytes,
+                                 build_appledouble, finder_info, malformed_appledouble, random_appledouble,
+                                 user_tags_value)
+
+
+def test_parse_finder_info_and_dates():
+    data = build_appledouble([(FINDER_INFO, finder_info(5, 0x4000, b"TEXT", b"ttxt", (-3, 7), 2)),
+                              (FILE_DATES_INFO, parser.FILE_DATES.pack(1, 2, -0x80000000, 4))])
+    f = parser.parse(data)
+    assert f.header.magic == b"\x00\x05\x16\x07"
+    assert [e.type for e in f.entries] == [FINDER_INFO, FILE_DATES_INFO]
+    fi = f.finder_info
+    assert (fi.file_type, fi.creator, fi.flags, fi.location, fi.folder_id) == \
+        (b"TEXT", b"ttxt", 0x4000 | 5 << 1, (-3, 7), 2)
+    assert fi.colorval == 5
+    assert f.file_dates == parser.FileDates(1, 2, -0x80000000, 4)
+    assert isinstance(f.body(f.entries[0]), memoryview)
+
+
+def test_attrs_and_user_tags():
+    tags = user_tags_value([("Green", 2), ("todo", 0)])
+    data = appledouble_bytes(2, b"fork", attrs=[("a", b"1"), ("com.apple.FinderInfo.x", b"22"),
+                                                (parser.USER_TAGS, tags)])
+    f = parser.parse(data)
+    assert [(a.name, a.length) for a in f.attrs] == [("a", 1), ("com.apple.FinderInfo.x", 2),
+                                                      (parser.USER_TAGS, len(tags))]
+    assert bytes(f.attr("com.apple.FinderInfo.x")) == b"22"
+    assert f.attr("missing") is None
+    assert f.user_tags == [parser.UserTag("Green", 2), parser.UserTag("todo", 0)]
+    assert f.finder_info.colorval == 2
+
+    assert parser.parse(appledouble_bytes(2)).attrs == []
+    assert parser.parse(appledouble_bytes(2, attrs=[("a", b"1")])).user_tags is None
+    with pytest.raises(ValueError):
+        parser.parse_user_tags(b"not a plist")
+
+
+def test_attrs_truncated():
+    data = bytearray(appledouble_bytes(1, attrs=[("a", b"1"), ("b", b"2")]))
+    data[26 + 8:26 + 12] = (32 + 2 + 36 + 4).to_bytes(4, "big")     # finder_info cut inside the table
+    with pytest.raises(ValueError):
+        parser.parse(bytes(data)).attrs
+
+
+@pytest.mark.parametrize("kind", MALFORMED_KINDS)
+def test_malformed(kind):
+    data = malformed_appledouble(kind, random.Random(1))
+    if kind in ("bad_magic", "no_entries"):
+        parser.parse(data)    # structurally fine
+    else:
+        with pytest.raises(ValueError):
+            f = parser.parse(data)
+            f.finder_info
+
+
+def test_matches_kaitai():
+    rng = random.Random(7)
+    for i in range(200):
+        data = random_appledouble(rng, f"f{i}", fork_size=rng.randrange(0, 300), all_types=i % 4 == 0)
+        ad = AppleSingleDouble(KaitaiStream(io.BytesIO(data)))
+        ad._read()
+        f = parser.parse(data)
+        assert (int(ad.magic), ad.version, ad.reserved) == \
+            (int.from_bytes(f.header.magic, "big"), f.header.version, f.header.filler)
+        for ke, pe in zip(ad.entries, f.entries):
+            assert (int(ke.type), ke.ofs_body, ke.len_body) == tuple(pe)
+            if pe.type == FINDER_INFO:
+                assert ke.body.flags == f.finder_info.flags
+                assert ke._raw__m_body == bytes(f.body(pe))
+            else:
+                assert ke.body == bytes(f.body(pe))
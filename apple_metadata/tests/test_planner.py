@@ -0,0 +1,67 @@
+"""Tests for samba_labels.planner."""
+
+import os
+
+import pytest
+import xattr
+
+from samba_labels.cli import set_color_sidecar
+from samba_labels.planner import Change, apply_plan, plan_tree
+from samba_labels.xmp_sidecar import read_color_label, write_color_label
+from tests.samples import write_sample
+
+
+@pytest.fixture
+def tree(tmp_path):
+    write_sample(tmp_path, "same.jpg", color=6)                 # Finder Red
+    write_color_label(str(tmp_path / "same.jpg.xmp"), 1)       # digiKam Red
+    write_sample(tmp_path, "stale.jpg", color=4)                # Finder Blue
+    write_color_label(str(tmp_path / "stale.jpg.xmp"), 1)
+    write_sample(tmp_path, "new.jpg", color=2)                  # Finder Green, no sidecar
+    write_sample(tmp_path, "cleared.jpg", color=0)
+    write_color_label(str(tmp_path / "cleared.jpg.xmp"), 3)
+    write_sample(tmp_path, "bare.jpg", color=None)
+    return tmp_path
+
+
+def test_plan_sidecars(tree):
+    plan = plan_tree(str(tree), ["sidecar"], jobs=2)
+    assert plan.counts == {"labeled": 3, "unlabeled": 1, "no_appledouble": 1, "error": 0}
+    assert plan.changes == [
+        Change(str(tree / "new.jpg"), "sidecar", None, "4", None),
+        Change(str(tree / "stale.jpg"), "sidecar", "1", "5", str(tree / "stale.jpg.xmp")),
+    ]
+    assert str(plan.changes[0]) == f"{tree / 'new.jpg'}: sidecar - -> 4"
+
+    cleared = plan_tree(str(tree), ["sidecar"], clear=True)
+    assert [(os.path.basename(c.path), c.old, c.new) for c in cleared.changes] == [
+        ("cleared.jpg", "3", "0"), ("new.jpg", None, "4"), ("stale.jpg", "1", "5")]
+
+
+def test_apply_only_writes_deltas(tree):
+    same = tree / "same.jpg.xmp"
+    mtime = same.stat().st_mtime_ns
+    plan = plan_tree(str(tree), ["sidecar"])
+    assert apply_plan(plan, jobs=2, native_xmp=True) == []
+    assert read_color_label(str(tree / "stale.jpg.xmp")) == 5
+    assert read_color_label(str(tree / "new.jpg.xmp")) == 4
+    assert same.stat().st_mtime_ns == mtime
+    assert plan_tree(str(tree), ["sidecar"]).changes == []
+
+
+def test_plan_xattrs(tree):
+    try:
+        xattr.setxattr(str(tree / "cleared.jpg"), "user.color", b"Yellow")
+    except OSError:
+        pytest.skip("filesystem does not support user xattrs")
+    xattr.setxattr(str(tree / "same.jpg"), "user.color", b"Red")
+    plan = plan_tree(str(tree), ["xattr"], clear=True)
+    assert [(os.path.basename(c.path), c.old, c.new) for c in plan.changes] == [
+        ("cleared.jpg", "Yellow", None), ("new.jpg", None, "Green"), ("stale.jpg", None, "Blue")]
+    assert apply_plan(plan) == []
+    assert plan_tree(str(tree), ["xattr"], clear=True).changes == []
+
+
+def test_set_color_sidecar_skips_matching_sidecar(tree):
+    # exiftool isn't needed (or run) when the sidecar already has the label
+    assert set_color_sidecar(["set_color_sidecar", str(tree / "same.jpg")]) == 0
@@ -0,0 +1,41 @@
+"""Tests for samba_labels.pooling."""
+
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from samba_labels.pooling import QUEUE_DEPTH, bounded_map
+from tests.test_main import SRC
+
+
+@pytest.mark.parametrize("ordered", [False, True])
+def test_bounded_map_limits_what_is_queued(ordered):
+    submitted = 0
+
+    def items():
+        nonlocal submitted
+        for i in range(100):
+            submitted += 1
+            yield i
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = []
+        for n in bounded_map(pool, lambda i: i * 2, items(), 2, inline=lambda i: i % 10 == 0, ordered=ordered):
+            assert submitted - len(results) <= 2 * QUEUE_DEPTH
+            results.append(n)
+    assert sorted(results) == list(range(0, 200, 2))
+    if ordered:
+        assert results == list(range(0, 200, 2))
+
+
+def test_import_stays_light():
+    """ The modules that share bounded_map() must not pull in batch.py's imports through it """
+    code = ("import sys; import samba_labels.pooling; "
+            "print(' '.join(m for m in ('multiprocessing', 'xattr', 'samba_labels.batch', "
+            "'samba_labels.exiftooling') if m in sys.modules))")
+    env = dict(os.environ, PYTHONPATH=SRC)
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
@@ -1,3 +1,155 @@
 """Test module for the samba_labels package."""
 
+import struct
+
 import pytest
+
+from samba_labels.corpus import (APPLESINGLE_MAGIC, DATA_FORK, FINDER_INFO, build_appledouble, finder_info,
+                                 user_tags_value)
+from samba_labels.parser import USER_TAGS, UserTag
+from samba_labels.processor import (AppleDoubleMetadata, NotAppleSingle, find_appledouble,
+                                    read_finder_color, read_finder_flags, read_finder_flags_fd,
+                                    read_record, read_user_tags)
+from tests.samples import appledouble_bytes, write_sample
+
+Colors = AppleDoubleMetadata.Entry.Colors
+
+
+@pytest.mark.parametrize("color", list(Colors))
+def test_metadata_color(tmp_path, color):
+    path = write_sample(tmp_path, "a.jpg", color=int(color))
+    assert AppleDoubleMetadata(path).color == color
+    assert read_finder_color(path) == color
+
+
+def test_unset_color(tmp_path):
+    path = write_sample(tmp_path, "a.jpg", color=0)
+    assert not AppleDoubleMetadata(path).color
+    assert read_finder_color(path) is None
+
+
+def test_missing_appledouble(tmp_path):
+    path = write_sample(tmp_path, "a.jpg", color=None)
+    with pytest.raises(FileNotFoundError):
+        AppleDoubleMetadata(path)
+    with pytest.raises(FileNotFoundError):
+        read_finder_color(path)
+
+
+@pytest.mark.parametrize("sidecar", ["%a.jpg", "R.a.jpg", ".AppleDouble/a.jpg"])
+def test_legacy_sidecars(tmp_path, sidecar):
+    path = write_sample(tmp_path, "a.jpg", color=None)
+    (tmp_path / ".AppleDouble").mkdir()
+    (tmp_path / sidecar).write_bytes(appledouble_bytes(5))
+    assert find_appledouble(path) == str(tmp_path / sidecar)
+    assert AppleDoubleMetadata(path).color == Colors.Yellow
+    assert read_finder_color(path) == Colors.Yellow
+
+
+def test_modern_sidecar_preferred(tmp_path):
+    path = write_sample(tmp_path, "a.jpg", color=2)
+    (tmp_path / "%a.jpg").write_bytes(appledouble_bytes(5))
+    assert find_appledouble(path) == str(tmp_path / "._a.jpg")
+
+
+def test_applesingle(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(build_appledouble([(FINDER_INFO, finder_info(6)), (DATA_FORK, b"jpeg" * 100)],
+                                       magic=APPLESINGLE_MAGIC))
+    assert find_appledouble(str(path)) == str(path)
+    assert AppleDoubleMetadata(str(path)).color == Colors.Red
+    assert read_finder_color(str(path)) == Colors.Red
+
+    plain = write_sample(tmp_path, "b.jpg", color=None, data=b"\xff\xd8" * 100)
+    assert find_appledouble(plain) is None
+    with open(plain, "rb") as f, pytest.raises(NotAppleSingle):
+        read_finder_flags_fd(f.fileno(), plain, container=True)
+
+
+def test_fast_path_skips_resource_fork(tmp_path, monkeypatch):
+    path = write_sample(tmp_path, "a.jpg", color=6, fork_size=1 << 20)
+    calls = []
+    real_pread = __import__("os").pread
+    monkeypatch.setattr("samba_labels.processor.os.pread",
+                        lambda fd, n, ofs: calls.append((n, ofs)) or real_pread(fd, n, ofs))
+    assert read_finder_color(path) == Colors.Red
+    assert sum(n for n, _ in calls) <= 128
+
+
+def test_fast_path_large_entry_table(tmp_path):
+    # finder_info listed after many other entries, and placed beyond the prefetch window
+    n = 20
+    header = b"\x00\x05\x16\x07" + struct.pack(">I", 0x00020000) + bytes(16) + struct.pack(">H", n)
+    body_ofs = 26 + 12 * n + 1000
+    table = b"".join(struct.pack(">III", 4, body_ofs, 0) for _ in range(n - 1))
+    table += struct.pack(">III", 9, body_ofs, 32)
+    ad = tmp_path / "._x"
+    ad.write_bytes(header + table + bytes(1000) + b"TEXTttxt" + struct.pack(">H", 0b1010) + bytes(22))
+    assert read_finder_flags(str(ad)) == 0b1010
+
+
+def test_fast_path_truncated(tmp_path):
+    ad = tmp_path / "._x"
+    ad.write_bytes(appledouble_bytes(3)[:40])
+    with pytest.raises(ValueError):
+        read_finder_flags(str(ad))
+
+
+def test_entries_decoded_lazily(tmp_path):
+    path = write_sample(tmp_path, "a.jpg", color=4, fork_size=4096)
+    md = AppleDoubleMetadata(path)
+    finfo = md.entries[AppleDoubleMetadata.Entry.Types.finder_info]["obj"]
+    rsrc = md.entries[AppleDoubleMetadata.Entry.Types.resource_fork]
+    assert not finfo._decoded and not rsrc["obj"]._decoded
+    assert md.color == Colors.Blue
+    assert finfo._decoded and not rsrc["obj"]._decoded
+    assert finfo.file_type == b"JPEG" and finfo.file_creator == b"8BIM"
+    # entry bodies are views of the one file buffer, not copies
+    assert rsrc["obj"]._data.obj is md.buffer.obj
+    assert (rsrc["offset"], rsrc["length"]) == (82, 4096)
+
+
+def test_entry_past_end_of_file(tmp_path):
+    path = write_sample(tmp_path, "a.jpg", color=4, fork_size=100)
+    ad = tmp_path / "._a.jpg"
+    ad.write_bytes(ad.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        AppleDoubleMetadata(path)
+
+
+def test_records_match_and_are_compact(tmp_path):
+    path = write_sample(tmp_path, "a.jpg", color=2, fork_size=10)
+    md = AppleDoubleMetadata(path)
+    rec = read_record(path)
+    assert rec == md.record()
+    assert rec.color == Colors.Green
+    assert rec.entries == ((9, 50, 32), (2, 82, 10))
+    assert not hasattr(md.entries[9]["obj"], "__dict__")
+    assert md.entries[9]["obj"].fields()["file_type"] == b"JPEG"
+
+
+def test_from_bytes():
+    md = AppleDoubleMetadata.from_bytes(appledouble_bytes(7), filepath="x")
+    assert md.color == Colors.Orange
+    assert md.record().filepath == "x"
+
+
+def test_user_tags(tmp_path, capsys):
+    tags = user_tags_value([("Red", 6), ("Blue", 4), ("Project X", 0)])
+    path = write_sample(tmp_path, "a.jpg", color=6, fork_size=5000,
+                        attrs=[("com.apple.quarantine", b"0083;5f0c;Safari;"), (USER_TAGS, tags)])
+    ad = str(tmp_path / "._a.jpg")
+    expected = [UserTag("Red", 6), UserTag("Blue", 4), UserTag("Project X", 0)]
+    assert read_user_tags(ad) == expected
+    assert read_finder_flags(ad) >> 1 & 0b111 == 6      # flags still found in front of the ATTR block
+
+    md = AppleDoubleMetadata(path)
+    assert md.color == Colors.Red
+    assert [a.name for a in md.attrs] == ["com.apple.quarantine", USER_TAGS]
+    assert md.user_tags == expected
+    md.dump()
+    assert "Finder Tags: Red (6), Blue (4), Project X" in capsys.readouterr().out
+
+    plain = write_sample(tmp_path, "b.jpg", color=2)
+    assert read_user_tags(str(tmp_path / "._b.jpg")) is None
+    assert AppleDoubleMetadata(plain).attrs == [] and AppleDoubleMetadata(plain).user_tags is None
@@ -0,0 +1,56 @@
+"""Tests for samba_labels.scanner."""
+
+import os
+
+from samba_labels.scanner import DirectoryIndex, ScanItem, scan_tree
+from tests.samples import write_sample
+
+
+def test_directory_index_pairs_sidecars():
+    index = DirectoryIndex("/d", [
+        "a.jpg", "._a.jpg", "a.jpg.xmp",
+        "b.jpg", "%b.jpg",
+        "c.jpg", "R.c.jpg", "%c.jpg",
+        "R.notes.txt",          # no "notes.txt": an ordinary file
+        "._gone.jpg",           # orphaned AppleDouble file
+        "lonely.xmp",
+    ])
+    assert index.datafiles == ["R.notes.txt", "a.jpg", "b.jpg", "c.jpg"]
+    assert index.item("a.jpg") == ScanItem("/d/a.jpg", "/d/._a.jpg", "/d/a.jpg.xmp")
+    assert index.item("b.jpg").appledoublepath == "/d/%b.jpg"
+    assert index.item("c.jpg").appledoublepath == "/d/%c.jpg"  # "%" preferred over "R."
+    assert index.item("R.notes.txt") == ScanItem("/d/R.notes.txt", None, None)
+    assert index.orphans == ["._gone.jpg"]
+
+
+def test_scan_tree_depth_first_with_extension_filter(tmp_path):
+    write_sample(tmp_path, "z.jpg", color=1)
+    write_sample(tmp_path, "y.mov", color=None)
+    (tmp_path / "sub" / "deeper").mkdir(parents=True)
+    write_sample(tmp_path / "sub", "x.JPG", color=2)
+    write_sample(tmp_path / "sub" / "deeper", "w.jpg", color=3)
+    (tmp_path / "sub" / "deeper" / "w.jpg.xmp").write_text("<x/>")
+
+    items = list(scan_tree(str(tmp_path), extensions=["jpg"]))
+    assert [os.path.relpath(i.filepath, tmp_path) for i in items] == \
+        ["z.jpg", os.path.join("sub", "x.JPG"), os.path.join("sub", "deeper", "w.jpg")]
+    assert all(i.appledoublepath for i in items)
+    assert [bool(i.xmppath) for i in items] == [False, False, True]
+
+
+def test_netatalk_and_applesingle_candidates(tmp_path):
+    write_sample(tmp_path, "a.jpg", color=None)
+    write_sample(tmp_path, "b.jpg", color=None)
+    write_sample(tmp_path, "c.jpg", color=1)
+    (tmp_path / ".AppleDouble").mkdir()
+    (tmp_path / ".AppleDouble" / "a.jpg").write_bytes(b"")
+    (tmp_path / ".AppleDouble" / ".Parent").write_bytes(b"")
+
+    items = {os.path.basename(i.filepath): i for i in scan_tree(str(tmp_path))}
+    assert set(items) == {"a.jpg", "b.jpg", "c.jpg"}   # .AppleDouble is not walked
+    assert items["a.jpg"].appledoublepath == str(tmp_path / ".AppleDouble" / "a.jpg")
+    assert items["b.jpg"].appledoublepath is None
+
+    items = {os.path.basename(i.filepath): i for i in scan_tree(str(tmp_path), applesingle=True)}
+    assert items["b.jpg"].is_container
+    assert not items["a.jpg"].is_container and not items["c.jpg"].is_container
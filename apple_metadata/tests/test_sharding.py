@@ -0,0 +1,108 @@
+"""Tests for samba_labels.sharding and merging sharded batch results."""
+
+import json
+import os
+
+import pytest
+
+from samba_labels.aio import run_async
+from samba_labels.batch import BatchSummary, run_batch
+from samba_labels.cli import batch, merge
+from samba_labels.metrics import Metrics
+from samba_labels.scanner import scan_tree
+from samba_labels.sharding import Shard, parse_shard, shard_items, shard_of
+from tests.samples import write_sample
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "share"
+    for d in ("", "2003", "2004/raw"):
+        (root / d).mkdir(parents=True, exist_ok=True)
+        for i in range(10):
+            write_sample(root / d, f"img{i}.jpg", color=(None if i == 9 else i % 8))
+    return root
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == Shard(2, 4)
+    assert str(Shard(2, 4)) == "2/4"
+    for bad in ("0/4", "5/4", "1/0", "x/4", "1"):
+        with pytest.raises(ValueError):
+            parse_shard(bad)
+
+
+def test_shard_of_is_stable():
+    # Fixed values: nodes (and nights) must agree, whatever the Python version or hash seed
+    assert [shard_of(p, 4) for p in ("a.jpg", "sub/b.jpg", "2003/IMG_0001.JPG")] == [2, 3, 4]
+
+
+def test_shards_partition_the_tree(tree, tmp_path):
+    everything = sorted(os.path.relpath(i.filepath, tree) for i in scan_tree(str(tree)))
+    owned = []
+    for i in (1, 2, 3):
+        owned += [os.path.relpath(it.filepath, tree) for it in shard_items(scan_tree(str(tree)), str(tree), Shard(i, 3))]
+    assert sorted(owned) == everything
+
+    # Another mount point of the same share gives the same split
+    link = tmp_path / "mnt"
+    link.symlink_to(tree)
+    mine = [os.path.relpath(it.filepath, tree) for it in shard_items(scan_tree(str(tree)), str(tree), Shard(1, 3))]
+    theirs = [os.path.relpath(it.filepath, link) for it in shard_items(scan_tree(str(link)), str(link), Shard(1, 3))]
+    assert mine == theirs
+
+
+def test_sharded_runs_add_up(tree):
+    full = run_batch(str(tree), jobs=2)
+    parts = [run_batch(str(tree), jobs=2, shard=Shard(i, 3)) for i in (1, 2, 3)]
+    assert [p.shard for p in parts] == ["1/3", "2/3", "3/3"]
+    assert sum(p.total for p in parts) == full.total
+    merged = BatchSummary()
+    for p in parts:
+        merged.merge(BatchSummary.from_dict(json.loads(json.dumps(p.to_dict()))))
+    assert merged.counts == full.counts
+    assert merged.colors == full.colors
+    assert merged.metrics.counters["preads"] == full.metrics.counters["preads"]
+
+    assert run_async(str(tree), concurrency=4, shard=Shard(2, 3)).counts == parts[1].counts
+
+
+def test_metrics_round_trip():
+    m = Metrics()
+    m.add_time("read", 0.25)
+    m.count("preads", 3)
+    for v in (0, 5, 700):
+        m.observe("latency", v)
+    assert Metrics.from_dict(m.to_dict()).to_dict() == m.to_dict()
+
+
+def test_merge_command(tree, tmp_path, capsys):
+    paths = []
+    for i in (1, 2, 3):
+        paths.append(str(tmp_path / f"shard{i}.json"))
+        assert batch(["batch", str(tree), "--shard", f"{i}/3", "--json", paths[-1], "-j", "2"]) == 0
+    capsys.readouterr()
+
+    out = str(tmp_path / "merged.json")
+    assert merge(["merge"] + paths + ["--json", out]) == 0
+    assert "Merged 3 of 3 shards" in capsys.readouterr().out
+    with open(out) as f:
+        assert json.load(f)["total"] == 30
+
+    assert merge(["merge"] + paths + ["--json", "-"]) == 0
+    captured = capsys.readouterr()
+    assert json.loads(captured.out)["total"] == 30
+    assert "Merged 3 of 3 shards" in captured.err
+
+    assert merge(["merge"] + paths[:2]) == 1
+    assert "Missing shards: 3/3" in capsys.readouterr().err
+
+    partial = str(tmp_path / "partial.json")
+    assert merge(["merge"] + paths[:2] + ["--json", partial, "--allow-missing"]) == 0
+    capsys.readouterr()
+    assert merge(["merge", partial, paths[2], "--json", "-"]) == 0
+    captured = capsys.readouterr()
+    assert json.loads(captured.out)["merged_shards"] == ["1/3", "2/3", "3/3"]
+    assert "Merged 3 of 3 shards" in captured.err
+    assert merge(["merge", partial, paths[1]]) == 2     # shard 2 twice
+    assert merge(["merge", paths[0], paths[0]]) == 2
@@ -0,0 +1,132 @@
+"""Tests for samba_labels.watch."""
+
+import os
+import threading
+import time
+
+import pytest
+
+from samba_labels.watch import (Debouncer, InotifyWatcher, PollingWatcher, datafile_for_sidecar,
+                                is_sidecar_path, items_for_sidecars, watch)
+from tests.samples import write_sample
+
+
+def test_sidecar_names():
+    assert datafile_for_sidecar("/d/._a.jpg") == ("/d", "a.jpg")
+    assert datafile_for_sidecar("/d/.AppleDouble/a.jpg") == ("/d", "a.jpg")
+    assert datafile_for_sidecar("/d/a.jpg") is None
+    assert is_sidecar_path("/d/R.a.jpg")
+    assert not is_sidecar_path("/d/a.jpg.xmp")
+
+
+def test_debouncer():
+    d = Debouncer(1.0)
+    d.add(["a", "b"], now=10.0)
+    d.add(["a"], now=10.5)          # still being written
+    assert d.next_due() == 11.0
+    assert d.ready(11.0) == ["b"]
+    assert d.ready(11.4) == []
+    assert d.ready(11.5) == ["a"]
+    assert d.next_due() is None
+
+
+def test_items_for_sidecars(tmp_path):
+    write_sample(tmp_path, "a.jpg", color=2)
+    (tmp_path / "a.jpg.xmp").write_text("")
+    (tmp_path / "%notes").write_text("not a sidecar")
+    items = list(items_for_sidecars([str(tmp_path / "._a.jpg"), str(tmp_path / "%notes")]))
+    assert [(os.path.basename(i.filepath), os.path.basename(i.xmppath)) for i in items] == [("a.jpg", "a.jpg.xmp")]
+
+
+def test_polling_watcher(tmp_path):
+    write_sample(tmp_path, "a.jpg", color=2)
+    watcher = PollingWatcher(str(tmp_path), interval=0)
+    assert watcher.poll(0) == (set(), False)
+    (tmp_path / "sub").mkdir()
+    write_sample(tmp_path / "sub", "b.jpg", color=3)
+    changed, overflow = watcher.poll(0)
+    assert changed == {str(tmp_path / "sub" / "._b.jpg")}
+    assert not overflow
+
+
+def _inotify(root):
+    try:
+        return InotifyWatcher(str(root))
+    except OSError as e:
+        pytest.skip(f"inotify unavailable: {e}")
+
+
+def test_inotify_watcher(tmp_path):
+    (tmp_path / "sub").mkdir()
+    watcher = _inotify(tmp_path)
+    try:
+        write_sample(tmp_path / "sub", "a.jpg", color=2)
+        (tmp_path / "new").mkdir()
+        write_sample(tmp_path / "new", "b.jpg", color=2)
+        changed = set()
+        deadline = time.monotonic() + 5
+        while len(changed) < 2 and time.monotonic() < deadline:
+            changed |= watcher.poll(0.1)[0]
+        assert changed == {str(tmp_path / "sub" / "._a.jpg"), str(tmp_path / "new" / "._b.jpg")}
+    finally:
+        watcher.close()
+
+
+@pytest.mark.parametrize("polling", [True, False])
+def test_watch_processes_changed_files(tmp_path, polling):
+    if not polling:
+        _inotify(tmp_path).close()
+    write_sample(tmp_path, "a.jpg", color=2)
+    write_sample(tmp_path, "b.jpg", color=2)
+    results = []
+    stop = threading.Event()
+
+    def on_result(result):
+        results.append(result)
+        stop.set()
+
+    t = threading.Thread(target=lambda: results.append(
+        watch(str(tmp_path), "color", jobs=2, debounce=0.05, polling=polling, interval=0.05,
+              stop=stop, on_result=on_result)))
+    t.start()
+    time.sleep(0.3)
+    write_sample(tmp_path, "a.jpg", color=6)
+    t.join(10)
+    stop.set()
+    assert not t.is_alive()
+    result, summary = results
+    assert (os.path.basename(result.path), result.status, result.detail) == ("a.jpg", "labeled", "Red")
+    assert summary.total == 1
+
+
+def test_overflow_rescans_once_after_debounce(tmp_path, monkeypatch):
+    from samba_labels import watch as watch_module
+    write_sample(tmp_path, "a.jpg", color=2)
+    write_sample(tmp_path, "b.jpg", color=4)
+    polls = []
+
+    class Overflowing:
+        """ Reports a change and lost events on its first three polls, then nothing """
+        def poll(self, timeout):
+            polls.append(time.monotonic())
+            time.sleep(min(timeout, 0.01))
+            if len(polls) <= 3:
+                return {str(tmp_path / "._a.jpg")}, True
+            return set(), False
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(watch_module, "make_watcher", lambda *args: Overflowing())
+    stop = threading.Event()
+    results = []
+
+    def on_result(result):
+        results.append((time.monotonic(), os.path.basename(result.path)))
+        if len(results) == 2:
+            stop.set()
+
+    summary = watch(str(tmp_path), "color", jobs=1, debounce=0.2, stop=stop, on_result=on_result)
+    assert sorted(name for _, name in results) == ["a.jpg", "b.jpg"]   # a.jpg only once
+    assert summary.total == 2
+    assert results[0][0] - polls[2] >= 0.2      # quiet for debounce after the last overflow
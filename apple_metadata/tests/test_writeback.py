@@ -0,0 +1,82 @@
+"""Tests for samba_labels.writeback."""
+
+import os
+
+import pytest
+
+from samba_labels import parser
+from samba_labels.processor import read_finder_color, read_finder_flags
+from samba_labels.utility import FinderColors
+from samba_labels.writeback import (finder_color_for_digikam, minimal_appledouble, set_flags_color,
+                                    write_finder_color, writeback_tree)
+from samba_labels.xmp_sidecar import write_color_label
+from tests.samples import write_sample
+
+
+def test_color_mapping():
+    assert finder_color_for_digikam(6) == FinderColors.Purple     # Magenta
+    assert finder_color_for_digikam(1) == FinderColors.Red
+    assert finder_color_for_digikam(0) is None
+    with pytest.raises(KeyError):
+        finder_color_for_digikam(8)                                # Black
+    assert set_flags_color(0xC00C, 2) == 0xC004
+
+
+def test_minimal_appledouble():
+    f = parser.parse(minimal_appledouble(4))
+    assert f.header.magic == b"\x00\x05\x16\x07"
+    assert [tuple(e) for e in f.entries] == [(9, 38, 32)]
+    assert f.finder_info.colorval == 4
+
+
+def test_patch_in_place_keeps_other_bytes(tmp_path):
+    path = write_sample(tmp_path, "a.jpg", color=2, fork_size=5000)
+    adpath = str(tmp_path / "._a.jpg")
+    before = open(adpath, "rb").read()
+    inode = os.stat(adpath).st_ino
+
+    assert write_finder_color(adpath, 6)
+    assert not write_finder_color(adpath, 6)
+    after = open(adpath, "rb").read()
+    assert read_finder_color(path) == FinderColors.Red
+    assert os.stat(adpath).st_ino == inode
+    assert len(after) == len(before)
+    assert [i for i in range(len(before)) if before[i] != after[i]] == [59]   # low byte of the flags
+
+
+def test_writeback_tree_from_xmp(tmp_path):
+    write_sample(tmp_path, "red.jpg", color=1)
+    write_color_label(str(tmp_path / "red.jpg.xmp"), 1)          # digiKam Red
+    write_sample(tmp_path, "new.jpg", color=None)
+    write_color_label(str(tmp_path / "new.jpg.xmp"), 5)          # digiKam Blue
+    write_sample(tmp_path, "cleared.jpg", color=3)
+    write_color_label(str(tmp_path / "cleared.jpg.xmp"), 0)
+    write_sample(tmp_path, "black.jpg", color=3)
+    write_color_label(str(tmp_path / "black.jpg.xmp"), 8)
+    write_sample(tmp_path, "untouched.jpg", color=3)
+
+    summary = writeback_tree(str(tmp_path), "xmp", jobs=2)
+    assert summary.counts == {"patched": 2, "created": 1, "unchanged": 0, "no_source": 1,
+                              "unmappable": 1, "error": 0}
+    assert read_finder_color(str(tmp_path / "red.jpg")) == FinderColors.Red
+    assert read_finder_color(str(tmp_path / "new.jpg")) == FinderColors.Blue
+    assert read_finder_flags(str(tmp_path / "._cleared.jpg")) == 0
+    assert read_finder_color(str(tmp_path / "untouched.jpg")) == FinderColors.Purple
+
+    again = writeback_tree(str(tmp_path), "xmp")
+    assert again.counts["patched"] == again.counts["created"] == 0
+
+
+def test_writeback_tree_from_xattr(tmp_path):
+    import xattr
+    path = write_sample(tmp_path, "a.jpg", color=0)
+    try:
+        xattr.setxattr(path, "user.color", b"Green")
+    except OSError:
+        pytest.skip("filesystem does not support user xattrs")
+    xattr.setxattr(write_sample(tmp_path, "b.jpg", color=0), "user.color", b"Teal")
+
+    summary = writeback_tree(str(tmp_path), "xattr", jobs=2)
+    assert summary.counts["patched"] == 1
+    assert summary.counts["unmappable"] == 1
+    assert read_finder_color(path) == FinderColors.Green
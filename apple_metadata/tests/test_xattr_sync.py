@@ -0,0 +1,60 @@
+"""Tests for samba_labels.xattr_sync."""
+
+import os
+
+import pytest
+import xattr
+
+from samba_labels.scanner import scan_tree
+from samba_labels.xattr_sync import XATTR_NAME, read_color_xattr, sync_file, sync_tree
+from tests.samples import write_sample
+
+
+@pytest.fixture
+def tree(tmp_path):
+    probe = tmp_path / "probe"
+    probe.write_bytes(b"")
+    try:
+        xattr.setxattr(str(probe), "user.test", b"1")
+    except OSError:
+        pytest.skip("filesystem does not support user xattrs")
+    probe.unlink()
+
+    write_sample(tmp_path, "red.jpg", color=6)
+    write_sample(tmp_path, "plain.jpg", color=0)
+    write_sample(tmp_path, "bare.mov", color=None)
+    return tmp_path
+
+
+def test_sync_writes_then_skips(tree):
+    first = sync_tree(str(tree), jobs=2)
+    assert first.counts["written"] == 1
+    assert first.counts["clean"] == 1
+    assert first.counts["no_appledouble"] == 1
+    assert read_color_xattr(str(tree / "red.jpg")) == b"Red"
+
+    second = sync_tree(str(tree), jobs=2)
+    assert second.writes == 0
+    assert second.counts["unchanged"] == 1
+
+
+def test_sync_fixes_and_removes_stale_values(tree):
+    xattr.setxattr(str(tree / "red.jpg"), XATTR_NAME, b"Blue")
+    xattr.setxattr(str(tree / "plain.jpg"), XATTR_NAME, b"Green")
+    xattr.setxattr(str(tree / "bare.mov"), XATTR_NAME, b"Gray")   # no ._ file: left alone
+    summary = sync_tree(str(tree))
+    assert summary.counts["written"] == 1
+    assert summary.counts["removed"] == 1
+    assert read_color_xattr(str(tree / "red.jpg")) == b"Red"
+    assert read_color_xattr(str(tree / "plain.jpg")) is None
+    assert read_color_xattr(str(tree / "bare.mov")) == b"Gray"
+
+
+def test_sync_tells_vanished_files_apart(tree):
+    items = {os.path.basename(i.filepath): i for i in scan_tree(str(tree))}
+    os.unlink(items["red.jpg"].appledoublepath)
+    assert sync_file(items["red.jpg"]).outcome == "no_appledouble"
+    os.unlink(items["plain.jpg"].filepath)     # the "._" file is still there
+    result = sync_file(items["plain.jpg"])
+    assert result.outcome == "error"
+    assert "FileNotFoundError" in result.detail
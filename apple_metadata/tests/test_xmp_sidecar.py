@@ -0,0 +1,98 @@
+"""Tests for the in-process XMP ColorLabel writer."""
+
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from samba_labels.xmp_sidecar import read_color_label, write_color_label, XmpUnsupported
+
+DK = "{http://www.digikam.org/ns/1.0/}ColorLabel"
+RDF_DESC = "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}Description"
+
+EXIFTOOL_STYLE = """<?xpacket begin='﻿' id='W5M0MpCehiHzreSzNTczkc9d'?>
+<x:xmpmeta xmlns:x='adobe:ns:meta/' x:xmptk='Image::ExifTool 12.70'>
+<rdf:RDF xmlns:rdf='http://www.w3.org/1999/02/22-rdf-syntax-ns#'>
+
+ <rdf:Description rdf:about=''
+  xmlns:tiff='http://ns.adobe.com/tiff/1.0/'>
+  <tiff:Make>Minolta</tiff:Make>
+ </rdf:Description>
+</rdf:RDF>
+</x:xmpmeta>
+<?xpacket end='w'?>
+"""
+
+
+def labels(path):
+    """Every ColorLabel in the file, whichever form it was written in."""
+    root = ET.parse(path).getroot()
+    found = [e.text for e in root.iter(DK)]
+    found += [d.attrib[DK] for d in root.iter(RDF_DESC) if DK in d.attrib]
+    return found
+
+
+def test_creates_minimal_sidecar(tmp_path):
+    md = tmp_path / "a.jpg.xmp"
+    assert write_color_label(str(md), 5)
+    assert labels(md) == ["5"]
+    assert read_color_label(str(md)) == 5
+    umask = os.umask(0)
+    os.umask(umask)
+    assert oct(md.stat().st_mode & 0o777) == oct(0o666 & ~umask)
+
+
+def test_keeps_permissions_of_existing_sidecar(tmp_path):
+    md = tmp_path / "a.jpg.xmp"
+    write_color_label(str(md), 5)
+    md.chmod(0o640)
+    assert write_color_label(str(md), 2)
+    assert md.stat().st_mode & 0o777 == 0o640
+    assert [p.name for p in tmp_path.iterdir()] == ["a.jpg.xmp"]     # no temporary file left
+
+
+def test_update_element_form_is_surgical(tmp_path):
+    md = tmp_path / "a.jpg.xmp"
+    write_color_label(str(md), 5)
+    before = md.read_bytes()
+    assert write_color_label(str(md), 1)
+    after = md.read_bytes()
+    assert after == before.replace(b">5<", b">1<")
+    assert not write_color_label(str(md), 1)  # unchanged, nothing written
+
+
+def test_adds_label_to_existing_sidecar(tmp_path):
+    md = tmp_path / "a.jpg.xmp"
+    md.write_text(EXIFTOOL_STYLE, encoding="utf-8")
+    assert read_color_label(str(md)) is None
+    assert write_color_label(str(md), 3)
+    assert labels(md) == ["3"]
+    assert b"<tiff:Make>Minolta</tiff:Make>" in md.read_bytes()
+    # then update the attribute form it just wrote
+    assert write_color_label(str(md), 6)
+    assert labels(md) == ["6"]
+    assert read_color_label(str(md)) == 6
+
+
+def test_other_prefix_for_digikam_namespace(tmp_path):
+    md = tmp_path / "a.jpg.xmp"
+    md.write_text(EXIFTOOL_STYLE.replace(
+        "xmlns:tiff='http://ns.adobe.com/tiff/1.0/'",
+        "xmlns:tiff='http://ns.adobe.com/tiff/1.0/' xmlns:dk='http://www.digikam.org/ns/1.0/' dk:ColorLabel='2'"))
+    assert read_color_label(str(md)) == 2
+    assert write_color_label(str(md), 4)
+    assert labels(md) == ["4"]
+
+
+@pytest.mark.parametrize("content", [
+    b"not xml at all",
+    "<?xml version='1.0' encoding='UTF-16'?><x/>".encode("utf-16"),
+    b"<x:xmpmeta xmlns:x='adobe:ns:meta/'/>",
+])
+def test_unsupported_files_are_left_alone(tmp_path, content):
+    md = tmp_path / "a.jpg.xmp"
+    md.write_bytes(content)
+    with pytest.raises(XmpUnsupported):
+        write_color_label(str(md), 1)
+    assert md.read_bytes() == content
+    assert os.listdir(tmp_path) == ["a.jpg.xmp"]
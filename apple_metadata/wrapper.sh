@@ -5,9 +5,7 @@
 #    cd /path/to/macos/files
 #    ./wrapper.sh
 
-N=12  # Spawn 12 simultaneous instances of the program (and its subshells!)
-(
-for f in *.{jpg,m4v,bmp,mp4,mkv,mov,png,avi,mrw,jpeg}; do 
-    set_color_sidecar "$f" &  
-done
-) && echo "Wrapper script complete"
+N=12  # Number of worker processes to keep busy
+batch . --action sidecar --jobs "$N" \
+    --ext jpg,m4v,bmp,mp4,mkv,mov,png,avi,mrw,jpeg \
+    && echo "Wrapper script complete"